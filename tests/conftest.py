@@ -0,0 +1,44 @@
+""" pytest hooks shared by the end to end tests """
+from tests.helpers import (CONVERGENCE, CONTROLLER_RESTARTS, SWITCH_RECONNECTS,
+                           FAILOVERS, MAINTENANCE_WINDOWS, KYTOS, LOGS, NETWORKS,
+                           RESOURCES, save_results)
+
+
+def pytest_sessionstart(session):
+    # only what is logged during this session is of interest
+    LOGS.start()
+    RESOURCES.start()
+
+
+def pytest_collection_modifyitems(session, config, items):
+    # run the tests grouped by topology, so that each shared network is
+    # built only once; the order inside each group is kept
+    topologies = []
+    for item in items:
+        topo_name = getattr(item.cls, 'topo_name', None)
+        if topo_name not in topologies:
+            topologies.append(topo_name)
+    items.sort(key=lambda item: topologies.index(getattr(item.cls, 'topo_name', None)))
+
+
+def pytest_runtest_setup(item):
+    # errors are attributed to the test running when they are read
+    LOGS.begin(item.nodeid)
+    RESOURCES.begin(item.nodeid)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    NETWORKS.stop()
+    RESOURCES.stop()
+    # how long each awaited condition took is useful data on its own
+    CONVERGENCE.save()
+    save_results('controller_restarts', CONTROLLER_RESTARTS)
+    save_results('switch_reconnects', SWITCH_RECONNECTS)
+    save_results('api_latency', KYTOS.export())
+    LOGS.scan()
+    save_results('kytos_log', LOGS.summary())
+    save_results('kytosd_resources', RESOURCES.report())
+    if FAILOVERS:
+        save_results('failover', FAILOVERS)
+    if MAINTENANCE_WINDOWS:
+        save_results('maintenance', MAINTENANCE_WINDOWS)
@@ -3,11 +3,1478 @@ from mininet.topo import Topo
 from mininet.node import RemoteController, OVSSwitch
 import mininet.clean
 from mock import patch
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from tests.histogram import Histogram
+from tests.ofswitch import SwitchFleet, FleetWatcher, lldp_flow
+import configparser
+import random
+import requests
+import subprocess
+import socket
+import sys
+import threading
+import tempfile
 import time
+import json
 import os
+import re
 import signal
 
-class RingTopo( Topo ):
+
+
+def _shard_index():
+    """Index of this shard: E2E_SHARD or the pytest-xdist worker number."""
+    shard = os.environ.get('E2E_SHARD')
+    if shard is None:
+        shard = os.environ.get('PYTEST_XDIST_WORKER', 'gw0')[2:]
+    return int(shard)
+
+
+# Several shards can run on the same host (e.g. with pytest -n N): each one
+# gets its own kytosd ports, pidfile and storehouse and its own OVS bridge
+# and host names, so that they do not interfere with each other.
+SHARD = _shard_index()
+SHARDED = 'E2E_SHARD' in os.environ or 'PYTEST_XDIST_WORKER' in os.environ
+
+CONTROLLER = os.environ.get('E2E_CONTROLLER', '127.0.0.1')
+API_PORT = 8181 + SHARD
+OPENFLOW_PORT = 6653 + SHARD
+KYTOS_API = 'http://%s:%d/api/kytos' % (CONTROLLER, API_PORT)
+
+KYTOS_CONF = '/etc/kytos/kytos.conf'
+if SHARDED:
+    SHARD_DIR = '/var/tmp/kytos-e2e-shard%d' % (SHARD)
+    # short, as interface names (e12h1000_1-eth0) are limited to 15 chars
+    NODE_PREFIX = 'e%d' % (SHARD)
+    KYTOS_PIDFILE = os.path.join(SHARD_DIR, 'kytosd.pid')
+    # bind mounted over /var/tmp/kytos in the mount namespace of kytosd
+    KYTOS_TMP = os.path.join(SHARD_DIR, 'kytos')
+else:
+    SHARD_DIR = None
+    NODE_PREFIX = ''
+    KYTOS_PIDFILE = '/var/run/kytos/kytosd.pid'
+    KYTOS_TMP = '/var/tmp/kytos'
+# TODO: config is defined at NAPPS_DIR/kytos/storehouse/settings.py
+# and NAPPS_DIR is defined at /etc/kytos/kytos.conf
+STOREHOUSE_DIR = os.path.join(KYTOS_TMP, 'storehouse')
+
+# napps that must be enabled before kytosd is considered ready
+EXPECTED_NAPPS = [
+    ("kytos", "pathfinder"),
+    ("kytos", "mef_eline"),
+    ("kytos", "maintenance"),
+    ("kytos", "storehouse"),
+    ("kytos", "flow_manager"),
+    ("kytos", "of_core"),
+    ("kytos", "topology"),
+    ("kytos", "of_lldp")
+]
+
+# directory where timings and other measurements of the run are written
+RESULTS_DIR = os.environ.get('E2E_RESULTS_DIR', '/var/tmp/kytos-e2e')
+
+
+def save_results(name, data):
+    """Write `data` as JSON to RESULTS_DIR/name.json and return the path."""
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    if SHARDED:
+        name += '-shard%d' % (SHARD)
+    path = os.path.join(RESULTS_DIR, '%s.json' % name)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    return path
+
+
+# the benchmarks are long, they only run when asked for
+BENCHMARK = bool(os.environ.get('E2E_BENCHMARK'))
+
+
+def env_list(name, default):
+    """Integers of the comma separated environment variable `name`."""
+    return [int(value) for value in os.environ.get(name, default).split(',')
+            if value.strip()]
+
+
+def percentiles(values, points=(50, 90, 99)):
+    """Nearest-rank percentiles of `values`, as {'p50': ..., 'max': ...}."""
+    values = sorted(values)
+    if not values:
+        return {}
+    result = {'p%s' % (point): values[min(len(values) - 1,
+                                          int(len(values) * point / 100.0))]
+              for point in points}
+    result.update({'min': values[0], 'max': values[-1],
+                   'mean': sum(values) / len(values), 'count': len(values)})
+    return result
+
+
+def process_stats(pid):
+    """Resident memory (bytes) and CPU time (seconds) used by process `pid`."""
+    with open('/proc/%d/stat' % (pid)) as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    ticks = os.sysconf('SC_CLK_TCK')
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    # utime and stime are the 14th and 15th fields, rss is the 24th
+    return {'rss': int(fields[21]) * page_size,
+            'cpu': (int(fields[11]) + int(fields[12])) / float(ticks)}
+
+
+class WaitTimeout(Exception):
+    """A condition did not become true before its deadline."""
+
+
+class ConvergenceLog():
+    """Record of how long each awaited condition took to become true."""
+
+    def __init__(self):
+        self.records = []
+
+    def add(self, name, elapsed, polls, converged):
+        self.records.append({
+            'name': name,
+            'elapsed': elapsed,
+            'polls': polls,
+            'converged': converged,
+            'timestamp': time.time(),
+        })
+
+    def summary(self):
+        """Aggregate the convergence times of each condition name."""
+        elapsed = {}
+        for record in self.records:
+            if record['converged']:
+                elapsed.setdefault(record['name'], []).append(record['elapsed'])
+        return {name: {'count': len(values),
+                       'min': min(values),
+                       'max': max(values),
+                       'mean': sum(values) / len(values)}
+                for name, values in elapsed.items()}
+
+    def save(self, name='convergence'):
+        return save_results(name, {'records': self.records,
+                                   'summary': self.summary()})
+
+
+CONVERGENCE = ConvergenceLog()
+
+# how long each kytosd restart took, phase by phase
+CONTROLLER_RESTARTS = []
+
+# how long each switch took to reconnect after a controller (re)start
+SWITCH_RECONNECTS = []
+
+# loss and outage measured by each FailoverProbe
+FAILOVERS = []
+
+# scheduling accuracy and migration latency of the maintenance windows
+MAINTENANCE_WINDOWS = []
+
+
+def wait_until(condition, timeout=60, name=None, interval=0.05,
+               max_interval=2, backoff=1.5, log=CONVERGENCE):
+    """Poll `condition` until it returns a truthy value and return it.
+
+    The polling interval starts at `interval` and grows by `backoff` up to
+    `max_interval`, so fast conditions are noticed right away and slow ones
+    do not hammer the controller. The time the condition took is recorded
+    in `log`. Raises WaitTimeout once `timeout` seconds have passed.
+    """
+    name = name or getattr(condition, '__name__', 'condition')
+    start = time.monotonic()
+    deadline = start + timeout
+    polls = 0
+    error = None
+    while True:
+        polls += 1
+        try:
+            result = condition()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            # the controller may be restarting or answering garbage
+            result, error = None, e
+        now = time.monotonic()
+        if result:
+            log.add(name, now - start, polls, True)
+            return result
+        if now >= deadline:
+            log.add(name, now - start, polls, False)
+            raise WaitTimeout('Timeout: %s not met after %.1fs (last error: %s)'
+                              % (name, now - start, error))
+        time.sleep(min(interval, deadline - now))
+        interval = min(interval * backoff, max_interval)
+
+
+# fields of a dump-flows entry that are statistics rather than part of it
+FLOW_STATS = frozenset(['duration', 'n_packets', 'n_bytes', 'idle_age', 'hard_age'])
+# fields of a dump-flows entry that are neither statistics nor match fields
+FLOW_OPTIONS = frozenset(['cookie', 'table', 'priority', 'idle_timeout',
+                          'hard_timeout', 'importance', 'send_flow_rem',
+                          'check_overlap', 'reset_counts', 'no_packet_counts',
+                          'no_byte_counts', 'out_port', 'out_group'])
+
+
+def flow_value(text):
+    """Normalize a dump-flows value: numbers as int, quotes removed."""
+    text = str(text).strip('"')
+    try:
+        return int(text, 0)
+    except ValueError:
+        return text
+
+
+def _split_actions(text):
+    """Split an actions list on the commas that are not inside (...)."""
+    if '(' not in text and '[' not in text:
+        return text.split(',')
+    actions, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            actions.append(text[start:i])
+            start = i + 1
+    actions.append(text[start:])
+    return actions
+
+
+class FlowEntry():
+    """One flow entry of a dump-flows output."""
+    __slots__ = ('fields', 'match', 'options', 'stats', 'actions')
+
+    def __init__(self, line):
+        head, _, actions = line.strip().partition(' actions=')
+        self.fields = []
+        self.match = {}
+        self.options = {}
+        self.stats = {}
+        for field in head.split(','):
+            field = field.strip()
+            if not field:
+                continue
+            name, _, value = field.partition('=')
+            if name in FLOW_STATS:
+                self.stats[name] = value
+                continue
+            self.fields.append(field)
+            if name in FLOW_OPTIONS:
+                self.options[name] = flow_value(value)
+            else:
+                self.match[name] = flow_value(value) if value else True
+        self.actions = _split_actions(actions) if actions else []
+
+    @property
+    def cookie(self):
+        return self.options.get('cookie', 0)
+
+    @property
+    def priority(self):
+        return self.options.get('priority', 32768)
+
+    def key(self):
+        """What identifies the entry regardless of its statistics."""
+        return (self.options.get('table', 0), self.priority,
+                frozenset(self.match.items()), tuple(self.actions))
+
+    def spec(self):
+        """The entry in the syntax of ovs-ofctl add-flow."""
+        return '%s actions=%s' % (','.join(self.fields), ','.join(self.actions))
+
+    def __repr__(self):
+        return 'FlowEntry(%r)' % (self.spec())
+
+
+class FlowTable():
+    """Flow entries of one switch, indexed by their match fields, cookie
+    and actions for fast queries.
+
+    flows = FlowTable.from_switch(s1)
+    len(flows.find(dl_vlan=101, in_port=1))
+    """
+
+    def __init__(self, entries, switch=None, timestamp=None):
+        self.entries = list(entries)
+        self.switch = switch
+        self.timestamp = timestamp
+        self._indexes = {}
+
+    @classmethod
+    def parse(cls, text, switch=None, timestamp=None):
+        """Parse the output of ovs-ofctl dump-flows."""
+        return cls((FlowEntry(line) for line in text.splitlines()
+                    if ' actions=' in line), switch, timestamp)
+
+    @classmethod
+    def from_switch(cls, switch):
+        timestamp = time.time()
+        return cls.parse(switch.dpctl('dump-flows'), switch.name, timestamp)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __str__(self):
+        return '\n'.join(entry.spec() for entry in self.entries)
+
+    def index(self, field):
+        """Entries by value of `field`: a match field, cookie or action."""
+        if field not in self._indexes:
+            index = {}
+            for entry in self.entries:
+                if field == 'action':
+                    values = entry.actions
+                elif field in FLOW_OPTIONS:
+                    values = [entry.options.get(field)]
+                else:
+                    values = [entry.match.get(field)]
+                for value in values:
+                    index.setdefault(value, []).append(entry)
+            self._indexes[field] = index
+        return self._indexes[field]
+
+    def find(self, **criteria):
+        """Entries whose fields have all the given values, e.g. dl_vlan=101
+        or action='output:2'. A None value selects entries without the field.
+        """
+        if not criteria:
+            return list(self.entries)
+        criteria = {field: value if value is None or field == 'action'
+                    else flow_value(value) for field, value in criteria.items()}
+        # start from the most selective index, then filter on the others
+        candidates = min((self.index(field).get(value, []) for field, value in criteria.items()),
+                         key=len)
+        return [entry for entry in candidates
+                if all(value in entry.actions if field == 'action'
+                       else (entry.options.get(field) if field in FLOW_OPTIONS
+                             else entry.match.get(field)) == value
+                       for field, value in criteria.items())]
+
+    def count(self, **criteria):
+        return len(self.find(**criteria))
+
+    def vlans(self):
+        """VLAN ids matched by the entries."""
+        return set(vlan for vlan in self.index('dl_vlan') if vlan is not None)
+
+    def diff(self, other):
+        """Entries (added, removed) from this table to `other`."""
+        mine = {entry.key(): entry for entry in self.entries}
+        theirs = {entry.key(): entry for entry in other.entries}
+        return ([entry for key, entry in theirs.items() if key not in mine],
+                [entry for key, entry in mine.items() if key not in theirs])
+
+
+class FlowSnapshot():
+    """Flow tables of several switches dumped at the same time.
+
+    Iterating gives the tables in the order the switches were asked for:
+    flows_s1, flows_s2 = collect_flows([s1, s2])
+    """
+
+    def __init__(self, tables, started, finished):
+        self.tables = tables
+        self.started = started
+        self.finished = finished
+
+    def __getitem__(self, name):
+        if name not in self.tables:
+            name = NODE_PREFIX + name
+        return self.tables[name]
+
+    def __iter__(self):
+        return iter(self.tables.values())
+
+    def __len__(self):
+        return len(self.tables)
+
+    def skew(self):
+        """Seconds between the first and the last dump of the snapshot."""
+        return self.finished - self.started
+
+    def diff(self, other):
+        """(added, removed) entries of each switch from this snapshot to `other`."""
+        return {name: table.diff(other.tables[name])
+                for name, table in self.tables.items() if name in other.tables}
+
+
+def _dump_flows(bridge):
+    output = subprocess.Popen(['ovs-ofctl', 'dump-flows', bridge],
+                              stdout=subprocess.PIPE,
+                              universal_newlines=True).communicate()[0]
+    return FlowTable.parse(output, bridge, time.time())
+
+
+def collect_flows(switches, max_parallel=64):
+    """Dump the flows of all the `switches` concurrently into a FlowSnapshot.
+
+    ovs-ofctl is run directly rather than through the Mininet shell of each
+    switch, which only runs one command at a time; the collection then
+    takes about as long as the slowest dump instead of the sum of them.
+    """
+    bridges = [sw if isinstance(sw, str) else sw.name for sw in switches]
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_parallel, len(bridges)))) as executor:
+        tables = list(executor.map(_dump_flows, bridges))
+    return FlowSnapshot(dict(zip(bridges, tables)), started, time.time())
+
+
+def flows_installed(switch, count=None, **criteria):
+    """Condition: `switch` has `count` flows and one matching `criteria`."""
+    def condition():
+        flows = FlowTable.from_switch(switch)
+        if count is not None and len(flows) != count:
+            return False
+        return not criteria or flows.find(**criteria)
+    condition.__name__ = 'flows on %s' % (switch.name)
+    return condition
+
+
+class FlowCountWatcher():
+    """Count the flows of `switches` every `interval` seconds in a thread.
+
+    Each change of a count is kept with the time it was seen, so the moment
+    flows leave or come back to a switch (e.g. when a maintenance window
+    starts or ends) is known within `interval`. Flows matching `ignore`
+    (LLDP when None, nothing when empty) are not counted.
+    """
+
+    def __init__(self, switches, interval=0.05, ignore=None):
+        self.bridges = [sw if isinstance(sw, str) else sw.name for sw in switches]
+        self.interval = interval
+        self.ignore = {'dl_type': 0x88cc} if ignore is None else ignore
+        self.timelines = {bridge: [] for bridge in self.bridges}
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def poll(self):
+        snapshot = collect_flows(self.bridges)
+        for bridge, table in snapshot.tables.items():
+            count = len(table) - (len(table.find(**self.ignore)) if self.ignore else 0)
+            timeline = self.timelines[bridge]
+            if not timeline or timeline[-1][1] != count:
+                timeline.append((time.monotonic(), count))
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.poll()
+
+    def start(self):
+        self.poll()
+        self.thread = threading.Thread(target=self._run, name='flow-count-watcher',
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.thread = None
+
+    def count(self, switch):
+        name = switch if isinstance(switch, str) else switch.name
+        return self.timelines[name][-1][1]
+
+    def moves(self, switch, since, target, after=None):
+        """Times (from `since`) at which each flow seen after `after`, by
+        default `since`, left the switch or came back to it, until its count
+        reached `target`."""
+        name = switch if isinstance(switch, str) else switch.name
+        timeline = self.timelines[name]
+        after = since if after is None else after
+        before = [count for t, count in timeline if t < after]
+        previous = before[-1] if before else timeline[0][1]
+        times = []
+        for t, count in timeline:
+            if t < after:
+                continue
+            # one time per flow moved in the direction of the target
+            moved = previous - count if target < previous else count - previous
+            times.extend([t - since] * max(0, moved))
+            previous = count
+            if count == target:
+                break
+        return times
+
+
+def window_report(watcher, switch, window, flows):
+    """Scheduling accuracy and migration latency of a maintenance `window`
+    ({'start', 'end'} as time.monotonic()) moving `flows` flows out of
+    `switch` and back."""
+    report = {'switch': switch if isinstance(switch, str) else switch.name,
+              'flows': flows, 'duration': window['end'] - window['start']}
+    # flows leaving before the start, e.g. a window applied early, count too
+    after = window.get('created')
+    for phase, target in (('start', 0), ('end', flows)):
+        times = watcher.moves(switch, window[phase], target, after)
+        if times:
+            after = window[phase] + times[-1]
+        report[phase] = {
+            'moved': len(times),
+            # delay of the first flow moved: how late the window was applied
+            'jitter': times[0] if times else None,
+            # delay of the last one: when the whole migration was done
+            'migrated': times[-1] if len(times) == flows else None,
+            'latency': percentiles(times),
+        }
+    return report
+
+
+# path segments replaced by a placeholder in the endpoint templates
+ENDPOINT_PARAMS = [
+    ('{interface_id}', re.compile(r'^[0-9a-f]{2}(:[0-9a-f]{2}){7}:\d+$')),
+    ('{dpid}', re.compile(r'^[0-9a-f]{2}(:[0-9a-f]{2}){7}$')),
+    ('{id}', re.compile(r'^[0-9a-f-]{12,}$')),
+    ('{n}', re.compile(r'^\d+$')),
+]
+
+
+def endpoint_template(path):
+    """`path` with its ids replaced by placeholders, e.g.
+    /topology/v3/switches/{dpid}/enable, so that calls can be grouped."""
+    segments = []
+    for segment in path.split('?', 1)[0].split('/'):
+        for placeholder, pattern in ENDPOINT_PARAMS:
+            if pattern.match(segment):
+                segment = placeholder
+                break
+        segments.append(segment)
+    return '/'.join(segments)
+
+
+class KytosClient():
+    """Client of the Kytos REST API.
+
+    Requests go through a keep-alive connection pool, with a timeout and
+    retries on connection errors. Every call is timed and counted in the
+    Histogram of its method and endpoint template, e.g.
+    'POST /mef_eline/v2/evc/'.
+    Paths are relative to the API root: KYTOS.get('/topology/v3/links').
+    """
+
+    def __init__(self, api=KYTOS_API, timeout=(3.05, 30), retries=3, pool_size=64):
+        self.api = api
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                                                max_retries=retries)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def request(self, method, path, **kwargs):
+        if path.startswith(self.api):
+            path = path[len(self.api):]
+        kwargs.setdefault('timeout', self.timeout)
+        endpoint = '%s %s' % (method, endpoint_template(path))
+        start = time.monotonic()
+        try:
+            return self.session.request(method, self.api + path, **kwargs)
+        finally:
+            elapsed = time.monotonic() - start
+            with self.lock:
+                self.histograms.setdefault(endpoint, Histogram()).record(elapsed)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.request('PATCH', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def latencies(self):
+        """Latency percentiles of each endpoint called."""
+        return {endpoint: histogram.summary()
+                for endpoint, histogram in self.histograms.items()}
+
+    def export(self):
+        """The latency histogram of each endpoint, as saved at session end."""
+        return {endpoint: histogram.to_dict()
+                for endpoint, histogram in sorted(self.histograms.items())}
+
+    # core
+    def status(self, **kwargs):
+        return self.get('/core/status/', **kwargs)
+
+    def napps_enabled(self, **kwargs):
+        return self.get('/core/napps_enabled/', **kwargs)
+
+    def enable_napp(self, username, name):
+        return self.get('/core/napps/%s/%s/enable' % (username, name))
+
+    def disable_napp(self, username, name):
+        return self.get('/core/napps/%s/%s/disable' % (username, name))
+
+    # topology
+    def switches(self):
+        return self.get('/topology/v3/switches')
+
+    def interfaces(self):
+        return self.get('/topology/v3/interfaces')
+
+    def links(self):
+        return self.get('/topology/v3/links')
+
+    def enable_switch(self, dpid):
+        return self.post('/topology/v3/switches/%s/enable' % (dpid))
+
+    def disable_switch(self, dpid):
+        return self.post('/topology/v3/switches/%s/disable' % (dpid))
+
+    def enable_interface(self, interface_id):
+        return self.post('/topology/v3/interfaces/%s/enable' % (interface_id))
+
+    def disable_interface(self, interface_id):
+        return self.post('/topology/v3/interfaces/%s/disable' % (interface_id))
+
+    def enable_switch_interfaces(self, dpid):
+        return self.post('/topology/v3/interfaces/switch/%s/enable' % (dpid))
+
+    def enable_link(self, link_id):
+        return self.post('/topology/v3/links/%s/enable' % (link_id))
+
+    def disable_link(self, link_id):
+        return self.post('/topology/v3/links/%s/disable' % (link_id))
+
+    # mef_eline
+    def evcs(self):
+        return self.get('/mef_eline/v2/evc/')
+
+    def evc(self, circuit_id):
+        return self.get('/mef_eline/v2/evc/%s' % (circuit_id))
+
+    def create_evc(self, payload):
+        return self.post('/mef_eline/v2/evc/', json=payload)
+
+    def update_evc(self, circuit_id, payload):
+        return self.patch('/mef_eline/v2/evc/%s' % (circuit_id), json=payload)
+
+    def delete_evc(self, circuit_id):
+        return self.delete('/mef_eline/v2/evc/%s' % (circuit_id))
+
+    # maintenance
+    def maintenances(self):
+        return self.get('/maintenance/')
+
+    def create_maintenance(self, payload):
+        return self.post('/maintenance', json=payload)
+
+    def end_maintenance(self, mw_id):
+        return self.patch('/maintenance/%s/end' % (mw_id))
+
+    def delete_maintenance(self, mw_id):
+        return self.delete('/maintenance/%s' % (mw_id))
+
+    # of_lldp
+    def lldp_interfaces(self):
+        return self.get('/of_lldp/v1/interfaces/')
+
+    def enable_lldp(self, interfaces):
+        return self.post('/of_lldp/v1/interfaces/enable/', json={'interfaces': interfaces})
+
+    def disable_lldp(self, interfaces):
+        return self.post('/of_lldp/v1/interfaces/disable/', json={'interfaces': interfaces})
+
+    def lldp_polling_time(self):
+        return self.get('/of_lldp/v1/polling_time')
+
+    def set_lldp_polling_time(self, seconds):
+        return self.post('/of_lldp/v1/polling_time', json={'polling_time': seconds})
+
+    # flow_manager
+    def flows(self, dpid):
+        return self.get('/flow_manager/v2/flows/%s' % (dpid))
+
+    def install_flows(self, dpid, flows):
+        return self.post('/flow_manager/v2/flows/%s' % (dpid), json={'flows': flows})
+
+
+KYTOS = KytosClient()
+
+
+def evc_active(client, circuit_id):
+    """Condition: mef_eline reports the EVC `circuit_id` as active."""
+    def condition():
+        response = client.evc(circuit_id)
+        return response.status_code == 200 and response.json().get('active')
+    condition.__name__ = 'evc active'
+    return condition
+
+
+def links_count(client, count):
+    """Condition: topology lists exactly `count` links."""
+    def condition():
+        response = client.links()
+        return response.status_code == 200 and len(response.json()['links']) == count
+    condition.__name__ = 'links count'
+    return condition
+
+
+SYSLOG = os.environ.get('E2E_SYSLOG', '/var/log/syslog')
+
+KYTOS_ERROR = re.compile(r'kytos.*(error|exception)', re.I)
+TRACEBACK = re.compile(r'kytos.*Traceback \(most recent call last\)')
+# the last line of a traceback, e.g. "KeyError: 'foo'"
+EXCEPTION_LINE = re.compile(r'^[\w.]+(Error|Exception|Exit|Interrupt)\b')
+
+
+def log_message(line):
+    """Message part of a syslog line, after "host program[pid]: "."""
+    parts = line.split(': ', 1)
+    return parts[1] if len(parts) > 1 else line
+
+
+class LogScanner():
+    """Incremental reader of the syslog, keeping the kytos errors.
+
+    Only the data appended since the previous scan is read, in chunks, so
+    the size of the log does not matter. Each error, or traceback with its
+    following lines, is attributed to the test running when it was read:
+
+    LOGS.start()        # at session start, from the end of the file
+    LOGS.begin(nodeid)  # before each test
+    LOGS.scan()         # new entries since the previous scan
+    """
+
+    def __init__(self, path=SYSLOG, chunk_size=1 << 20):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.inode = None
+        self.offset = 0
+        self.partial = b''
+        self.test = None
+        self.traceback = None
+        self.entries = []
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Ignore what the log already holds."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return
+        self.inode, self.offset = stat.st_ino, stat.st_size
+
+    def _read(self, path, new):
+        with open(path, 'rb') as f:
+            f.seek(self.offset)
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                self.offset += len(chunk)
+                lines = (self.partial + chunk).split(b'\n')
+                self.partial = lines.pop()
+                for line in lines:
+                    self._classify(line.decode('utf-8', 'replace'), new)
+
+    def _classify(self, line, new):
+        if self.traceback is not None:
+            message = log_message(line)
+            if message.startswith((' ', '\t')) or EXCEPTION_LINE.match(message):
+                self.traceback['lines'].append(line)
+                if not message.startswith((' ', '\t')):
+                    self.traceback = None
+                return
+            self.traceback = None
+        kind = ('traceback' if TRACEBACK.search(line) else
+                'error' if KYTOS_ERROR.search(line) else None)
+        if kind is None:
+            return
+        entry = {'test': self.test, 'kind': kind, 'lines': [line], 'timestamp': time.time()}
+        if kind == 'traceback':
+            self.traceback = entry
+        self.entries.append(entry)
+        new.append(entry)
+
+    def scan(self):
+        """Read what was appended to the log and return its new entries."""
+        new = []
+        with self.lock:
+            try:
+                stat = os.stat(self.path)
+            except OSError:
+                return new
+            if stat.st_ino != self.inode:
+                # rotated: finish the old file, now renamed, then start over
+                rotated = self.path + '.1'
+                if (self.inode is not None and os.path.exists(rotated) and
+                        os.stat(rotated).st_ino == self.inode):
+                    self._read(rotated, new)
+                self.inode, self.offset, self.partial = stat.st_ino, 0, b''
+            elif stat.st_size < self.offset:
+                # truncated in place
+                self.offset, self.partial = 0, b''
+            self._read(self.path, new)
+        return new
+
+    def begin(self, test):
+        """Attribute what is read from now on to `test`."""
+        self.scan()
+        self.test = test
+
+    def errors(self, test=None):
+        """Entries of `test`, or all of them."""
+        return [entry for entry in self.entries if test is None or entry['test'] == test]
+
+    def summary(self):
+        counts = {}
+        for entry in self.entries:
+            counts.setdefault(entry['test'], {}).setdefault(entry['kind'], 0)
+            counts[entry['test']][entry['kind']] += 1
+        return {'counts': counts, 'entries': self.entries}
+
+
+LOGS = LogScanner()
+
+
+# seconds between two samples of the resources used by kytosd
+SAMPLE_INTERVAL = float(os.environ.get('E2E_SAMPLE_INTERVAL', '1'))
+
+
+def process_usage(pid):
+    """Memory, CPU, threads, file descriptors and I/O of process `pid`.
+
+    USS (the memory that would be freed if the process exited) comes from
+    smaps_rollup, or from smaps on kernels older than 4.14.
+    """
+    with open('/proc/%d/stat' % (pid)) as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    ticks = float(os.sysconf('SC_CLK_TCK'))
+    usage = {'rss': int(fields[21]) * os.sysconf('SC_PAGE_SIZE'),
+             'cpu': (int(fields[11]) + int(fields[12])) / ticks,
+             'threads': int(fields[17]),
+             'fds': len(os.listdir('/proc/%d/fd' % (pid))),
+             'uss': 0}
+    try:
+        f = open('/proc/%d/smaps_rollup' % (pid))
+    except FileNotFoundError:
+        f = open('/proc/%d/smaps' % (pid))
+    with f:
+        for line in f:
+            if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                usage['uss'] += int(line.split()[1]) * 1024
+    with open('/proc/%d/io' % (pid)) as f:
+        for line in f:
+            name, value = line.split(':')
+            if name in ('rchar', 'wchar', 'read_bytes', 'write_bytes'):
+                usage[name] = int(value)
+    return usage
+
+
+def slope(points):
+    """Least squares slope of the (x, y) `points`, None if x is constant."""
+    n = float(len(points))
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var = sum((x - mean_x) ** 2 for x, _ in points)
+    if not var:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var
+
+
+class ResourceSampler():
+    """Background sampler of the resources used by kytosd.
+
+    Every `interval` seconds the process followed is sampled and the sample
+    tagged with the test running, so that a test leaking memory shows as a
+    growing RSS while it runs:
+
+    RESOURCES.start()           # at session start
+    RESOURCES.follow(pid)       # on each kytosd (re)start, None when stopped
+    RESOURCES.begin(nodeid)     # before each test
+    RESOURCES.stop(); RESOURCES.report()
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.pid = None
+        self.test = None
+        self.samples = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        with self.lock:
+            if self.pid is None:
+                return None
+            try:
+                usage = process_usage(self.pid)
+            except (FileNotFoundError, ProcessLookupError):
+                # exiting, it is followed again once restarted
+                return None
+            usage.update({'t': time.monotonic(), 'timestamp': time.time(),
+                          'pid': self.pid, 'test': self.test})
+            self.samples.append(usage)
+            return usage
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, name='resource-sampler',
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.thread = None
+
+    def follow(self, pid):
+        with self.lock:
+            self.pid = pid
+        self.sample()
+
+    def begin(self, test):
+        """Close the samples of the previous test and tag the next ones."""
+        self.sample()
+        with self.lock:
+            self.test = test
+        self.sample()
+
+    @staticmethod
+    def _summary(samples):
+        # a restart resets the memory, so the slopes are computed for each
+        # process separately and weighted by how long it was sampled
+        runs = []
+        for sample in samples:
+            if not runs or runs[-1][-1]['pid'] != sample['pid']:
+                runs.append([])
+            runs[-1].append(sample)
+        weighted = duration = 0.0
+        deltas = dict.fromkeys(('rss', 'cpu', 'read_bytes', 'write_bytes'), 0)
+        for run in runs:
+            elapsed = run[-1]['t'] - run[0]['t']
+            for name in deltas:
+                deltas[name] += run[-1].get(name, 0) - run[0].get(name, 0)
+            rss_slope = slope([(s['t'], s['rss']) for s in run]) if len(run) > 2 else None
+            if rss_slope is not None:
+                weighted += rss_slope * elapsed
+                duration += elapsed
+        return {
+            'samples': len(samples),
+            'restarts': len(runs) - 1,
+            'rss_slope': weighted / duration if duration else None,
+            'rss_growth': deltas['rss'],
+            'rss_max': max(s['rss'] for s in samples),
+            'uss_max': max(s['uss'] for s in samples),
+            'cpu': deltas['cpu'],
+            'read_bytes': deltas['read_bytes'],
+            'write_bytes': deltas['write_bytes'],
+            'threads_max': max(s['threads'] for s in samples),
+            'fds_max': max(s['fds'] for s in samples),
+        }
+
+    def report(self):
+        """Samples and RSS slope (bytes per second) of each test and of each
+        scenario (test class)."""
+        tests, scenarios = {}, {}
+        for sample in self.samples:
+            if sample['test'] is None:
+                continue
+            tests.setdefault(sample['test'], []).append(sample)
+            scenario = '::'.join(sample['test'].split('::')[:2])
+            scenarios.setdefault(scenario, []).append(sample)
+        return {
+            'interval': self.interval,
+            'tests': {name: self._summary(samples) for name, samples in tests.items()},
+            'scenarios': {name: self._summary(samples) for name, samples in scenarios.items()},
+            'samples': self.samples,
+        }
+
+
+RESOURCES = ResourceSampler()
+
+
+PROBE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'probe.py')
+
+# datagrams per second sent by a FailoverProbe, i.e. its resolution
+PROBE_RATE = float(os.environ.get('E2E_PROBE_RATE', '1000'))
+
+# outage allowed on a failover or failback, in milliseconds (0: not checked)
+FAILOVER_SLA = float(os.environ.get('E2E_FAILOVER_SLA_MS', '0')) / 1000
+
+
+def stream_report(records, sent, interval, events):
+    """Loss, duplicates, reordering and outage around each of the `events`.
+
+    `records` are the [seq, sent, received] of the datagrams in the order
+    they arrived and `events` the (name, time) marks of the stream. The
+    outage of an event is the longest run of lost datagrams from the event
+    to the next one, measured on the sender clock.
+    """
+    first = {}
+    duplicates = reordered = 0
+    highest = -1
+    for seq, sent_at, received_at in records:
+        if seq in first:
+            duplicates += 1
+            continue
+        first[seq] = (sent_at, received_at)
+        if seq < highest:
+            reordered += 1
+        highest = max(highest, seq)
+    seqs = sorted(first)
+    # (sent before, sent after, datagrams lost) between datagrams that arrived
+    gaps = [(first[a][0], first[b][0], b - a - 1)
+            for a, b in zip(seqs, seqs[1:]) if b - a > 1]
+    report = {
+        'sent': sent,
+        'received': len(seqs),
+        'lost': sent - len(seqs),
+        'duplicates': duplicates,
+        'reordered': reordered,
+        'interval': interval,
+        'latency': percentiles([received_at - sent_at for sent_at, received_at in first.values()]),
+        'events': [],
+    }
+    for (name, at), (_, until) in zip(events, events[1:] + [(None, float('inf'))]):
+        window = [gap for gap in gaps if gap[1] > at and gap[0] < until]
+        outage = max(window, key=lambda gap: gap[1] - gap[0], default=None)
+        report['events'].append({
+            'event': name,
+            'outage': outage[1] - outage[0] - interval if outage else 0.0,
+            'outage_start': outage[0] - at if outage else None,
+            'lost': sum(gap[2] for gap in window),
+        })
+    return report
+
+
+class FailoverProbe():
+    """Timestamped UDP stream (tests/probe.py) from `sender` to `address`,
+    received on `receiver`, to measure how long traffic is lost:
+
+    probe = FailoverProbe(h1, h3, '101.0.0.3', name=self.id())
+    probe.start()
+    probe.mark('failover')
+    ... break the path and wait for the new one ...
+    wait_until(probe.delivering(time.monotonic()))
+    report = probe.stop()
+    """
+
+    def __init__(self, sender, receiver, address, port=5001, rate=PROBE_RATE,
+                 name=None):
+        self.sender = sender
+        self.receiver = receiver
+        self.address = address
+        self.port = port
+        self.rate = rate
+        self.name = name
+        self.events = []
+        self.progress = {}
+        self.records = None
+        self.sender_proc = None
+        self.receiver_proc = None
+        self.reader = None
+        self.report = None
+
+    def _read(self):
+        for line in iter(self.receiver_proc.stdout.readline, ''):
+            if not line.startswith('{'):
+                continue
+            data = json.loads(line)
+            if 'records' in data:
+                self.records = data['records']
+            else:
+                self.progress = data
+
+    def start(self, timeout=10):
+        """Start the stream and wait until it is delivered."""
+        self.receiver_proc = self.receiver.popen(
+            [sys.executable, PROBE, 'recv', '--port', str(self.port)],
+            stderr=subprocess.STDOUT, universal_newlines=True)
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+        wait_until(lambda: self.progress, name='probe listening', timeout=timeout)
+        self.sender_proc = self.sender.popen(
+            [sys.executable, PROBE, 'send', '--port', str(self.port),
+             '--rate', str(self.rate), self.address],
+            stderr=subprocess.STDOUT, universal_newlines=True)
+        wait_until(self.delivering(time.monotonic()), timeout=timeout)
+
+    def mark(self, name):
+        """Record that the event `name` (e.g. 'failover') starts now."""
+        self.events.append((name, time.monotonic()))
+
+    def delivering(self, since):
+        """Condition: a datagram sent after `since` has been received."""
+        def condition():
+            return (self.progress.get('sent') or 0) > since
+        condition.__name__ = 'probe delivering'
+        return condition
+
+    def stop(self):
+        """Stop the stream and return its report, also kept in FAILOVERS.
+
+        It can be called again, or after start() failed, so that it can be
+        registered as a cleanup before start().
+        """
+        if self.report is not None or self.receiver_proc is None:
+            return self.report
+        summary = {'sent': 0, 'interval': 1.0 / self.rate}
+        if self.sender_proc is not None:
+            if self.sender_proc.poll() is None:
+                self.sender_proc.send_signal(signal.SIGTERM)
+            output = self.sender_proc.communicate()[0] or ''
+            lines = [line for line in output.splitlines() if line.startswith('{')]
+            if lines:
+                summary = json.loads(lines[-1])
+        if self.receiver_proc.poll() is None:
+            self.receiver_proc.send_signal(signal.SIGTERM)
+        self.receiver_proc.wait()
+        self.reader.join()
+        self.report = stream_report(self.records or [], summary['sent'],
+                                    summary['interval'], self.events)
+        self.report['name'] = self.name
+        FAILOVERS.append(self.report)
+        return self.report
+
+
+PING_SUMMARY = re.compile(r'(\d+) packets transmitted, (\d+) received')
+PING_RTT = re.compile(r'= [\d.]+/([\d.]+)/([\d.]+)/')
+
+
+class ConnectivityMatrix():
+    """Reachability between the UNI hosts of a set of EVCs.
+
+    Every host must reach the others of its EVC and none of the other EVCs:
+
+    matrix = ConnectivityMatrix()
+    matrix.add_evc('evc1', [(h11, '110.0.0.11'), (h2, '110.0.0.2')])
+    matrix.add_evc('evc2', [(h12, '110.0.0.12'), (h3, '110.0.0.3')])
+    self.assertEqual(matrix.check().failures(), [])
+
+    The interfaces and addresses are expected to be configured already.
+    """
+
+    def __init__(self):
+        self.evcs = []
+
+    def add_evc(self, name, endpoints):
+        """Add the `endpoints`, (host, address) pairs, of the EVC `name`."""
+        self.evcs.append((name, list(endpoints)))
+
+    def pairs(self, isolation=True, sample=None, seed=0):
+        """(evc, src, dst, expected) of every pair to check.
+
+        With `isolation`, the pairs across EVCs are checked as well; there
+        are quadratically many of them, so `sample` limits their number.
+        """
+        pairs = []
+        crossed = []
+        for name, endpoints in self.evcs:
+            for other, others in self.evcs:
+                for src, _ in endpoints:
+                    for dst in others:
+                        if dst[0] is src:
+                            continue
+                        if other == name:
+                            pairs.append((name, src, dst[1], True))
+                        elif isolation:
+                            crossed.append((name, src, dst[1], False))
+        if sample is not None and len(crossed) > sample:
+            crossed = random.Random(seed).sample(crossed, sample)
+        return pairs + crossed
+
+    def check(self, count=3, interval=0.2, deadline=None, max_parallel=64, **params):
+        """Ping all the pairs concurrently and return a ConnectivityResult.
+
+        Each pair sends `count` echo requests, so a single lost ARP request
+        does not make an expected pair look unreachable.
+        """
+        deadline = deadline or int(count * interval + 2)
+
+        def ping(pair):
+            name, src, dst, expected = pair
+            output = src.popen(['ping', '-n', '-q', '-c', str(count), '-i', str(interval),
+                                '-w', str(deadline), dst],
+                               stderr=subprocess.STDOUT,
+                               universal_newlines=True).communicate()[0]
+            summary = PING_SUMMARY.search(output)
+            rtt = PING_RTT.search(output)
+            sent, received = (int(summary.group(1)), int(summary.group(2))) if summary else (count, 0)
+            return {
+                'evc': name,
+                'src': src.name,
+                'dst': dst,
+                'expected': expected,
+                'sent': sent,
+                'received': received,
+                'loss': 1 - received / float(sent or 1),
+                'rtt': float(rtt.group(1)) / 1000 if rtt else None,
+            }
+
+        pairs = self.pairs(**params)
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, min(max_parallel, len(pairs)))) as executor:
+            results = list(executor.map(ping, pairs))
+        return ConnectivityResult(results, time.monotonic() - start)
+
+
+class ConnectivityResult():
+    """Loss and round trip time of each pair checked by ConnectivityMatrix."""
+
+    def __init__(self, results, elapsed):
+        self.results = results
+        self.elapsed = elapsed
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def matrix(self):
+        """{src: {dst: loss}} of all the pairs checked."""
+        matrix = {}
+        for result in self.results:
+            matrix.setdefault(result['src'], {})[result['dst']] = result['loss']
+        return matrix
+
+    def failures(self):
+        """Expected pairs that could not reach each other, and pairs of
+        different EVCs that could."""
+        return ['%s -> %s (%s): %s' % (result['src'], result['dst'], result['evc'],
+                                       'unreachable' if result['expected'] else 'not isolated')
+                for result in self.results
+                if result['expected'] != (result['received'] > 0)]
+
+    def rtt(self):
+        return percentiles([result['rtt'] for result in self.results
+                            if result['rtt'] is not None])
+
+
+class HostVlans():
+    """VLAN subinterfaces and addresses of several hosts.
+
+    They are applied with a single `ip -batch` per host, on all the hosts
+    concurrently, and removed the same way:
+
+    vlans = HostVlans({h11: [(101, '10.1.1.11/24')], h2: [(None, '10.1.1.2/24')]})
+    vlans.setup()
+    ...
+    vlans.teardown()
+
+    A None vlan puts the address on the untagged interface of the host.
+    """
+
+    def __init__(self, config, max_parallel=64):
+        self.config = {host: list(entries) for host, entries in config.items()}
+        self.max_parallel = max_parallel
+        self.active = False
+
+    @staticmethod
+    def interface(host, vlan):
+        return host.intfNames()[0] if vlan is None else 'vlan%d' % (vlan)
+
+    def setup_commands(self, host):
+        commands = []
+        created = set()
+        for vlan, address in self.config[host]:
+            name = self.interface(host, vlan)
+            if vlan is not None and name not in created:
+                created.add(name)
+                commands.append('link add link %s name %s type vlan id %d'
+                                % (host.intfNames()[0], name, vlan))
+                commands.append('link set dev %s up' % (name))
+            commands.append('addr add %s dev %s' % (address, name))
+        return commands
+
+    def teardown_commands(self, host):
+        commands = []
+        for vlan, address in self.config[host]:
+            name = self.interface(host, vlan)
+            command = ('addr del %s dev %s' % (address, name) if vlan is None
+                       else 'link del dev %s' % (name))
+            if command not in commands:
+                commands.append(command)
+        return commands
+
+    def _apply(self, commands, force=False):
+        def run(host):
+            proc = host.popen(['ip'] + (['-force'] if force else []) + ['-batch', '-'],
+                              stdin=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              universal_newlines=True)
+            output = proc.communicate('\n'.join(commands(host)) + '\n')[0]
+            if proc.returncode and not force:
+                raise subprocess.CalledProcessError(proc.returncode,
+                                                    'ip -batch on %s' % (host.name),
+                                                    output)
+        if not self.config:
+            return
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_parallel, len(self.config)))) as executor:
+            list(executor.map(run, self.config))
+
+    def setup(self):
+        self._apply(self.setup_commands)
+        self.active = True
+        return self
+
+    def teardown(self):
+        """Remove what setup added; errors are ignored so it can always run."""
+        if self.active:
+            self._apply(self.teardown_commands, force=True)
+            self.active = False
+
+    def addresses(self, host):
+        """Addresses of `host`, without the prefix length."""
+        return [address.split('/')[0] for _, address in self.config[host]]
+
+
+# counters of a /proc/net/dev line, in order, after the interface name
+NET_DEV_FIELDS = ['rx_bytes', 'rx_packets', 'rx_errs', 'rx_drop', 'rx_fifo', 'rx_frame',
+                  'rx_compressed', 'rx_multicast', 'tx_bytes', 'tx_packets', 'tx_errs',
+                  'tx_drop', 'tx_fifo', 'tx_colls', 'tx_carrier', 'tx_compressed']
+
+
+def host_counters(host):
+    """Counters of every interface of `host`, by interface name.
+
+    They are read from /proc/<pid>/net/dev, which shows the network
+    namespace of the host; /sys/class/net would show the one of the test.
+    """
+    with open('/proc/%d/net/dev' % (host.pid)) as f:
+        lines = f.readlines()[2:]
+    counters = {}
+    for line in lines:
+        name, values = line.split(':', 1)
+        counters[name.strip()] = dict(zip(NET_DEV_FIELDS, map(int, values.split())))
+    return counters
+
+
+class CounterSampler():
+    """Interface counters of several hosts sampled at a short interval.
+
+    Every pass reads a single file per host, without spawning anything, so
+    the time each counter moved is known within `interval` and the rate of
+    a sparse periodic stream such as LLDP is known after a few packets:
+
+    sampler = CounterSampler([h11, h2])
+    sampler.measure([h11], precision=0.1, timeout=10)
+    sampler.rate(h11)   # {'rate': 0.33, 'low': 0.32, 'high': 0.34, ...}
+    """
+
+    def __init__(self, hosts, interval=0.05, counter='rx_packets'):
+        self.hosts = list(hosts)
+        self.interval = interval
+        self.counter = counter
+        self.series = {}
+
+    @staticmethod
+    def key(interface):
+        """Name of `interface`, or of the first interface of a host."""
+        return interface.intfNames()[0] if hasattr(interface, 'intfNames') else interface
+
+    def sample(self):
+        for host in self.hosts:
+            counters = host_counters(host)
+            now = time.monotonic()
+            for name in host.intfNames():
+                if name in counters:
+                    self.series.setdefault(name, []).append((now, counters[name][self.counter]))
+
+    def run(self, duration=None, until=None, timeout=60):
+        """Sample for `duration` seconds, or until `until(self)` is true or
+        `timeout` has passed."""
+        start = time.monotonic()
+        deadline = start + (duration if duration is not None else timeout)
+        due = start
+        while True:
+            self.sample()
+            if until is not None and until(self):
+                return True
+            due += self.interval
+            if due >= deadline:
+                return until is None
+            time.sleep(max(0, due - time.monotonic()))
+
+    def reset(self):
+        self.series = {}
+
+    def rate(self, interface):
+        """Rate of the counter of `interface` and its bounds.
+
+        The counter is known to have moved between two samples, so the
+        packets counted after the first move and up to the last one were
+        received in a span whose bounds are known. This holds whatever the
+        traffic; with fewer than two moves only an upper bound is known.
+        """
+        series = self.series.get(self.key(interface), [])
+        if len(series) < 2:
+            return None
+        elapsed = series[-1][0] - series[0][0]
+        count = series[-1][1] - series[0][1]
+        moves = [i for i in range(1, len(series)) if series[i][1] != series[i - 1][1]]
+        result = {'count': count, 'elapsed': elapsed}
+        if len(moves) < 2:
+            result.update({'rate': count / elapsed if elapsed else None, 'low': 0.0,
+                           'high': (count + 1) / elapsed if elapsed else None})
+            return result
+        first, last = moves[0], moves[-1]
+        events = series[last][1] - series[first][1]
+        shortest = series[last - 1][0] - series[first][0]
+        longest = series[last][0] - series[first - 1][0]
+        result.update({'rate': 2.0 * events / (shortest + longest),
+                       'low': events / longest,
+                       'high': events / shortest if shortest > 0 else float('inf')})
+        return result
+
+    def names(self, interfaces=None):
+        return [self.key(interface) for interface in interfaces or self.series]
+
+    def precise(self, precision, interfaces=None):
+        """Whether the rate of `interfaces`, or of all of them, is known
+        within `precision` (relative)."""
+        for name in self.names(interfaces):
+            rate = self.rate(name)
+            if rate is None or not rate['rate'] or rate['high'] - rate['low'] > precision * rate['rate']:
+                return False
+        return True
+
+    def measure(self, interfaces=None, precision=0.1, timeout=30):
+        """Sample until the rates of `interfaces`, or of all of them, are
+        known within `precision`; returns them by interface name."""
+        self.reset()
+        self.run(until=lambda sampler: sampler.precise(precision, interfaces),
+                 timeout=timeout)
+        return {name: self.rate(name) for name in self.names(interfaces)}
+
+
+class ShardTopo( Topo ):
+    """Topology whose node names are prefixed with the name of the shard.
+
+    The datapath ids still come from the unprefixed switch names, so every
+    shard sees the same dpids as a standalone run.
+    """
+
+    def addSwitch( self, name, **opts ):
+        if 'dpid' not in opts:
+            opts['dpid'] = '%x' % int(re.findall(r'\d+', name)[0])
+        if SHARDED:
+            # passive OpenFlow ports would collide between the shards
+            opts.pop('listenPort', None)
+        return Topo.addSwitch( self, NODE_PREFIX + name, **opts )
+
+    def addHost( self, name, **opts ):
+        return Topo.addHost( self, NODE_PREFIX + name, **opts )
+
+
+class RingTopo( ShardTopo ):
     "Ring topology with three switches and one host connected to each switch"
 
     def build( self ):
@@ -33,7 +1500,7 @@ class RingTopo( Topo ):
         self.addLink( s2, s3 )
         self.addLink( s3, s1 )
 
-class DanielaTopo( Topo ):
+class DanielaTopo( ShardTopo ):
     """Create a network from semi-scratch with multiple controllers."""
     def build(self):
         #("*** Creating switches\n")
@@ -60,68 +1527,699 @@ class DanielaTopo( Topo ):
         self.addLink(s3, s4)
         self.addLink(s4, s1)
 
+def write_shard_config():
+    """Write the kytos.conf of this shard and return its path."""
+    config = configparser.ConfigParser(interpolation=None)
+    config.read(KYTOS_CONF)
+    if not config.has_section('daemon'):
+        config.add_section('daemon')
+    config.set('daemon', 'pidfile', KYTOS_PIDFILE)
+    config.set('daemon', 'port', str(OPENFLOW_PORT))
+    config.set('daemon', 'api_port', str(API_PORT))
+    path = os.path.join(SHARD_DIR, 'kytos.conf')
+    with open(path, 'w') as f:
+        config.write(f)
+    return path
+
+
+def cleanup_network():
+    """Remove the leftovers of previous networks, only this shard's if sharded."""
+    if not SHARDED:
+        mininet.clean.cleanup()
+        return
+    # the names of this shard are e.g. e1s1 and e1h11, but never e12s1
+    own = re.compile('%s[hs]' % (NODE_PREFIX))
+    os.system("pkill -9 -f 'mininet:%s'" % (own.pattern))
+    bridges = subprocess.Popen(['ovs-vsctl', 'list-br'], stdout=subprocess.PIPE,
+                               universal_newlines=True).communicate()[0]
+    for bridge in bridges.split():
+        if own.match(bridge):
+            os.system('ovs-vsctl --if-exists del-br %s' % (bridge))
+    for intf in os.listdir('/sys/class/net'):
+        if own.match(intf):
+            os.system('ip link del %s 2>/dev/null' % (intf))
+
+
+def pid_alive(pid):
+    """Return whether the process `pid` is still running."""
+    try:
+        with open('/proc/%d/stat' % (pid)) as f:
+            # a zombie already exited, it is only waiting to be reaped
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except (OSError, IndexError):
+        return False
+
+
+def port_open(host, port):
+    """Return whether something accepts TCP connections on host:port."""
+    try:
+        socket.create_connection((host, port), timeout=0.5).close()
+        return True
+    except OSError:
+        return False
+
+
+def _ovsdb_uuids(value):
+    """Return the UUIDs of an OVSDB JSON ["uuid", ...] or ["set", [...]]."""
+    if value[0] == 'uuid':
+        return [value[1]]
+    return [item[1] for item in value[1]]
+
+
+class SwitchConnectWatcher():
+    """Follow the OVSDB Controller.is_connected state of all the bridges.
+
+    A single `ovsdb-client monitor` stream reports every bridge, so each
+    (re)connection is seen as soon as OVS records it, and the moment each
+    switch connected is kept in `connected_at`. When ovsdb-client is not
+    available the switches are polled instead.
+    """
+
+    def __init__(self, switches):
+        self.switches = {sw.name: sw for sw in switches}
+        self.controllers = {}   # bridge name -> controller row UUIDs
+        self.is_connected = {}  # controller row UUID -> bool
+        self.connected_at = {}  # bridge name -> time.monotonic()
+        self.reference = None
+        self.proc = None
+        self.tables = set()     # tables already dumped by the monitor
+        self.cond = threading.Condition()
+
+    def start(self):
+        self.reference = time.monotonic()
+        try:
+            self.proc = subprocess.Popen(
+                ['ovsdb-client', '--format=json', '--data=json', 'monitor',
+                 'Open_vSwitch', 'Bridge', 'name,controller',
+                 'Controller', 'is_connected'],
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                universal_newlines=True, bufsize=1)
+        except OSError:
+            self.proc = None
+            return self
+        threading.Thread(target=self._follow, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+            self.proc.wait()
+
+    def _follow(self):
+        for line in self.proc.stdout:
+            try:
+                update = json.loads(line)
+            except ValueError:
+                continue
+            table = update.get('caption', '').split(' ')[0]
+            with self.cond:
+                self.tables.add(table)
+                for values in update.get('data', []):
+                    row = dict(zip(update['headings'], values))
+                    self._apply(table, row)
+                self._refresh()
+                self.cond.notify_all()
+        with self.cond:
+            self.cond.notify_all()
+
+    def _apply(self, table, row):
+        if row['action'] == 'old':
+            return
+        if table == 'Bridge' and 'name' in row:
+            if row['action'] == 'delete':
+                self.controllers.pop(row['name'], None)
+            elif 'controller' in row:
+                self.controllers[row['name']] = _ovsdb_uuids(row['controller'])
+        elif table == 'Controller':
+            if row['action'] == 'delete':
+                self.is_connected.pop(row['row'], None)
+            elif 'is_connected' in row:
+                self.is_connected[row['row']] = row['is_connected'] is True
+
+    def _refresh(self):
+        now = time.monotonic()
+        for name in self.switches:
+            connected = any(self.is_connected.get(uuid)
+                            for uuid in self.controllers.get(name, []))
+            if not connected:
+                self.connected_at.pop(name, None)
+            elif name not in self.connected_at:
+                self.connected_at[name] = now
+
+    def _poll(self):
+        for name, sw in self.switches.items():
+            if name not in self.connected_at and sw.connected():
+                self.connected_at[name] = time.monotonic()
+
+    def _wait(self, done, timeout):
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while not done():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                if self.proc is None or self.proc.poll() is not None:
+                    # no event stream, fall back to polling the switches
+                    self.proc = None
+                    self._poll()
+                    self.cond.wait(min(remaining, 0.1))
+                else:
+                    self.cond.wait(remaining)
+        return True
+
+    def synced(self):
+        """Whether the initial state of both tables was already received."""
+        return self.proc is None or self.tables >= set(['Bridge', 'Controller'])
+
+    def wait_disconnected(self, timeout=5):
+        """Wait until OVS notices that no bridge is connected anymore."""
+        return self._wait(lambda: self.synced() and not self.connected_at,
+                          timeout)
+
+    def wait_connected(self, timeout):
+        """Wait until every bridge is connected; return if they all did."""
+        return self._wait(lambda: len(self.connected_at) == len(self.switches),
+                          timeout)
+
+    def latencies(self):
+        """Seconds between start() and the connection of each switch."""
+        return {name: max(at - self.reference, 0)
+                for name, at in self.connected_at.items()}
+
+
+def dpid_str(dpid):
+    """Format a datapath id the way kytos does: 00:00:00:00:00:00:00:01."""
+    value = '%016x' % int(dpid, 16)
+    return ':'.join(value[i:i + 2] for i in range(0, 16, 2))
+
+
+class ScaleTopo( ShardTopo ):
+    """Base of the parametrized topologies used for scale tests.
+
+    Switches are named s1..sN and each gets `hosts_per_switch` hosts named
+    h<switch>_<n> on its first ports. The links between switches are kept
+    in `switch_links`, which tells the tests what topology should discover.
+    """
+
+    def build( self, hosts_per_switch=1, **params ):
+        self.hosts_per_switch = hosts_per_switch
+        self.switch_names = []
+        self.switch_links = []
+        self.generate( **params )
+
+    def generate( self, **params ):
+        raise NotImplementedError
+
+    def add_switches( self, count, hosts=True ):
+        """Add `count` switches (with their hosts) and return their names."""
+        names = []
+        for i in range(len(self.switch_names) + 1, len(self.switch_names) + count + 1):
+            switch = self.addSwitch( 's%d' % i )
+            if hosts:
+                for j in range(1, self.hosts_per_switch + 1):
+                    self.addLink( switch, self.addHost( 'h%d_%d' % (i, j) ) )
+            names.append(switch)
+        self.switch_names.extend(names)
+        return names
+
+    def connect( self, switch_a, switch_b ):
+        self.addLink( switch_a, switch_b )
+        self.switch_links.append((switch_a, switch_b))
+
+    def dpids( self ):
+        """Datapath ids of the switches, formatted as kytos lists them."""
+        return [dpid_str(self.nodeInfo(name)['dpid']) for name in self.switch_names]
+
+    def interface_pairs( self ):
+        """Ends of the links between switches, as sets of the interface ids
+        kytos gives their endpoints (00:00:00:00:00:00:00:01:2)."""
+        pairs = set()
+        for node_a, node_b, info in self.links(withInfo=True):
+            if self.isSwitch(node_a) and self.isSwitch(node_b):
+                pairs.add(frozenset('%s:%d' % (dpid_str(self.nodeInfo(info[node])['dpid']),
+                                               info[port])
+                                    for node, port in (('node1', 'port1'), ('node2', 'port2'))))
+        return pairs
+
+    def diameter( self ):
+        """Longest shortest path between two switches, in links (BFS from
+        every switch)."""
+        neighbors = {name: set() for name in self.switch_names}
+        for switch_a, switch_b in self.switch_links:
+            neighbors[switch_a].add(switch_b)
+            neighbors[switch_b].add(switch_a)
+        longest = 0
+        for source in neighbors:
+            distance = {source: 0}
+            frontier = [source]
+            while frontier:
+                following = []
+                for name in frontier:
+                    for neighbor in neighbors[name]:
+                        if neighbor not in distance:
+                            distance[neighbor] = distance[name] + 1
+                            following.append(neighbor)
+                frontier = following
+            longest = max(longest, max(distance.values()))
+        return longest
+
+
+class ScaleLinearTopo( ScaleTopo ):
+    """Chain of `switches` switches."""
+
+    def generate( self, switches=10 ):
+        names = self.add_switches(switches)
+        for switch_a, switch_b in zip(names, names[1:]):
+            self.connect(switch_a, switch_b)
+
+
+class ScaleRingTopo( ScaleLinearTopo ):
+    """Ring of `switches` switches."""
+
+    def generate( self, switches=10 ):
+        ScaleLinearTopo.generate( self, switches )
+        if switches > 2:
+            self.connect(self.switch_names[-1], self.switch_names[0])
+
+
+class ScaleGridTopo( ScaleTopo ):
+    """`rows` x `columns` grid, wrapped around as a torus if `torus`."""
+
+    def generate( self, rows=4, columns=4, torus=False ):
+        names = self.add_switches(rows * columns)
+        grid = [names[row * columns:(row + 1) * columns] for row in range(rows)]
+        for row in range(rows):
+            for column in range(columns):
+                if column + 1 < columns or (torus and columns > 2):
+                    self.connect(grid[row][column], grid[row][(column + 1) % columns])
+                if row + 1 < rows or (torus and rows > 2):
+                    self.connect(grid[row][column], grid[(row + 1) % rows][column])
+
+
+class ScaleLeafSpineTopo( ScaleTopo ):
+    """Every one of `leaves` leaf switches connected to all `spines`."""
+
+    def generate( self, spines=2, leaves=4 ):
+        spine_names = self.add_switches(spines, hosts=False)
+        for leaf in self.add_switches(leaves):
+            for spine in spine_names:
+                self.connect(leaf, spine)
+
+
+class ScaleFatTreeTopo( ScaleTopo ):
+    """k-ary fat tree: (k/2)^2 core switches and k pods of k switches."""
+
+    def generate( self, k=4 ):
+        half = k // 2
+        core = self.add_switches(half * half, hosts=False)
+        for pod in range(k):
+            aggregation = self.add_switches(half, hosts=False)
+            edge = self.add_switches(half)
+            for i, agg in enumerate(aggregation):
+                for core_switch in core[i * half:(i + 1) * half]:
+                    self.connect(agg, core_switch)
+                for edge_switch in edge:
+                    self.connect(agg, edge_switch)
+
+
+class ScaleRandomTopo( ScaleTopo ):
+    """Connected random graph of `switches` switches and `links` links.
+
+    A random spanning tree guarantees the connectivity and random extra
+    links are added on top of it; the same `seed` gives the same graph.
+    """
+
+    def generate( self, switches=10, links=None, seed=0 ):
+        rand = random.Random(seed)
+        names = self.add_switches(switches)
+        if links is None:
+            links = 2 * switches
+        links = min(links, switches * (switches - 1) // 2)
+        linked = set()
+        for i in range(1, switches):
+            pair = (rand.randrange(i), i)
+            linked.add(pair)
+        while len(linked) < links:
+            a, b = rand.sample(range(switches), 2)
+            linked.add((min(a, b), max(a, b)))
+        for a, b in sorted(linked):
+            self.connect(names[a], names[b])
+
+
 class TopologyFactory():
-    def create(self, type):
-        if type == "RingTopo":
-            return RingTopo()
-        elif type == "DanielaTopo":
-            return DanielaTopo()
+    topologies = {
+        'RingTopo': RingTopo,
+        'DanielaTopo': DanielaTopo,
+        'ScaleLinearTopo': ScaleLinearTopo,
+        'ScaleRingTopo': ScaleRingTopo,
+        'ScaleGridTopo': ScaleGridTopo,
+        'ScaleTorusTopo': partial(ScaleGridTopo, torus=True),
+        'ScaleLeafSpineTopo': ScaleLeafSpineTopo,
+        'ScaleFatTreeTopo': ScaleFatTreeTopo,
+        'ScaleRandomTopo': ScaleRandomTopo,
+    }
+
+    def create(self, type, **params):
+        return self.topologies[type](**params)
 
 class NetworkTest():
-    def __init__(self, controller_ip, topo_name='RingTopo'):
+    def __init__(self, controller_ip, topo_name='RingTopo', **topo_params):
         # Create an instance of our topology
-        mininet.clean.cleanup()
         factory = TopologyFactory()
-        topo = factory.create(topo_name)
+        self.topo = factory.create(topo_name, **topo_params)
+        self.controller_ip = controller_ip
+        self.kytos_api = 'http://%s:%d/api/kytos' % (controller_ip, API_PORT)
+        self.api = KYTOS if self.kytos_api == KYTOS.api else KytosClient(self.kytos_api)
+        self.controller_pid = None
+        self.launched_at = None
+        self.watcher = None
+        self.host_vlans = []
+        self.build_network()
 
+    def build_network(self):
         # Create a network based on the topology using OVS and controlled by
         # a remote controller.
+        cleanup_network()
         patch('mininet.util.fixLimits', side_effect=None)
+        controller_ip = self.controller_ip
         self.net = Mininet(
-            topo=topo,
+            topo=self.topo,
             controller=lambda name: RemoteController(
-                                        name, ip=controller_ip, port=6653),
-            switch=OVSSwitch,
+                                        name, ip=controller_ip, port=OPENFLOW_PORT),
+            # configure all the bridges with a few ovs-vsctl calls
+            switch=partial(OVSSwitch, batch=True),
             autoSetMacs=True )
+        # the tests refer to the nodes by their unprefixed names
+        for node in self.net.hosts + self.net.switches:
+            self.net.nameToNode[node.name[len(NODE_PREFIX):]] = node
 
-    def start(self):
+    def start_network(self):
         self.net.start()
+
+    def start(self):
+        self.start_network()
         self.start_controller(clean_config=True)
 
-    def start_controller(self, clean_config=False, enable_all=False):
-        # restart kytos and check if the napp is still disabled
+    def connect_watcher(self):
+        """A started watcher of the connection of the switches."""
+        return SwitchConnectWatcher(self.net.switches).start()
+
+    def delete_flows(self):
+        for sw in self.net.switches:
+            sw.dpctl('del-flows')
+
+    def kytosd_pids(self):
+        """Return the PIDs of the running kytosd daemons."""
+        pids = set()
         try:
-            os.system('pkill kytosd')
-            #with open('/var/run/kytos/kytosd.pid', "r") as f:
-            #    pid = int(f.read())
-            #    os.kill(pid, signal.SIGTERM)
-            time.sleep(5)
-        except Exception as e:
-            print("FAIL restarting kytos -- %s" % (e))
-        if clean_config:
-            # TODO: config is defined at NAPPS_DIR/kytos/storehouse/settings.py 
-            # and NAPPS_DIR is defined at /etc/kytos/kytos.conf
-            os.system('rm -rf /var/tmp/kytos/storehouse')
-            # remove any installed flow
-            for sw in self.net.switches:
-                sw.dpctl('del-flows')
+            with open(KYTOS_PIDFILE) as f:
+                pids.add(int(f.read().strip()))
+        except (OSError, ValueError):
+            pass
+        if not SHARDED:
+            # kytosd may also have been started by hand with another pidfile
+            pgrep = subprocess.Popen(['pgrep', 'kytosd'], stdout=subprocess.PIPE,
+                                     universal_newlines=True)
+            pids.update(int(pid) for pid in pgrep.communicate()[0].split())
+        return set(pid for pid in pids if pid_alive(pid))
+
+    def stop_controller(self, timeout=30):
+        """Terminate kytosd and wait until the process has exited."""
+        pids = self.kytosd_pids()
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        try:
+            wait_until(lambda: not any(pid_alive(pid) for pid in pids),
+                       name='kytosd exit', timeout=timeout)
+        except WaitTimeout:
+            print("FAIL stopping kytos -- sending SIGKILL to %s" % (pids))
+            for pid in pids:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            wait_until(lambda: not any(pid_alive(pid) for pid in pids),
+                       name='kytosd kill', timeout=5)
+        RESOURCES.follow(None)
+        self.controller_pid = None
+
+    def controller_ready(self, napps):
+        """Condition: kytosd serves OpenFlow, its API and all the `napps`."""
+        def condition():
+            if not port_open(self.controller_ip, OPENFLOW_PORT):
+                return False
+            response = self.api.status(timeout=2)
+            if response.status_code != 200 or response.json().get('response') != 'running':
+                return False
+            response = self.api.napps_enabled(timeout=2)
+            if response.status_code != 200:
+                return False
+            return set(napps) <= set(tuple(napp) for napp in response.json()['napps'])
+        condition.__name__ = 'kytosd ready'
+        return condition
+
+    def kytosd_command(self, enable_all=False):
+        """Command line starting the kytosd daemon of this shard."""
         daemon = 'kytosd'
         if enable_all:
             daemon += ' -E'
-        os.system(daemon)
+        if not SHARDED:
+            return daemon
+        os.makedirs(KYTOS_TMP, exist_ok=True)
+        os.makedirs('/var/tmp/kytos', exist_ok=True)
+        daemon += ' -c %s' % (write_shard_config())
+        # a private mount namespace gives kytosd the storehouse of the shard
+        return ("unshare --mount --propagation private sh -c "
+                "'mount --bind %s /var/tmp/kytos && exec %s'" % (KYTOS_TMP, daemon))
+
+    def start_controller(self, clean_config=False, enable_all=False,
+                         napps=EXPECTED_NAPPS):
+        """(Re)start kytosd and wait until it is ready to be tested.
+
+        The time spent waiting the old daemon to exit, the new one to be
+        spawned and its API to answer with all `napps` loaded are recorded
+        separately in CONTROLLER_RESTARTS.
+        """
+        timings = {'timestamp': time.time(), 'clean_config': clean_config}
+        start = time.monotonic()
+        self.stop_controller()
+        timings['stop'] = time.monotonic() - start
+
+        # follow the switches from now on, so their reconnection is seen as
+        # soon as it happens and measured from the daemon launch
+        if self.watcher is not None:
+            self.watcher.stop()
+        self.watcher = self.connect_watcher()
+        self.watcher.wait_disconnected()
+
+        if clean_config:
+            os.system('rm -rf %s' % (STOREHOUSE_DIR))
+            # remove any installed flow
+            self.delete_flows()
 
-    def wait_switches_connect(self):
-        max_wait = 0
-        while any(not sw.connected() for sw in self.net.switches):
-            time.sleep(1)
-            max_wait += 1
-            if max_wait > 30:
-                raise Exception('Timeout: timed out waiting switches reconnect')
+        start = time.monotonic()
+        self.watcher.reference = self.launched_at = start
+        os.system(self.kytosd_command(enable_all))
+        self.controller_pid = wait_until(lambda: min(self.kytosd_pids(), default=None),
+                                         name='kytosd spawn', timeout=30)
+        RESOURCES.follow(self.controller_pid)
+        timings['spawn'] = time.monotonic() - start
+
+        start = time.monotonic()
+        wait_until(self.controller_ready(napps), timeout=60)
+        timings['ready'] = time.monotonic() - start
+        CONTROLLER_RESTARTS.append(timings)
+
+    def wait_switches_connect(self, timeout=None):
+        """Wait until every switch is connected to the controller.
+
+        The reconnect latency of each switch is recorded in SWITCH_RECONNECTS.
+        """
+        watcher = self.watcher
+        if watcher is None:
+            watcher = self.connect_watcher()
+        self.watcher = None
+        if timeout is None:
+            # big topologies need longer to reconnect every switch
+            timeout = 30 + 0.1 * len(watcher.switches)
+        try:
+            connected = watcher.wait_connected(timeout)
+        finally:
+            watcher.stop()
+        latencies = watcher.latencies()
+        SWITCH_RECONNECTS.append({
+            'timestamp': time.time(),
+            'switches': len(watcher.switches),
+            'connected': len(latencies),
+            'latency': latencies,
+            'last': max(latencies.values(), default=None),
+        })
+        if not connected:
+            raise Exception('Timeout: timed out waiting switches reconnect')
 
     def restart_kytos_clean(self):
         self.start_controller(clean_config=True, enable_all=True)
         self.wait_switches_connect()
 
+    def dump_flows(self, *names):
+        """FlowSnapshot of the switches `names`, or of all of them."""
+        if names:
+            return collect_flows([self.net.get(name) for name in names])
+        return collect_flows(self.net.switches)
+
+    def add_vlans(self, config):
+        """Set up the HostVlans `config`, keyed by host or host name; they
+        are removed by reset()."""
+        vlans = HostVlans({self.net.get(host) if isinstance(host, str) else host: entries
+                           for host, entries in config.items()}).setup()
+        self.host_vlans.append(vlans)
+        return vlans
+
+    def restore_links(self):
+        """Bring up again the links a test has put down."""
+        for link in self.net.links:
+            intf = link.intf1 if link.intf1.node in self.net.switches else link.intf2
+            with open('/sys/class/net/%s/flags' % (intf.name)) as f:
+                if int(f.read(), 16) & 1:  # IFF_UP
+                    continue
+            self.net.configLinkStatus(link.intf1.node.name,
+                                      link.intf2.node.name, 'up')
+
+    def clear_flows(self):
+        """Remove every flow but LLDP with a single replace-flows per switch."""
+        for sw in self.net.switches:
+            lldp = FlowTable.parse(sw.dpctl('dump-flows', 'dl_type=0x88cc'))
+            with tempfile.NamedTemporaryFile('w', suffix='.flows') as f:
+                f.write(str(lldp) + '\n')
+                f.flush()
+                sw.dpctl('replace-flows', f.name)
+
+    def reset(self, restart=False):
+        """Bring the network back to a clean state between tests.
+
+        The host VLANs are removed, EVCs and maintenance windows are removed
+        through the REST API and all the flows but LLDP are cleared, which
+        is much faster than a clean controller restart. Pass `restart` when the persistence of
+        the controller state is under test.
+        """
+        while self.host_vlans:
+            self.host_vlans.pop().teardown()
+        self.restore_links()
+        if restart:
+            self.restart_kytos_clean()
+            return
+        for window in self.api.maintenances().json():
+            response = self.api.delete_maintenance(window['id'])
+            if response.status_code != 200:
+                # a running window has to be finished before being deleted
+                self.api.end_maintenance(window['id'])
+                self.api.delete_maintenance(window['id'])
+        for circuit_id in self.api.evcs().json():
+            self.api.delete_evc(circuit_id)
+        self.clear_flows()
+
     def stop(self):
+        if self.watcher is not None:
+            self.watcher.stop()
         self.net.stop()
-        mininet.clean.cleanup()
+        cleanup_network()
+
+
+class EmulatedNetwork(NetworkTest):
+    """NetworkTest whose switches are emulated (tests/ofswitch.py) rather
+    than OVS bridges, to test the control plane with thousands of switches.
+
+    The hosts of the topology are plain ports of the switches, so the tests
+    needing a data plane (pings, host VLANs) cannot run on it.
+    """
+
+    def build_network(self):
+        self.net = None
+        self.fleet = SwitchFleet(self.controller_ip, OPENFLOW_PORT)
+        ports = {}
+        links = []
+        for node_a, node_b, info in self.topo.links(withInfo=True):
+            for node, port in ((info['node1'], info['port1']), (info['node2'], info['port2'])):
+                ports[node] = max(ports.get(node, 0), port)
+            links.append(((info['node1'], info['port1']), (info['node2'], info['port2'])))
+        for name in self.topo.switches():
+            self.fleet.add_switch(name, int(self.topo.nodeInfo(name)['dpid'], 16),
+                                  ports.get(name, 0))
+        for (node_a, port_a), (node_b, port_b) in links:
+            if self.topo.isSwitch(node_a) and self.topo.isSwitch(node_b):
+                self.fleet.add_link(self.fleet.switches[node_a].dpid, port_a,
+                                    self.fleet.switches[node_b].dpid, port_b)
+
+    def start_network(self):
+        self.fleet.start()
+
+    def connect_watcher(self):
+        return FleetWatcher(self.fleet).start()
+
+    def delete_flows(self):
+        self.fleet.delete_flows()
+
+    def switch_name(self, name):
+        return name if name in self.fleet.switches else NODE_PREFIX + name
+
+    def dump_flows(self, *names):
+        names = [self.switch_name(name) for name in names] or list(self.fleet.switches)
+        started = time.time()
+        dumps = self.fleet.dump_flows(names)
+        finished = time.time()
+        return FlowSnapshot({name: FlowTable.parse(dumps[name], name, finished)
+                             for name in names}, started, finished)
+
+    def set_link(self, switch_a, switch_b, up):
+        """Put the link between two switches down or up."""
+        self.fleet.set_link(self.fleet.switches[self.switch_name(switch_a)].dpid,
+                            self.fleet.switches[self.switch_name(switch_b)].dpid, up)
+
+    def restore_links(self):
+        self.fleet.restore_links()
+
+    def clear_flows(self):
+        self.fleet.delete_flows(keep=lldp_flow)
+
+    def stop(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+        self.fleet.stop()
+
+
+# how the switches of a NetworkPool network are run
+BACKENDS = {'mininet': NetworkTest, 'emulated': EmulatedNetwork}
+
+
+class NetworkPool():
+    """Networks built once per topology and shared by all the test modules.
+
+    Only one Mininet network can run at a time, so asking for another
+    topology stops the current one; conftest.py runs the tests grouped by
+    topology to build each of them only once.
+    """
+
+    def __init__(self):
+        self.key = None
+        self.network = None
+
+    def get(self, controller_ip, topo_name='RingTopo', backend='mininet', **topo_params):
+        key = (controller_ip, topo_name, backend, tuple(sorted(topo_params.items())))
+        if self.key != key:
+            self.stop()
+            self.network = BACKENDS[backend](controller_ip, topo_name, **topo_params)
+            # the test classes (re)start the controller as they need
+            self.network.start_network()
+            self.key = key
+        return self.network
+
+    def stop(self):
+        if self.network is not None:
+            self.network.stop()
+        self.key = self.network = None
+
+
+NETWORKS = NetworkPool()
@@ -0,0 +1,82 @@
+""" Latency histograms in the style of HdrHistogram.
+
+Values are counted in log-linear buckets: every power of two is split in
+enough linear sub-buckets to keep `digits` significant decimal digits, so
+the memory used depends on the range of the values, not on their number,
+and any percentile is known within that precision.
+"""
+import math
+
+
+class Histogram():
+    """Counts of values (seconds) recorded with a resolution of `unit`."""
+
+    def __init__(self, unit=1e-6, digits=2):
+        self.unit = unit
+        self.digits = digits
+        # sub-buckets in each power of two: 256 for 2 digits
+        self.sub_bits = int(math.ceil(math.log(2 * 10 ** digits, 2)))
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def key(self, value):
+        units = max(0, int(value / self.unit))
+        shift = max(0, units.bit_length() - self.sub_bits)
+        return (shift << self.sub_bits) | (units >> shift)
+
+    def bounds(self, key):
+        """Lowest and highest value counted in the bucket `key`."""
+        shift, mantissa = key >> self.sub_bits, key & ((1 << self.sub_bits) - 1)
+        return ((mantissa << shift) * self.unit,
+                (((mantissa + 1) << shift) - 1) * self.unit)
+
+    def record(self, value, count=1):
+        key = self.key(value)
+        self.counts[key] = self.counts.get(key, 0) + count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, point):
+        """Highest value of the bucket holding the `point` percentile."""
+        if not self.count:
+            return None
+        rank = max(1, int(math.ceil(self.count * point / 100.0)))
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= rank:
+                return min(self.bounds(key)[1], self.max)
+        return self.max
+
+    def summary(self, points=(50, 90, 99, 99.9)):
+        """Same keys as tests.helpers.percentiles: p50, ..., min, max, mean, count."""
+        if not self.count:
+            return {}
+        result = {'p%s' % (point): self.percentile(point) for point in points}
+        result.update({'min': self.min, 'max': self.max,
+                       'mean': self.total / self.count, 'count': self.count})
+        return result
+
+    def to_dict(self):
+        return {
+            'unit': self.unit,
+            'digits': self.digits,
+            'summary': self.summary(),
+            # [lowest value, count] of the buckets used
+            'buckets': [[self.bounds(key)[0], self.counts[key]] for key in sorted(self.counts)],
+        }
@@ -0,0 +1,248 @@
+""" Asyncio load generator for the Kytos REST API.
+
+A weighted mix of requests is sent over keep-alive HTTP/1.1 connections,
+either in closed loop (a fixed number of clients, each sending its next
+request once the previous one is answered) or in open loop (requests
+started at a fixed rate whatever the latency). Open loop latencies are
+measured from the time each request was due rather than from the time it
+could be sent, so a stalling server is not hidden by the generator slowing
+down with it (coordinated omission).
+
+Only the standard library is used, so that thousands of requests can be
+kept in flight from a single thread.
+"""
+import asyncio
+import json
+import random
+from urllib.parse import urlsplit
+from tests.histogram import Histogram
+
+# (weight, method, path, body) of the read-only endpoints used by the tests
+DEFAULT_WORKLOAD = [
+    (4, 'GET', '/topology/v3/switches', None),
+    (4, 'GET', '/topology/v3/links', None),
+    (2, 'GET', '/topology/v3/interfaces', None),
+    (4, 'GET', '/mef_eline/v2/evc/', None),
+    (2, 'GET', '/maintenance/', None),
+    (2, 'GET', '/of_lldp/v1/interfaces/', None),
+    (1, 'GET', '/of_lldp/v1/polling_time', None),
+]
+
+
+class Connection():
+    """A single HTTP/1.1 connection, reused while the server keeps it open."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    @property
+    def closed(self):
+        return self.writer is None
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None):
+        """Send a request and return the response status once the whole
+        response is read."""
+        data = json.dumps(body).encode() if body is not None else b''
+        head = ['%s %s HTTP/1.1' % (method, path),
+                'Host: %s:%d' % (self.host, self.port),
+                'Connection: keep-alive',
+                'Content-Length: %d' % (len(data))]
+        if body is not None:
+            head.append('Content-Type: application/json')
+        self.writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + data)
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('connection closed by the server')
+        version, status = status_line.split()[:2]
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip().lower()
+        keep_alive = (headers.get('connection') == 'keep-alive' or
+                      version == b'HTTP/1.1' and headers.get('connection') != 'close')
+        if headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if not size:
+                    # trailers, up to the final empty line
+                    while (await self.reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                await self.reader.readexactly(size + 2)
+        elif 'content-length' in headers:
+            await self.reader.readexactly(int(headers['content-length']))
+        else:
+            await self.reader.read()
+            keep_alive = False
+        if not keep_alive:
+            self.close()
+        return int(status)
+
+
+class ConnectionPool():
+    """At most `size` connections to the API at `url`; requests wait for a
+    free connection, and that wait is part of their latency."""
+
+    def __init__(self, url, size):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.idle = []
+        self.available = asyncio.Semaphore(size)
+
+    async def request(self, method, path, body=None):
+        async with self.available:
+            connection = self.idle.pop() if self.idle else Connection(self.host, self.port)
+            try:
+                if connection.closed:
+                    await connection.open()
+                status = await connection.request(method, self.prefix + path, body)
+            except BaseException:
+                # an error or a timeout leaves the connection in an unknown state
+                connection.close()
+                raise
+            if not connection.closed:
+                self.idle.append(connection)
+            return status
+
+    def close(self):
+        while self.idle:
+            self.idle.pop().close()
+
+
+class LoadResult():
+    """Latency histogram of each endpoint and status counts of a run."""
+
+    def __init__(self, mode, level, duration):
+        self.mode = mode
+        self.level = level
+        self.duration = duration
+        self.elapsed = duration
+        self.latencies = {}
+        self.statuses = {}
+        self.errors = 0
+        self.max_lag = 0.0
+
+    def record(self, endpoint, latency, status):
+        self.latencies.setdefault(endpoint, Histogram()).record(latency)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if status is None or status >= 400:
+            self.errors += 1
+
+    def latency(self):
+        """Histogram of the latencies of all the endpoints."""
+        merged = Histogram()
+        for histogram in self.latencies.values():
+            merged.merge(histogram)
+        return merged
+
+    @property
+    def completed(self):
+        return sum(histogram.count for histogram in self.latencies.values())
+
+    @property
+    def throughput(self):
+        return self.completed / self.elapsed
+
+
+class LoadGenerator():
+    """Run workloads against the Kytos API at `api`:
+
+    generator = LoadGenerator(KYTOS_API)
+    result = generator.closed_loop(concurrency=64, duration=10)
+    result = generator.open_loop(rate=500, duration=10)
+    """
+
+    def __init__(self, api, workload=DEFAULT_WORKLOAD, timeout=10, seed=0):
+        self.api = api
+        self.workload = workload
+        self.weights = [spec[0] for spec in workload]
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        # the loop of the current run, each run having its own
+        self.loop = None
+
+    def choose(self):
+        return self.random.choices(self.workload, weights=self.weights)[0]
+
+    async def send(self, pool, result, spec, started):
+        """Send the request `spec` and record its latency from `started`."""
+        _, method, path, body = spec
+        try:
+            status = await asyncio.wait_for(pool.request(method, path, body), self.timeout)
+        except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            status = None
+        result.record('%s %s' % (method, path), self.loop.time() - started, status)
+
+    async def _closed_loop(self, pool, result, concurrency, duration):
+        deadline = self.loop.time() + duration
+
+        async def client():
+            while self.loop.time() < deadline:
+                await self.send(pool, result, self.choose(), self.loop.time())
+
+        await asyncio.gather(*[client() for _ in range(concurrency)])
+
+    async def _open_loop(self, pool, result, rate, duration, poisson):
+        start = due = self.loop.time()
+        tasks = []
+        while due < start + duration:
+            delay = due - self.loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # how far behind its schedule the generator itself fell
+            result.max_lag = max(result.max_lag, self.loop.time() - due)
+            tasks.append(asyncio.ensure_future(self.send(pool, result, self.choose(), due)))
+            due += self.random.expovariate(rate) if poisson else 1.0 / rate
+        await asyncio.gather(*tasks)
+
+    def run(self, workload, connections, result):
+        """Run `workload(pool, result)` over a pool of `connections` in a
+        new event loop, closed once it is done."""
+        async def main():
+            # created in the loop, which its semaphore is bound to
+            pool = ConnectionPool(self.api, connections)
+            start = self.loop.time()
+            try:
+                await workload(pool, result)
+            finally:
+                result.elapsed = self.loop.time() - start
+                pool.close()
+                # let the transports close before the loop does
+                await asyncio.sleep(0)
+
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(main())
+        finally:
+            self.loop.close()
+            self.loop = None
+        return result
+
+    def closed_loop(self, concurrency, duration):
+        """`concurrency` clients sending requests back to back."""
+        result = LoadResult('closed', concurrency, duration)
+        return self.run(lambda pool, result: self._closed_loop(pool, result, concurrency, duration),
+                        concurrency, result)
+
+    def open_loop(self, rate, duration, connections=256, poisson=False):
+        """Requests started every 1/`rate` seconds, or with exponentially
+        distributed gaps when `poisson`, over at most `connections`."""
+        result = LoadResult('open', rate, duration)
+        return self.run(lambda pool, result: self._open_loop(pool, result, rate, duration, poisson),
+                        connections, result)
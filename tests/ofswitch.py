@@ -0,0 +1,882 @@
+""" Emulated OpenFlow 1.3 switches for control plane scale tests.
+
+A Mininet switch costs a kernel bridge and a few processes; an emulated
+one is a coroutine and a few dicts, so thousands of them connect to kytosd
+from a single asyncio loop. They speak enough OpenFlow 1.3 for the napps
+used by the tests: handshake, features, port description and status, echo,
+flow-mod, flow/aggregate/port/table stats, barrier, role and packet-in/out.
+
+The links between switches carry what is sent out of a port, LLDP
+included, to the peer switch, where it goes through its flow table. Only
+in_port, the Ethernet addresses and type and the VLAN id are matched, and
+only the output, VLAN push/pop and VLAN id set-field actions are applied;
+timeouts are not enforced. The packets to the hosts are counted and dropped.
+SwitchFleet.storm() sends packet-ins at a given rate, as a broadcast storm
+would, to measure how kytosd copes.
+
+fleet = SwitchFleet('127.0.0.1', 6653)
+fleet.add_switch('s1', 1, ports=3)
+fleet.add_switch('s2', 2, ports=3)
+fleet.add_link(1, 2, 2, 2)
+fleet.start()
+"""
+import asyncio
+import random
+import resource
+import struct
+import threading
+import time
+
+OFP_VERSION = 0x04
+
+OFPT_HELLO = 0
+OFPT_ERROR = 1
+OFPT_ECHO_REQUEST = 2
+OFPT_ECHO_REPLY = 3
+OFPT_FEATURES_REQUEST = 5
+OFPT_FEATURES_REPLY = 6
+OFPT_GET_CONFIG_REQUEST = 7
+OFPT_GET_CONFIG_REPLY = 8
+OFPT_SET_CONFIG = 9
+OFPT_PACKET_IN = 10
+OFPT_PORT_STATUS = 12
+OFPT_PACKET_OUT = 13
+OFPT_FLOW_MOD = 14
+OFPT_MULTIPART_REQUEST = 18
+OFPT_MULTIPART_REPLY = 19
+OFPT_BARRIER_REQUEST = 20
+OFPT_BARRIER_REPLY = 21
+OFPT_ROLE_REQUEST = 24
+OFPT_ROLE_REPLY = 25
+
+OFPMP_DESC = 0
+OFPMP_FLOW = 1
+OFPMP_AGGREGATE = 2
+OFPMP_TABLE = 3
+OFPMP_PORT_STATS = 4
+OFPMP_PORT_DESC = 13
+OFPMPF_REPLY_MORE = 1
+
+OFPFC_ADD = 0
+OFPFC_MODIFY = 1
+OFPFC_MODIFY_STRICT = 2
+OFPFC_DELETE = 3
+OFPFC_DELETE_STRICT = 4
+
+OFPIT_GOTO_TABLE = 1
+OFPIT_WRITE_ACTIONS = 3
+OFPIT_APPLY_ACTIONS = 4
+
+OFPAT_OUTPUT = 0
+OFPAT_PUSH_VLAN = 17
+OFPAT_POP_VLAN = 18
+OFPAT_SET_FIELD = 25
+
+OFPP_IN_PORT = 0xfffffff8
+OFPP_FLOOD = 0xfffffffb
+OFPP_ALL = 0xfffffffc
+OFPP_CONTROLLER = 0xfffffffd
+OFPP_LOCAL = 0xfffffffe
+OFPP_ANY = 0xffffffff
+OFPTT_ALL = 0xff
+OFP_NO_BUFFER = 0xffffffff
+
+OFPR_NO_MATCH = 0
+OFPR_ACTION = 1
+OFPPR_MODIFY = 2
+OFPPS_LINK_DOWN = 1
+OFPPS_LIVE = 4
+# 10 Gb full duplex, copper
+PORT_FEATURES = (1 << 6) | (1 << 11)
+
+OFPET_BAD_REQUEST = 1
+OFPBRC_BAD_TYPE = 1
+
+OFPXMC_OPENFLOW_BASIC = 0x8000
+OXM_IN_PORT = 0
+OXM_ETH_DST = 3
+OXM_ETH_SRC = 4
+OXM_ETH_TYPE = 5
+OXM_VLAN_VID = 6
+OFPVID_PRESENT = 0x1000
+
+HEADER = struct.Struct('!BBHI')
+FEATURES_REPLY = struct.Struct('!QIBB2xII')
+MULTIPART = struct.Struct('!HH4x')
+PORT = struct.Struct('!I4x6s2x16sIIIIIIII')
+PORT_STATS = struct.Struct('!I4xQQQQQQQQQQQQII')
+FLOW_MOD = struct.Struct('!QQBBHHHIIIH2x')
+FLOW_STATS_REQUEST = struct.Struct('!B3xII4xQQ')
+FLOW_STATS = struct.Struct('!HBxIIHHHH4xQQQ')
+PACKET_IN = struct.Struct('!IHBBQ')
+PACKET_OUT = struct.Struct('!IIH6x')
+# a version bitmap element announcing OpenFlow 1.3 only
+HELLO_BODY = struct.pack('!HHI', 1, 8, 1 << OFP_VERSION)
+
+# switches sending more hops than this are in a loop; the packet is dropped
+MAX_HOPS = 16
+
+
+def pad8(data):
+    return data + b'\0' * (-len(data) % 8)
+
+
+def encode_match(fields):
+    """ofp_match holding the OXM `fields`, {(class, field): (value, mask)}."""
+    oxm = b''
+    for (oxm_class, field), (value, mask) in sorted(fields.items()):
+        payload = value + (mask or b'')
+        oxm += struct.pack('!HBB', oxm_class, field << 1 | bool(mask), len(payload)) + payload
+    return pad8(struct.pack('!HH', 1, 4 + len(oxm)) + oxm)
+
+
+def decode_match(data, offset):
+    """OXM fields of the ofp_match at `offset` and the offset following it."""
+    _, length = struct.unpack_from('!HH', data, offset)
+    fields = {}
+    position, end = offset + 4, offset + length
+    while position + 4 <= end:
+        oxm_class, field, size = struct.unpack_from('!HBB', data, position)
+        if not oxm_class:
+            # padding of a set-field action
+            break
+        payload = data[position + 4:position + 4 + size]
+        if field & 1:
+            fields[(oxm_class, field >> 1)] = (payload[:size // 2], payload[size // 2:])
+        else:
+            fields[(oxm_class, field >> 1)] = (payload, None)
+        position += 4 + size
+    return fields, offset + (length + 7) // 8 * 8
+
+
+def decode_actions(data):
+    """(type, body) of each action of the list `data`."""
+    actions, position = [], 0
+    while position + 4 <= len(data):
+        action_type, length = struct.unpack_from('!HH', data, position)
+        if length < 4:
+            break
+        actions.append((action_type, data[position + 4:position + length]))
+        position += length
+    return actions
+
+
+def packet_fields(in_port, data):
+    """Header fields of the Ethernet frame `data` as OXM values."""
+    fields = {(OFPXMC_OPENFLOW_BASIC, OXM_IN_PORT): struct.pack('!I', in_port),
+              (OFPXMC_OPENFLOW_BASIC, OXM_ETH_DST): data[0:6],
+              (OFPXMC_OPENFLOW_BASIC, OXM_ETH_SRC): data[6:12]}
+    eth_type = data[12:14]
+    vlan = 0
+    if eth_type == b'\x81\x00' and len(data) >= 18:
+        vlan = OFPVID_PRESENT | (struct.unpack('!H', data[14:16])[0] & 0xfff)
+        eth_type = data[16:18]
+    fields[(OFPXMC_OPENFLOW_BASIC, OXM_ETH_TYPE)] = eth_type
+    fields[(OFPXMC_OPENFLOW_BASIC, OXM_VLAN_VID)] = struct.pack('!H', vlan)
+    return fields
+
+
+def _masked(value, mask):
+    return bytes(a & b for a, b in zip(value, mask))
+
+
+def fields_match(fields, packet):
+    for key, (value, mask) in fields.items():
+        actual = packet.get(key)
+        if actual is None:
+            return False
+        if mask is None:
+            if actual != value:
+                return False
+        elif _masked(actual, mask) != _masked(value, mask):
+            return False
+    return True
+
+
+def hex_mac(value):
+    return ':'.join('%02x' % byte for byte in bytearray(value))
+
+
+def format_match(fields):
+    """The `fields` in the syntax of ovs-ofctl dump-flows."""
+    text = []
+    for (oxm_class, field), (value, mask) in sorted(fields.items()):
+        number = int.from_bytes(value, 'big')
+        if (oxm_class, field) == (OFPXMC_OPENFLOW_BASIC, OXM_IN_PORT):
+            text.append('in_port=%d' % (number))
+        elif (oxm_class, field) == (OFPXMC_OPENFLOW_BASIC, OXM_ETH_DST):
+            text.append('dl_dst=%s' % (hex_mac(value)))
+        elif (oxm_class, field) == (OFPXMC_OPENFLOW_BASIC, OXM_ETH_SRC):
+            text.append('dl_src=%s' % (hex_mac(value)))
+        elif (oxm_class, field) == (OFPXMC_OPENFLOW_BASIC, OXM_ETH_TYPE):
+            text.append('dl_type=0x%04x' % (number))
+        elif (oxm_class, field) == (OFPXMC_OPENFLOW_BASIC, OXM_VLAN_VID) and mask is None \
+                and number & OFPVID_PRESENT:
+            text.append('dl_vlan=%d' % (number & 0xfff))
+        elif (oxm_class, field) == (OFPXMC_OPENFLOW_BASIC, OXM_VLAN_VID):
+            text.append('vlan_tci=0x%04x/0x%04x' % (number, int.from_bytes(mask, 'big')
+                                                    if mask else 0x1fff))
+        else:
+            text.append('oxm_%d_%d=0x%s' % (oxm_class, field, value.hex()))
+    return text
+
+
+def format_port(port):
+    return {OFPP_CONTROLLER: 'CONTROLLER', OFPP_IN_PORT: 'IN_PORT', OFPP_FLOOD: 'FLOOD',
+            OFPP_ALL: 'ALL', OFPP_LOCAL: 'LOCAL'}.get(port, str(port))
+
+
+def format_actions(actions):
+    text = []
+    for action_type, body in actions:
+        if action_type == OFPAT_OUTPUT:
+            port, max_len = struct.unpack_from('!IH', body)
+            text.append('CONTROLLER:%d' % (max_len) if port == OFPP_CONTROLLER
+                        else 'output:%s' % (format_port(port)) if port < OFPP_IN_PORT
+                        else format_port(port))
+        elif action_type == OFPAT_PUSH_VLAN:
+            text.append('push_vlan:0x%04x' % (struct.unpack_from('!H', body)[0]))
+        elif action_type == OFPAT_POP_VLAN:
+            text.append('pop_vlan')
+        elif action_type == OFPAT_SET_FIELD:
+            fields, _ = decode_match(struct.pack('!HH', 1, 4 + len(body)) + body, 0)
+            for (_, field), (value, _) in fields.items():
+                number = int.from_bytes(value, 'big')
+                text.append('mod_vlan_vid:%d' % (number & 0xfff) if field == OXM_VLAN_VID
+                            else 'set_field:0x%s->oxm_%d' % (value.hex(), field))
+        else:
+            text.append('action_%d' % (action_type))
+    return text or ['drop']
+
+
+class Flow():
+    """A flow entry as received in a flow-mod."""
+    __slots__ = ('table_id', 'priority', 'fields', 'match', 'cookie', 'idle_timeout',
+                 'hard_timeout', 'flags', 'instructions', 'installed', 'packets', 'bytes')
+
+    def __init__(self, table_id, priority, fields, match, cookie, idle_timeout,
+                 hard_timeout, flags, instructions):
+        self.table_id = table_id
+        self.priority = priority
+        self.fields = fields
+        self.match = match
+        self.cookie = cookie
+        self.idle_timeout = idle_timeout
+        self.hard_timeout = hard_timeout
+        self.flags = flags
+        self.instructions = instructions
+        self.installed = time.monotonic()
+        self.packets = 0
+        self.bytes = 0
+
+    def key(self):
+        return (self.table_id, self.priority, frozenset(self.fields.items()))
+
+    def instruction_list(self):
+        """(type, body) of each instruction."""
+        instructions, position = [], 0
+        while position + 4 <= len(self.instructions):
+            kind, length = struct.unpack_from('!HH', self.instructions, position)
+            if length < 4:
+                break
+            instructions.append((kind, self.instructions[position:position + length]))
+            position += length
+        return instructions
+
+    def actions(self):
+        """Actions applied or written by the flow, in order."""
+        actions = []
+        for kind, body in self.instruction_list():
+            if kind in (OFPIT_APPLY_ACTIONS, OFPIT_WRITE_ACTIONS):
+                actions.extend(decode_actions(body[8:]))
+        return actions
+
+    def goto_table(self):
+        for kind, body in self.instruction_list():
+            if kind == OFPIT_GOTO_TABLE:
+                return body[4]
+        return None
+
+    def outputs(self, port):
+        return any(action_type == OFPAT_OUTPUT and struct.unpack_from('!I', body)[0] == port
+                   for action_type, body in self.actions())
+
+    def dump(self):
+        """The flow as a line of ovs-ofctl dump-flows."""
+        head = ['cookie=0x%x' % (self.cookie),
+                'duration=%.3fs' % (time.monotonic() - self.installed),
+                'table=%d' % (self.table_id), 'n_packets=%d' % (self.packets),
+                'n_bytes=%d' % (self.bytes)]
+        match = ['priority=%d' % (self.priority)] + format_match(self.fields)
+        return ' %s, %s actions=%s' % (', '.join(head), ','.join(match),
+                                        ','.join(format_actions(self.actions())))
+
+
+def lldp_flow(flow):
+    """Whether `flow` matches the LLDP packets."""
+    return flow.fields.get((OFPXMC_OPENFLOW_BASIC, OXM_ETH_TYPE), (None,))[0] == b'\x88\xcc'
+
+
+class Port():
+    __slots__ = ('number', 'name', 'hw_addr', 'peer', 'up', 'counters')
+
+    def __init__(self, number, name, hw_addr):
+        self.number = number
+        self.name = name
+        self.hw_addr = hw_addr
+        self.peer = None     # (switch, port number) at the other end of the link
+        self.up = True
+        # rx/tx packets and bytes
+        self.counters = [0, 0, 0, 0]
+
+    def encode(self):
+        state = OFPPS_LIVE if self.up else OFPPS_LINK_DOWN
+        return PORT.pack(self.number, self.hw_addr, self.name.encode()[:15], 0, state,
+                         PORT_FEATURES, PORT_FEATURES, PORT_FEATURES, 0,
+                         10000000, 10000000)
+
+
+class EmulatedSwitch():
+    """One switch: its ports, its flow table and its controller connection."""
+
+    def __init__(self, fleet, name, dpid, ports):
+        self.fleet = fleet
+        self.name = name
+        self.dpid = dpid
+        self.ports = {}
+        for number in list(range(1, ports + 1)) + [OFPP_LOCAL]:
+            hw_addr = struct.pack('!HI', 0x0200 | (dpid >> 32 & 0xff), (dpid << 8 | number) & 0xffffffff)
+            port_name = name if number == OFPP_LOCAL else '%s-eth%d' % (name, number)
+            self.ports[number] = Port(number, port_name, hw_addr)
+        self.flows = {}
+        self.tables = None   # flows of each table by decreasing priority
+        self.writer = None
+        self.connected_at = None
+        self.miss_send_len = 128
+        self.xid = 0
+        self.echo_sent = {}
+        self.echo_rtts = []
+        self.sent = {}
+        self.received = {}
+        self.max_backlog = 0
+
+    # connection
+
+    async def run(self, host, port, delay=0):
+        """Connect to the controller, and connect again whenever the
+        connection is lost, with a jittered backoff."""
+        await asyncio.sleep(delay)
+        backoff = self.fleet.min_backoff
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+            except OSError:
+                await asyncio.sleep(backoff * random.uniform(0.5, 1.5))
+                backoff = min(backoff * 2, self.fleet.max_backoff)
+                continue
+            backoff = self.fleet.min_backoff
+            try:
+                await self.session(reader, writer)
+            except (OSError, EOFError, asyncio.IncompleteReadError, struct.error):
+                pass
+            finally:
+                writer.close()
+                self.writer = None
+                if self.connected_at is not None:
+                    self.connected_at = None
+                    self.fleet.notify()
+
+    async def session(self, reader, writer):
+        self.writer = writer
+        self.send(OFPT_HELLO, HELLO_BODY)
+        while True:
+            version, kind, length, xid = HEADER.unpack(await reader.readexactly(HEADER.size))
+            body = await reader.readexactly(length - HEADER.size) if length > HEADER.size else b''
+            self.received[kind] = self.received.get(kind, 0) + 1
+            handler = self.handlers.get(kind)
+            if handler is not None:
+                handler(self, xid, body)
+            elif kind not in (OFPT_HELLO, OFPT_ERROR):
+                self.send(OFPT_ERROR, struct.pack('!HH', OFPET_BAD_REQUEST, OFPBRC_BAD_TYPE) +
+                          HEADER.pack(version, kind, length, xid) + body[:56], xid)
+
+    def send(self, kind, body=b'', xid=None):
+        if self.writer is None:
+            return
+        if xid is None:
+            self.xid = (self.xid + 1) & 0xffffffff
+            xid = self.xid
+        self.writer.write(HEADER.pack(OFP_VERSION, kind, HEADER.size + len(body), xid) + body)
+        self.sent[kind] = self.sent.get(kind, 0) + 1
+        # what kytosd did not read yet
+        self.max_backlog = max(self.max_backlog, self.writer.transport.get_write_buffer_size())
+
+    def echo(self):
+        """Send an echo request; its round trip time goes to echo_rtts and
+        to the future returned."""
+        self.xid = (self.xid + 1) & 0xffffffff
+        replied = asyncio.get_event_loop().create_future()
+        self.echo_sent[self.xid] = (time.monotonic(), replied)
+        self.send(OFPT_ECHO_REQUEST, b'', self.xid)
+        return replied
+
+    # handlers of the controller messages
+
+    def on_echo_request(self, xid, body):
+        self.send(OFPT_ECHO_REPLY, body, xid)
+
+    def on_echo_reply(self, xid, body):
+        sent, replied = self.echo_sent.pop(xid, (None, None))
+        if sent is not None:
+            self.echo_rtts.append(time.monotonic() - sent)
+            if not replied.done():
+                replied.set_result(self.echo_rtts[-1])
+
+    def on_features_request(self, xid, body):
+        self.send(OFPT_FEATURES_REPLY,
+                  FEATURES_REPLY.pack(self.dpid, 0, 254, 0, 0x4f, 0), xid)
+        if self.connected_at is None:
+            self.connected_at = time.monotonic()
+            self.fleet.notify()
+
+    def on_get_config_request(self, xid, body):
+        self.send(OFPT_GET_CONFIG_REPLY, struct.pack('!HH', 0, self.miss_send_len), xid)
+
+    def on_set_config(self, xid, body):
+        self.miss_send_len = struct.unpack_from('!HH', body)[1]
+
+    def on_barrier_request(self, xid, body):
+        self.send(OFPT_BARRIER_REPLY, b'', xid)
+
+    def on_role_request(self, xid, body):
+        self.send(OFPT_ROLE_REPLY, body, xid)
+
+    def on_flow_mod(self, xid, body):
+        (cookie, cookie_mask, table_id, command, idle_timeout, hard_timeout, priority,
+         _, out_port, _, flags) = FLOW_MOD.unpack_from(body)
+        fields, offset = decode_match(body, FLOW_MOD.size)
+        match = body[FLOW_MOD.size:offset]
+        instructions = body[offset:]
+        if command == OFPFC_ADD:
+            flow = Flow(table_id, priority, fields, match, cookie, idle_timeout,
+                        hard_timeout, flags, instructions)
+            self.flows[flow.key()] = flow
+            self.tables = None
+            return
+        strict = command in (OFPFC_MODIFY_STRICT, OFPFC_DELETE_STRICT)
+        selected = [flow for flow in self.select(table_id, fields, cookie, cookie_mask, out_port)
+                    if not strict or (flow.priority == priority and flow.fields == fields)]
+        if command in (OFPFC_MODIFY, OFPFC_MODIFY_STRICT):
+            for flow in selected:
+                flow.instructions = instructions
+        elif command in (OFPFC_DELETE, OFPFC_DELETE_STRICT):
+            for flow in selected:
+                del self.flows[flow.key()]
+            self.tables = None
+
+    def on_packet_out(self, xid, body):
+        _, in_port, actions_len = PACKET_OUT.unpack_from(body)
+        actions = decode_actions(body[PACKET_OUT.size:PACKET_OUT.size + actions_len])
+        data = body[PACKET_OUT.size + actions_len:]
+        self.execute(actions, data, in_port, None, 0)
+
+    def on_multipart_request(self, xid, body):
+        kind, _ = MULTIPART.unpack_from(body)
+        request = body[MULTIPART.size:]
+        if kind == OFPMP_DESC:
+            entries = [struct.pack('!256s256s256s32s256s', b'kytos-e2e', b'emulated switch',
+                                   b'tests/ofswitch.py', b'%d' % (self.dpid), self.name.encode())]
+        elif kind in (OFPMP_FLOW, OFPMP_AGGREGATE):
+            table_id, out_port, _, cookie, cookie_mask = FLOW_STATS_REQUEST.unpack_from(request)
+            fields, _ = decode_match(request, FLOW_STATS_REQUEST.size)
+            flows = self.select(table_id, fields, cookie, cookie_mask, out_port)
+            if kind == OFPMP_FLOW:
+                entries = [self.flow_stats(flow) for flow in flows]
+            else:
+                entries = [struct.pack('!QQI4x', sum(flow.packets for flow in flows),
+                                       sum(flow.bytes for flow in flows), len(flows))]
+        elif kind == OFPMP_TABLE:
+            entries = [struct.pack('!B3xIQQ', 0, len(self.flows), 0, 0)]
+        elif kind == OFPMP_PORT_STATS:
+            port_no = struct.unpack_from('!I', request)[0]
+            entries = [PORT_STATS.pack(port.number, port.counters[0], port.counters[1],
+                                       port.counters[2], port.counters[3],
+                                       0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
+                       for port in self.ports.values() if port_no in (OFPP_ANY, port.number)]
+        elif kind == OFPMP_PORT_DESC:
+            entries = [port.encode() for port in self.ports.values()]
+        else:
+            entries = []
+        self.multipart_reply(xid, kind, entries)
+
+    handlers = {
+        OFPT_ECHO_REQUEST: on_echo_request,
+        OFPT_ECHO_REPLY: on_echo_reply,
+        OFPT_FEATURES_REQUEST: on_features_request,
+        OFPT_GET_CONFIG_REQUEST: on_get_config_request,
+        OFPT_SET_CONFIG: on_set_config,
+        OFPT_BARRIER_REQUEST: on_barrier_request,
+        OFPT_ROLE_REQUEST: on_role_request,
+        OFPT_FLOW_MOD: on_flow_mod,
+        OFPT_PACKET_OUT: on_packet_out,
+        OFPT_MULTIPART_REQUEST: on_multipart_request,
+    }
+
+    def multipart_reply(self, xid, kind, entries):
+        """Send `entries` in as many replies as needed to fit 64KB each."""
+        limit = 0xffff - HEADER.size - MULTIPART.size
+        chunks, chunk = [], b''
+        for entry in entries:
+            if chunk and len(chunk) + len(entry) > limit:
+                chunks.append(chunk)
+                chunk = b''
+            chunk += entry
+        chunks.append(chunk)
+        for i, chunk in enumerate(chunks):
+            flags = OFPMPF_REPLY_MORE if i < len(chunks) - 1 else 0
+            self.send(OFPT_MULTIPART_REPLY, MULTIPART.pack(kind, flags) + chunk, xid)
+
+    def flow_stats(self, flow):
+        elapsed = time.monotonic() - flow.installed
+        body = flow.match + flow.instructions
+        return FLOW_STATS.pack(FLOW_STATS.size + len(body), flow.table_id, int(elapsed),
+                               int(elapsed % 1 * 1e9), flow.priority, flow.idle_timeout,
+                               flow.hard_timeout, flow.flags, flow.cookie, flow.packets,
+                               flow.bytes) + body
+
+    def select(self, table_id, fields, cookie, cookie_mask, out_port=OFPP_ANY):
+        """Flows selected by a non-strict modify, delete or stats request."""
+        return [flow for flow in self.flows.values()
+                if table_id in (OFPTT_ALL, flow.table_id) and
+                flow.cookie & cookie_mask == cookie & cookie_mask and
+                all(flow.fields.get(key) == value for key, value in fields.items()) and
+                (out_port == OFPP_ANY or flow.outputs(out_port))]
+
+    # data plane
+
+    def lookup(self, table_id, packet):
+        if self.tables is None:
+            self.tables = {}
+            for flow in sorted(self.flows.values(), key=lambda flow: -flow.priority):
+                self.tables.setdefault(flow.table_id, []).append(flow)
+        for flow in self.tables.get(table_id, []):
+            if fields_match(flow.fields, packet):
+                return flow
+        return None
+
+    def receive(self, in_port, data, hops):
+        """A packet arrived on `in_port`: through the flow table it goes."""
+        port = self.ports.get(in_port)
+        if port is None or not port.up:
+            return
+        port.counters[0] += 1
+        port.counters[2] += len(data)
+        packet = packet_fields(in_port, data)
+        table_id = 0
+        while table_id is not None:
+            flow = self.lookup(table_id, packet)
+            if flow is None:
+                return
+            flow.packets += 1
+            flow.bytes += len(data)
+            self.execute(flow.actions(), data, in_port, flow, hops)
+            table_id = flow.goto_table()
+
+    def execute(self, actions, data, in_port, flow, hops):
+        for action_type, body in actions:
+            if action_type == OFPAT_OUTPUT:
+                port, max_len = struct.unpack_from('!IH', body)
+                if port == OFPP_CONTROLLER:
+                    self.packet_in(in_port, data, OFPR_ACTION if flow else OFPR_NO_MATCH,
+                                   flow.table_id if flow else 0, flow.cookie if flow else 0)
+                elif port in (OFPP_FLOOD, OFPP_ALL):
+                    for number in self.ports:
+                        if number not in (in_port, OFPP_LOCAL):
+                            self.output(number, data, hops)
+                else:
+                    self.output(in_port if port == OFPP_IN_PORT else port, data, hops)
+            elif action_type == OFPAT_PUSH_VLAN:
+                data = data[:12] + body[:2] + b'\0\0' + data[12:]
+            elif action_type == OFPAT_POP_VLAN and data[12:14] == b'\x81\x00':
+                data = data[:12] + data[16:]
+            elif action_type == OFPAT_SET_FIELD and data[12:14] == b'\x81\x00':
+                fields, _ = decode_match(struct.pack('!HH', 1, 4 + len(body)) + body, 0)
+                value, _ = fields.get((OFPXMC_OPENFLOW_BASIC, OXM_VLAN_VID), (None, None))
+                if value is not None:
+                    tci = struct.unpack('!H', data[14:16])[0] & 0xf000
+                    vid = struct.unpack('!H', value)[0] & 0xfff
+                    data = data[:14] + struct.pack('!H', tci | vid) + data[16:]
+
+    def output(self, number, data, hops):
+        port = self.ports.get(number)
+        if port is None or not port.up:
+            return
+        port.counters[1] += 1
+        port.counters[3] += len(data)
+        if port.peer is not None and hops < MAX_HOPS:
+            switch, peer_port = port.peer
+            # delivered later, as a real link would, and without recursion
+            asyncio.get_event_loop().call_soon(switch.receive, peer_port, data, hops + 1)
+
+    def packet_in(self, in_port, data, reason, table_id, cookie):
+        match = encode_match({(OFPXMC_OPENFLOW_BASIC, OXM_IN_PORT):
+                              (struct.pack('!I', in_port), None)})
+        self.send(OFPT_PACKET_IN, PACKET_IN.pack(OFP_NO_BUFFER, len(data), reason, table_id,
+                                                 cookie) + match + b'\0\0' + data)
+
+    def edge_port(self):
+        """First port not linked to another switch, where the hosts are."""
+        for number in sorted(self.ports):
+            if number != OFPP_LOCAL and self.ports[number].peer is None:
+                return number
+        return None
+
+    def set_port(self, number, up):
+        port = self.ports[number]
+        if port.up != up:
+            port.up = up
+            self.send(OFPT_PORT_STATUS, struct.pack('!B7x', OFPPR_MODIFY) + port.encode())
+
+    def dump_flows(self):
+        return '\n'.join(flow.dump() for flow in sorted(
+            self.flows.values(), key=lambda flow: (flow.table_id, -flow.priority)))
+
+
+class SwitchFleet():
+    """Emulated switches connected to the controller at `host`:`port`,
+    all run by one asyncio loop in a background thread.
+
+    The switches are added before start(); afterwards every access goes
+    through call(), which runs a function in the loop thread.
+    """
+
+    def __init__(self, host, port, min_backoff=0.1, max_backoff=1.0):
+        self.host = host
+        self.port = port
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.switches = {}
+        self.by_dpid = {}
+        self.links = []
+        self.loop = None
+        self.thread = None
+        self.tasks = []
+        self.cond = threading.Condition()
+
+    def add_switch(self, name, dpid, ports):
+        switch = EmulatedSwitch(self, name, dpid, ports)
+        self.switches[name] = self.by_dpid[dpid] = switch
+        return switch
+
+    def add_link(self, dpid_a, port_a, dpid_b, port_b):
+        switch_a, switch_b = self.by_dpid[dpid_a], self.by_dpid[dpid_b]
+        switch_a.ports[port_a].peer = (switch_b, port_b)
+        switch_b.ports[port_b].peer = (switch_a, port_a)
+        self.links.append((switch_a, port_a, switch_b, port_b))
+
+    def notify(self):
+        with self.cond:
+            self.cond.notify_all()
+
+    def start(self, connect_rate=None):
+        """Connect the switches, all at once or `connect_rate` per second."""
+        # one socket per switch
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        wanted = len(self.switches) + 1024
+        if soft != resource.RLIM_INFINITY and soft < wanted:
+            resource.setrlimit(resource.RLIMIT_NOFILE,
+                               (wanted if hard == resource.RLIM_INFINITY else min(wanted, hard),
+                                hard))
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name='switch-fleet', daemon=True)
+        self.thread.start()
+
+        def connect():
+            self.tasks = [asyncio.ensure_future(switch.run(
+                self.host, self.port, i / float(connect_rate) if connect_rate else 0))
+                for i, switch in enumerate(self.switches.values())]
+        self.call(connect)
+        return self
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def call(self, function, *args, timeout=60):
+        """Run `function(*args)` in the loop thread and return its result."""
+        async def run():
+            return function(*args)
+        return asyncio.run_coroutine_threadsafe(run(), self.loop).result(timeout)
+
+    def stop(self):
+        if self.loop is None:
+            return
+
+        async def shutdown():
+            for task in self.tasks:
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(60)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = self.thread = None
+        self.tasks = []
+
+    def connected(self):
+        return [switch for switch in self.switches.values() if switch.connected_at is not None]
+
+    def set_link(self, dpid_a, dpid_b, up):
+        """Put the links between two switches down or up, as a cable would."""
+        def apply():
+            for switch_a, port_a, switch_b, port_b in self.links:
+                if set([switch_a.dpid, switch_b.dpid]) == set([dpid_a, dpid_b]):
+                    switch_a.set_port(port_a, up)
+                    switch_b.set_port(port_b, up)
+        self.call(apply)
+
+    def restore_links(self):
+        def apply():
+            for switch_a, port_a, switch_b, port_b in self.links:
+                switch_a.set_port(port_a, True)
+                switch_b.set_port(port_b, True)
+        self.call(apply)
+
+    def delete_flows(self, keep=None):
+        """Remove the flows of every switch but those `keep(flow)` is true for."""
+        def apply():
+            for switch in self.switches.values():
+                switch.flows = {key: flow for key, flow in switch.flows.items()
+                                if keep is not None and keep(flow)}
+                switch.tables = None
+        self.call(apply)
+
+    def dump_flows(self, names):
+        """dump-flows text of the switches `names`."""
+        return self.call(lambda: {name: self.switches[name].dump_flows() for name in names})
+
+    def storm(self, rate, duration, echo_interval=0.1, drain_timeout=60):
+        """Send `rate` packet-ins per second for `duration` seconds, as
+        table-miss entries sending to the controller would: ARP requests
+        arriving on the edge port of each connected switch in turn.
+
+        Returns a concurrent.futures.Future of the Storm, done once kytosd
+        answered an echo sent after the last packet-in (or `drain_timeout`
+        seconds after the end).
+        """
+        storm = Storm(self, rate, duration, echo_interval)
+        return asyncio.run_coroutine_threadsafe(storm.run(drain_timeout), self.loop)
+
+
+def arp_request(src_mac, src_ip, dst_ip):
+    """Broadcast Ethernet frame asking who has `dst_ip`."""
+    return (b'\xff' * 6 + src_mac + struct.pack('!H', 0x0806) +
+            struct.pack('!HHBBH', 1, 0x0800, 6, 4, 1) + src_mac + src_ip +
+            b'\0' * 6 + dst_ip)
+
+
+class Storm():
+    """Packet-ins sent at a steady rate by the switches of a fleet, with
+    echo requests in between to time how long kytosd takes to get to them.
+
+    kytosd reads and handles the messages of a connection in order, so an
+    echo reply comes back once the packet-ins sent before it were handled:
+    the echo round trip times are the queueing delay, and the time to
+    answer the echo sent after the last packet-in tells how many
+    packet-ins per second were handled.
+    """
+
+    def __init__(self, fleet, rate, duration, echo_interval):
+        self.fleet = fleet
+        self.rate = rate
+        self.duration = duration
+        self.echo_interval = echo_interval
+        self.sent = 0
+        self.max_lag = 0.0
+        self.echo_rtts = []
+        self.started = self.finished = self.drained = None
+        self.max_backlog = 0
+
+    async def run(self, drain_timeout):
+        loop = asyncio.get_event_loop()
+        sources = []
+        for i, switch in enumerate(self.fleet.connected()):
+            port = switch.edge_port()
+            if port is not None:
+                src_mac = switch.ports[port].hw_addr
+                frame = arp_request(src_mac, struct.pack('!BBH', 10, 255, i), b'\x0a\xff\xff\xfe')
+                sources.append((switch, port, frame))
+                switch.max_backlog = 0
+        if not sources:
+            raise ValueError('no connected switch has an edge port')
+        echoes = []
+        self.started = loop.time()
+        next_echo = self.started
+        i = 0
+        while True:
+            now = loop.time()
+            due = min(int((now - self.started) * self.rate), int(self.duration * self.rate))
+            # how far behind its schedule the generator itself fell
+            if due > self.sent:
+                self.max_lag = max(self.max_lag, now - self.started - self.sent / float(self.rate))
+            while self.sent < due:
+                switch, port, frame = sources[i % len(sources)]
+                switch.packet_in(port, frame, OFPR_NO_MATCH, 0, 0)
+                self.sent += 1
+                i += 1
+            if now >= next_echo:
+                echoes.append(sources[i % len(sources)][0].echo())
+                next_echo += self.echo_interval
+            if now >= self.started + self.duration:
+                break
+            await asyncio.sleep(0.001)
+        self.finished = loop.time()
+        # one echo behind the last packet-in of each switch
+        last = [switch.echo() for switch, _, _ in sources]
+        try:
+            await asyncio.wait_for(asyncio.gather(*last), drain_timeout)
+            self.drained = loop.time()
+        except asyncio.TimeoutError:
+            pass
+        self.echo_rtts = [echo.result() for echo in echoes if echo.done()]
+        self.max_backlog = max(switch.max_backlog for switch, _, _ in sources)
+        return self
+
+    @property
+    def handled_rate(self):
+        """Packet-ins handled per second, or None if kytosd did not
+        catch up before the drain timeout."""
+        if self.drained is None:
+            return None
+        return self.sent / (self.drained - self.started)
+
+
+class FleetWatcher():
+    """The interface of tests.helpers.SwitchConnectWatcher for a fleet:
+    the switches tell when their handshake with the controller is done."""
+
+    def __init__(self, fleet):
+        self.fleet = fleet
+        self.switches = fleet.switches
+        self.reference = None
+
+    def start(self):
+        self.reference = time.monotonic()
+        return self
+
+    def stop(self):
+        pass
+
+    def _wait(self, done, timeout):
+        with self.fleet.cond:
+            return self.fleet.cond.wait_for(done, timeout)
+
+    def wait_disconnected(self, timeout=5):
+        return self._wait(lambda: not self.fleet.connected(), timeout)
+
+    def wait_connected(self, timeout):
+        return self._wait(lambda: len(self.fleet.connected()) == len(self.switches), timeout)
+
+    def latencies(self):
+        return {switch.name: max(switch.connected_at - self.reference, 0)
+                for switch in self.fleet.connected()}
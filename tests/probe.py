@@ -0,0 +1,114 @@
+""" Timestamped UDP stream used to measure how long traffic is lost.
+
+Runs inside the Mininet hosts, so it only depends on the standard library:
+
+  probe.py recv --port 5001
+  probe.py send --port 5001 --rate 1000 101.0.0.3
+
+Every datagram carries its sequence number and the CLOCK_MONOTONIC time it
+was sent at; the hosts are network namespaces of the same kernel, so the
+sender, the receiver and the test share that clock.
+
+The receiver prints its progress as a JSON line every --progress seconds.
+Once terminated it keeps receiving until the stream is idle for --drain
+seconds, then prints every datagram received as [seq, sent, received].
+The sender prints how many datagrams it sent once terminated.
+"""
+import argparse
+import json
+import signal
+import socket
+import struct
+import sys
+import time
+
+# sequence number and send time of each datagram
+HEADER = struct.Struct('!Qd')
+
+# set by SIGTERM, checked between datagrams
+STOPPED = []
+
+
+def stop(signum, frame):
+    STOPPED.append(signum)
+
+
+def emit(data):
+    sys.stdout.write(json.dumps(data) + '\n')
+    sys.stdout.flush()
+
+
+def send(args):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    padding = b'\0' * max(0, args.size - HEADER.size)
+    interval = 1.0 / args.rate
+    seq = 0
+    start = time.monotonic()
+    while not STOPPED:
+        # pace on the schedule rather than on the previous send, so a late
+        # wakeup does not slow the whole stream down
+        delay = start + seq * interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            sock.sendto(HEADER.pack(seq, time.monotonic()) + padding,
+                        (args.address, args.port))
+        except OSError:
+            # no route or neighbour while the path is down: still a loss
+            pass
+        seq += 1
+    emit({'sent': seq, 'interval': interval, 'start': start})
+
+
+def receive(args):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    sock.bind(('0.0.0.0', args.port))
+    sock.settimeout(args.progress)
+    received = []
+    draining = False
+    next_progress = time.monotonic() + args.progress
+    while True:
+        try:
+            data = sock.recv(65535)
+            seq, sent = HEADER.unpack_from(data)
+            received.append([seq, sent, time.monotonic()])
+        except socket.timeout:
+            if draining:
+                break
+        if STOPPED and not draining:
+            # the sender is stopped first, wait for what is still in flight
+            draining = True
+            sock.settimeout(args.drain)
+        now = time.monotonic()
+        if not draining and now >= next_progress:
+            next_progress = now + args.progress
+            last = received[-1] if received else [None, None, None]
+            emit({'received': len(received), 'seq': last[0], 'sent': last[1], 'at': last[2]})
+    emit({'records': received})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command')
+    sender = commands.add_parser('send')
+    sender.add_argument('address')
+    sender.add_argument('--port', type=int, default=5001)
+    sender.add_argument('--rate', type=float, default=1000, help='datagrams per second')
+    sender.add_argument('--size', type=int, default=64, help='datagram payload size')
+    receiver = commands.add_parser('recv')
+    receiver.add_argument('--port', type=int, default=5001)
+    receiver.add_argument('--progress', type=float, default=0.05)
+    receiver.add_argument('--drain', type=float, default=0.2)
+    args = parser.parse_args()
+    signal.signal(signal.SIGTERM, stop)
+    if args.command == 'send':
+        send(args)
+    elif args.command == 'recv':
+        receive(args)
+    else:
+        parser.error('a command is required')
+
+
+if __name__ == '__main__':
+    main()
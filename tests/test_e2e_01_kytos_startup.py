@@ -1,33 +1,23 @@
 import unittest
-import requests
-from tests.helpers import NetworkTest
+from tests.helpers import NETWORKS, CONTROLLER, KYTOS, LOGS
 import os
 import time
-import re
 
-CONTROLLER = '127.0.0.1'
-KYTOS_API = 'http://%s:8181/api/kytos' % (CONTROLLER)
 
-# TODO: check all the logs on the end
-# TODO: persist the logs of syslog
-# TODO: multiple instances or single instance for checking memory leak / usage (benchmark - how many flows are supported? how many switches are supported?)
+# TODO: multiple instances or single instance (benchmark - how many flows are supported? how many switches are supported?)
 
 class TestE2EKytosServer(unittest.TestCase):
     net = None
+    topo_name = 'RingTopo'
     @classmethod
     def setUpClass(cls):
-        cls.net = NetworkTest(CONTROLLER)
-        cls.net.start()
+        cls.net = NETWORKS.get(CONTROLLER, cls.topo_name)
+        cls.net.start_controller(clean_config=True)
         cls.net.wait_switches_connect()
 
-    @classmethod
-    def tearDownClass(cls):
-        cls.net.stop()
-
     def test_start_kytos_api_core(self):
         # check server status if it is UP and running
-        api_url = KYTOS_API+'/core/status/'
-        response = requests.get(api_url)
+        response = KYTOS.status()
         self.assertEqual(response.status_code, 200)
         data = response.json()
         self.assertEqual(data['response'], 'running')
@@ -43,30 +33,27 @@ class TestE2EKytosServer(unittest.TestCase):
                 ("kytos", "topology"),
                 ("kytos", "of_lldp")
             ]
-        api_url = KYTOS_API+'/core/napps_enabled/'
-        response = requests.get(api_url)
+        response = KYTOS.napps_enabled()
         self.assertEqual(response.status_code, 200)
         data = response.json()
         #self.assertEqual(set(data['napps']), set(expected_napps))
         assert set([tuple(lst) for lst in data['napps']]) == set(expected_napps)
 
         # check disable a napp
-        api_url = KYTOS_API+'/core/napps/kytos/mef_eline/disable'
-        response = requests.get(api_url)
+        response = KYTOS.disable_napp('kytos', 'mef_eline')
         self.assertEqual(response.status_code, 200)
-        api_url = KYTOS_API+'/core/napps_enabled/'
-        response = requests.get(api_url)
+        response = KYTOS.napps_enabled()
         self.assertEqual(response.status_code, 200)
         data = response.json()
         #self.assertEqual(data['napps'], expected_napps[:1] + expected_napps[2:])
         assert set([tuple(lst) for lst in data['napps']]) == set(expected_napps) - set([("kytos", "mef_eline")])
 
         # restart kytos and check if the switches are still enabled
-        self.net.start_controller(clean_config=False)
+        self.net.start_controller(clean_config=False,
+                                  napps=set(expected_napps) - set([("kytos", "mef_eline")]))
         self.net.wait_switches_connect()
 
-        api_url = KYTOS_API+'/core/napps_enabled/'
-        response = requests.get(api_url)
+        response = KYTOS.napps_enabled()
         self.assertEqual(response.status_code, 200)
         data = response.json()
         #self.assertEqual(data['napps'], expected_napps[:1] + expected_napps[2:])
@@ -74,11 +61,9 @@ class TestE2EKytosServer(unittest.TestCase):
 
 
         # check enable a napp
-        api_url = KYTOS_API+'/core/napps/kytos/mef_eline/enable'
-        response = requests.get(api_url)
+        response = KYTOS.enable_napp('kytos', 'mef_eline')
         self.assertEqual(response.status_code, 200)
-        api_url = KYTOS_API+'/core/napps_enabled/'
-        response = requests.get(api_url)
+        response = KYTOS.napps_enabled()
         self.assertEqual(response.status_code, 200)
         data = response.json()
         #self.assertEqual(data['napps'], expected_napps)
@@ -88,5 +73,7 @@ class TestE2EKytosServer(unittest.TestCase):
         # TODO
 
     def test_start_kytos_without_errors(self):
-        with open('/var/log/syslog', "r") as f:
-            self.assertEqual(re.findall('kytos.*(error|exception)', f.read(), re.I), [])
+        # kytos errors and tracebacks logged since the session started
+        self.assertTrue(os.path.exists(LOGS.path))
+        LOGS.scan()
+        self.assertEqual([entry['lines'] for entry in LOGS.errors()], [])
@@ -1,28 +1,19 @@
 import unittest
-import requests
-from tests.helpers import NetworkTest
+from tests.helpers import NETWORKS, CONTROLLER, KYTOS, wait_until, links_count
 import os
-import time
-
-CONTROLLER = '127.0.0.1'
-KYTOS_API = 'http://%s:8181/api/kytos' % (CONTROLLER)
 
 
 class TestE2ETopology(unittest.TestCase):
     net = None
+    topo_name = 'RingTopo'
     @classmethod
     def setUpClass(cls):
-        cls.net = NetworkTest(CONTROLLER)
-        cls.net.start()
+        cls.net = NETWORKS.get(CONTROLLER, cls.topo_name)
+        cls.net.start_controller(clean_config=True)
         cls.net.wait_switches_connect()
 
-    @classmethod
-    def tearDownClass(cls):
-        cls.net.stop()
-
     def test_010_list_switches(self):
-        api_url = KYTOS_API+'/topology/v3/switches'
-        response = requests.get(api_url)
+        response = KYTOS.switches()
         self.assertEqual(response.status_code, 200)
         data = response.json()
         self.assertTrue('switches' in data)
@@ -37,27 +28,22 @@ class TestE2ETopology(unittest.TestCase):
         sw3 = '00:00:00:00:00:00:00:03'
 
         # make sure the switches are disabled by default
-        api_url = KYTOS_API+'/topology/v3/switches'
-        response = requests.get(api_url)
+        response = KYTOS.switches()
         data = response.json()
         self.assertFalse(data['switches'][sw1]['enabled'])
         self.assertFalse(data['switches'][sw2]['enabled'])
         self.assertFalse(data['switches'][sw3]['enabled'])
 
         # enable the switches
-        api_url = KYTOS_API+'/topology/v3/switches/%s/enable' % (sw1)
-        response = requests.post(api_url)
+        response = KYTOS.enable_switch(sw1)
         self.assertEqual(response.status_code, 201)
-        api_url = KYTOS_API+'/topology/v3/switches/%s/enable' % (sw2)
-        response = requests.post(api_url)
+        response = KYTOS.enable_switch(sw2)
         self.assertEqual(response.status_code, 201)
-        api_url = KYTOS_API+'/topology/v3/switches/%s/enable' % (sw3)
-        response = requests.post(api_url)
+        response = KYTOS.enable_switch(sw3)
         self.assertEqual(response.status_code, 201)
 
         # check if the switches are now enabled
-        api_url = KYTOS_API+'/topology/v3/switches'
-        response = requests.get(api_url)
+        response = KYTOS.switches()
         data = response.json()
         self.assertTrue(data['switches'][sw1]['enabled'])
         self.assertTrue(data['switches'][sw2]['enabled'])
@@ -68,13 +54,11 @@ class TestE2ETopology(unittest.TestCase):
         self.net.wait_switches_connect()
 
         ## restore the status
-        #api_url = KYTOS_API+'/topology/v3/restore'
-        #response = requests.get(api_url)
+        #response = KYTOS.get('/topology/v3/restore')
         #self.assertEqual(response.status_code, 200)
 
         # check if the switches are still enabled and now with the links
-        api_url = KYTOS_API+'/topology/v3/switches'
-        response = requests.get(api_url)
+        response = KYTOS.switches()
         data = response.json()
         self.assertTrue(data['switches'][sw1]['enabled'])
         self.assertTrue(data['switches'][sw2]['enabled'])
@@ -91,8 +75,7 @@ class TestE2ETopology(unittest.TestCase):
         sw2if1 = '00:00:00:00:00:00:00:02:1'
 
         # make sure the interfaces are disabled by default
-        api_url = KYTOS_API+'/topology/v3/interfaces'
-        response = requests.get(api_url)
+        response = KYTOS.interfaces()
         self.assertEqual(response.status_code, 200)
         data = response.json()
         self.assertEqual(len(data['interfaces']), 13)
@@ -100,16 +83,13 @@ class TestE2ETopology(unittest.TestCase):
         self.assertFalse(data['interfaces'][sw2if1]['enabled'])
 
         # enable the interfaces
-        api_url = KYTOS_API+'/topology/v3/interfaces/%s/enable' % (sw1if1)
-        response = requests.post(api_url)
+        response = KYTOS.enable_interface(sw1if1)
         self.assertEqual(response.status_code, 200)
-        api_url = KYTOS_API+'/topology/v3/interfaces/%s/enable' % (sw2if1)
-        response = requests.post(api_url)
+        response = KYTOS.enable_interface(sw2if1)
         self.assertEqual(response.status_code, 201)
 
         # check if the interfaces are now enabled
-        api_url = KYTOS_API+'/topology/v3/interfaces'
-        response = requests.get(api_url)
+        response = KYTOS.interfaces()
         data = response.json()
         self.assertTrue(data['interfaces'][sw1if1]['enabled'])
         self.assertTrue(data['interfaces'][sw2if1]['enabled'])
@@ -119,13 +99,11 @@ class TestE2ETopology(unittest.TestCase):
         self.net.wait_switches_connect()
 
         ## restore the status
-        #api_url = KYTOS_API+'/topology/v3/restore'
-        #response = requests.get(api_url)
+        #response = KYTOS.get('/topology/v3/restore')
         #self.assertEqual(response.status_code, 200)
 
         # check if the interfaces are still enabled and now with the links
-        api_url = KYTOS_API+'/topology/v3/interfaces'
-        response = requests.get(api_url)
+        response = KYTOS.interfaces()
         data = response.json()
         self.assertTrue(data['interfaces'][sw1if1]['enabled'])
         self.assertTrue(data['interfaces'][sw2if1]['enabled'])
@@ -155,8 +133,7 @@ class TestE2ETopology(unittest.TestCase):
         endpoint_b = '00:00:00:00:00:00:00:02:2'
 
         # make sure the links are disabled by default
-        api_url = KYTOS_API+'/topology/v3/links'
-        response = requests.get(api_url)
+        response = KYTOS.links()
         self.assertEqual(response.status_code, 200)
         data = response.json()
         self.assertEqual(len(data['links']), 0)
@@ -164,19 +141,16 @@ class TestE2ETopology(unittest.TestCase):
         # enable the links (need to enable the switches and ports first)
         for i in [1,2,3]:
             sw = "00:00:00:00:00:00:00:0%d" % (i)
-            api_url = KYTOS_API+'/topology/v3/switches/%s/enable' % (sw)
-            response = requests.post(api_url)
+            response = KYTOS.enable_switch(sw)
             self.assertEqual(response.status_code, 201)
-            api_url = KYTOS_API+'/topology/v3/interfaces/switch/%s/enable' % (sw)
-            response = requests.post(api_url)
+            response = KYTOS.enable_switch_interfaces(sw)
             self.assertEqual(response.status_code, 200)
 
-        # wait 10s to kytos execute LLDP
-        time.sleep(10)
+        # wait kytos execute LLDP
+        wait_until(links_count(KYTOS, 3), timeout=30)
 
         # now all the links should stay disabled
-        api_url = KYTOS_API+'/topology/v3/links'
-        response = requests.get(api_url)
+        response = KYTOS.links()
         data = response.json()
         self.assertEqual(len(data['links']), 3)
 
@@ -188,13 +162,11 @@ class TestE2ETopology(unittest.TestCase):
         self.assertNotEqual(link_id1, None)
         self.assertFalse(data['links'][link_id1]['enabled'])
 
-        api_url = KYTOS_API+'/topology/v3/links/%s/enable' % (link_id1)
-        response = requests.post(api_url)
+        response = KYTOS.enable_link(link_id1)
         self.assertEqual(response.status_code, 201)
 
         # check if the links are now enabled
-        api_url = KYTOS_API+'/topology/v3/links'
-        response = requests.get(api_url)
+        response = KYTOS.links()
         data = response.json()
         self.assertTrue(data['links'][link_id1]['enabled'])
 
@@ -203,16 +175,14 @@ class TestE2ETopology(unittest.TestCase):
         self.net.wait_switches_connect()
 
         ## restore the status
-        #api_url = KYTOS_API+'/topology/v3/restore'
-        #response = requests.get(api_url)
+        #response = KYTOS.get('/topology/v3/restore')
         #self.assertEqual(response.status_code, 200)
 
-        # wait 10s to kytos execute LLDP
-        time.sleep(10)
+        # wait kytos execute LLDP
+        wait_until(links_count(KYTOS, 3), timeout=30)
 
         # check if the links are still enabled and now with the links
-        api_url = KYTOS_API+'/topology/v3/links'
-        response = requests.get(api_url)
+        response = KYTOS.links()
         data = response.json()
         self.assertTrue(data['links'][link_id1]['enabled'])
 
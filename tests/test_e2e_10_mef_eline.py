@@ -1,31 +1,26 @@
 import unittest
-import requests
-from tests.helpers import NetworkTest
+from tests.helpers import (NETWORKS, CONTROLLER, KYTOS, FlowTable, wait_until,
+                           flows_installed, ConnectivityMatrix)
 import os
-import time
-import json
-
-CONTROLLER = '127.0.0.1'
-KYTOS_API = 'http://%s:8181/api/kytos' % (CONTROLLER)
 
 
 class TestE2EMefEline(unittest.TestCase):
     net = None
+    topo_name = 'RingTopo'
 
     @classmethod
     def setUpClass(cls):
-        cls.net = NetworkTest(CONTROLLER)
-        cls.net.start()
+        cls.net = NETWORKS.get(CONTROLLER, cls.topo_name)
         cls.net.restart_kytos_clean()
 
-    @classmethod
-    def tearDownClass(cls):
-        cls.net.stop()
+    def setUp(self):
+        # the network is shared, so a failing test must not leave its EVCs,
+        # links down or host VLANs to the next one
+        self.addCleanup(self.net.reset)
 
     def test_001_list_evcs_should_be_empty(self):
         """Test if list circuits return 'no circuit stored.'."""
-        api_url = KYTOS_API + '/mef_eline/v2/evc/'
-        response = requests.get(api_url)
+        response = KYTOS.evcs()
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json(), {})
 
@@ -50,35 +45,27 @@ class TestE2EMefEline(unittest.TestCase):
                 }
             }
         }
-        api_url = KYTOS_API + '/mef_eline/v2/evc/'
-        response = requests.post(api_url, json=payload)
+        response = KYTOS.create_evc(payload)
         self.assertEqual(response.status_code, 201)
         data = response.json()
         self.assertIn('circuit_id', data)
 
+        s1 = self.net.net.get('s1')
+        wait_until(flows_installed(s1, count=3, dl_vlan=101))
+
         h11, h12 = self.net.net.get('h11', 'h12')
-        h11.cmd('ip link add link %s name vlan101 type vlan id 101' % (h11.intfNames()[0]))
-        h11.cmd('ip link set up vlan101')
-        h11.cmd('ip addr add 10.1.1.11/24 dev vlan101')
-        h12.cmd('ip link add link %s name vlan101 type vlan id 101' % (h12.intfNames()[0]))
-        h12.cmd('ip link set up vlan101')
-        h12.cmd('ip addr add 10.1.1.12/24 dev vlan101')
+        self.net.add_vlans({h11: [(101, '10.1.1.11/24')],
+                            h12: [(101, '10.1.1.12/24')]})
 
         result = h11.cmd('ping -c1 10.1.1.12')
         self.assertIn(', 0% packet loss,', result)
 
-        s1 = self.net.net.get('s1')
-        flows_s1 = s1.dpctl('dump-flows')
+        flows_s1 = FlowTable.from_switch(s1)
         # Each switch must have 3 flows: 01 for LLDP + 02 for the EVC (ingress + egress)
-        self.assertEqual(len(flows_s1.split('\r\n ')), 3)
+        self.assertEqual(len(flows_s1), 3)
 
         # TODO: make sure it should be dl_vlan instead of vlan_vid
-        self.assertIn('dl_vlan=101', flows_s1)
-
-        # clean up
-        h11.cmd('ip link del vlan101')
-        h12.cmd('ip link del vlan101')
-        self.net.restart_kytos_clean()
+        self.assertTrue(flows_s1.find(dl_vlan=101))
 
     def test_015_create_evc_inter_switch(self):
         payload = {
@@ -100,42 +87,32 @@ class TestE2EMefEline(unittest.TestCase):
                 }
             }
         }
-        api_url = KYTOS_API + '/mef_eline/v2/evc/'
-        response = requests.post(api_url, data=json.dumps(payload), headers={'Content-type': 'application/json'})
+        response = KYTOS.create_evc(payload)
         assert response.status_code == 201
         data = response.json()
         assert 'circuit_id' in data
-        time.sleep(20)
 
         # Each switch must have 3 flows: 01 for LLDP + 02 for the EVC (ingress + egress)
         s1, s2 = self.net.net.get('s1', 's2')
-        flows_s1 = s1.dpctl('dump-flows')
-        flows_s2 = s2.dpctl('dump-flows')
-        assert len(flows_s1.split('\r\n ')) == 3
-        assert len(flows_s2.split('\r\n ')) == 3
+        wait_until(flows_installed(s1, count=3, dl_vlan=15))
+        wait_until(flows_installed(s2, count=3, dl_vlan=15))
+        flows_s1, flows_s2 = self.net.dump_flows('s1', 's2')
+        assert len(flows_s1) == 3
+        assert len(flows_s2) == 3
 
         # make sure it should be dl_vlan instead of vlan_vid
-        assert 'dl_vlan=15' in flows_s1
-        assert 'dl_vlan=15' in flows_s2
+        assert flows_s1.find(dl_vlan=15)
+        assert flows_s2.find(dl_vlan=15)
 
         # Make the final and most important test: connectivity
         # 1. create the vlans and setup the ip addresses
         # 2. try to ping each other
         h11, h2 = self.net.net.get('h11', 'h2')
-        h11.cmd('ip link add link %s name vlan15 type vlan id 15' % (h11.intfNames()[0]))
-        h11.cmd('ip link set up vlan15')
-        h11.cmd('ip addr add 15.0.0.11/24 dev vlan15')
-        h2.cmd('ip link add link %s name vlan15 type vlan id 15' % (h2.intfNames()[0]))
-        h2.cmd('ip link set up vlan15')
-        h2.cmd('ip addr add 15.0.0.2/24 dev vlan15')
+        self.net.add_vlans({h11: [(15, '15.0.0.11/24')],
+                            h2: [(15, '15.0.0.2/24')]})
         result = h11.cmd('ping -c1 15.0.0.2')
         assert ', 0% packet loss,' in result
 
-        # clean up
-        h11.cmd('ip link del vlan15')
-        h2.cmd('ip link del vlan15')
-        self.net.restart_kytos_clean()
-
     def test_020_create_evc_different_tags_each_side(self):
         payload = {
             "name": "Vlan102_103_Test",
@@ -150,42 +127,32 @@ class TestE2EMefEline(unittest.TestCase):
                 "tag": {"tag_type": 1, "value": 103}
             }
         }
-        api_url = KYTOS_API + '/mef_eline/v2/evc/'
-        response = requests.post(api_url, data=json.dumps(payload), headers={'Content-type': 'application/json'})
+        response = KYTOS.create_evc(payload)
         assert response.status_code == 201
         data = response.json()
         assert 'circuit_id' in data
-        time.sleep(20)
 
         # Each switch must have 3 flows: 01 for LLDP + 02 for the EVC (ingress + egress)
         s1, s2 = self.net.net.get('s1', 's2')
-        flows_s1 = s1.dpctl('dump-flows')
-        flows_s2 = s2.dpctl('dump-flows')
-        assert len(flows_s1.split('\r\n ')) == 3
-        assert len(flows_s2.split('\r\n ')) == 3
+        wait_until(flows_installed(s1, count=3, dl_vlan=102))
+        wait_until(flows_installed(s2, count=3, dl_vlan=103))
+        flows_s1, flows_s2 = self.net.dump_flows('s1', 's2')
+        assert len(flows_s1) == 3
+        assert len(flows_s2) == 3
 
         # make sure it should be dl_vlan instead of vlan_vid
-        assert 'dl_vlan=102' in flows_s1
-        assert 'dl_vlan=103' in flows_s2
+        assert flows_s1.find(dl_vlan=102)
+        assert flows_s2.find(dl_vlan=103)
 
         # Make the final and most important test: connectivity
         # 1. create the vlans and setup the ip addresses
         # 2. try to ping each other
         h11, h2 = self.net.net.get('h11', 'h2')
-        h11.cmd('ip link add link %s name vlan102 type vlan id 102' % (h11.intfNames()[0]))
-        h11.cmd('ip link set up vlan102')
-        h11.cmd('ip addr add 102.103.0.11/24 dev vlan102')
-        h2.cmd('ip link add link %s name vlan103 type vlan id 103' % (h2.intfNames()[0]))
-        h2.cmd('ip link set up vlan103')
-        h2.cmd('ip addr add 102.103.0.2/24 dev vlan103')
+        self.net.add_vlans({h11: [(102, '102.103.0.11/24')],
+                            h2: [(103, '102.103.0.2/24')]})
         result = h11.cmd('ping -c1 102.103.0.2')
         assert ', 0% packet loss,' in result
 
-        # clean up
-        h11.cmd('ip link del vlan102')
-        h2.cmd('ip link del vlan103')
-        self.net.restart_kytos_clean()
-
     def test_020_create_evc_tag_notag(self):
         payload = {
             "name": "Vlan104_Test",
@@ -199,41 +166,33 @@ class TestE2EMefEline(unittest.TestCase):
                 "interface_id": "00:00:00:00:00:00:00:02:1"
             }
         }
-        api_url = KYTOS_API + '/mef_eline/v2/evc/'
-        response = requests.post(api_url, data=json.dumps(payload), headers={'Content-type': 'application/json'})
+        response = KYTOS.create_evc(payload)
         assert response.status_code == 201
         data = response.json()
         assert 'circuit_id' in data
-        time.sleep(20)
 
         # Each switch must have 3 flows: 01 for LLDP + 02 for the EVC (ingress + egress)
         s1, s2 = self.net.net.get('s1', 's2')
-        flows_s1 = s1.dpctl('dump-flows')
-        flows_s2 = s2.dpctl('dump-flows')
-        assert len(flows_s1.split('\r\n ')) == 3
-        assert len(flows_s2.split('\r\n ')) == 3
+        wait_until(flows_installed(s1, count=3, dl_vlan=104))
+        wait_until(flows_installed(s2, count=3))
+        flows_s1, flows_s2 = self.net.dump_flows('s1', 's2')
+        assert len(flows_s1) == 3
+        assert len(flows_s2) == 3
 
         # make sure it should be dl_vlan instead of vlan_vid
-        assert 'dl_vlan=104' in flows_s1
-        assert 'dl_vlan=104' not in flows_s2
+        assert flows_s1.find(dl_vlan=104)
+        assert not flows_s2.find(dl_vlan=104)
 
         # Make the final and most important test: connectivity
         # 1. create the vlans and setup the ip addresses
         # 2. try to ping each other
         h11, h2 = self.net.net.get('h11', 'h2')
-        h11.cmd('ip link add link %s name vlan104 type vlan id 104' % (h11.intfNames()[0]))
-        h11.cmd('ip link set up vlan104')
-        h11.cmd('ip addr add 104.0.0.11/24 dev vlan104')
-        h2.cmd('ip addr add 104.0.0.2/24 dev %s' % (h2.intfNames()[0]))
+        self.net.add_vlans({h11: [(104, '104.0.0.11/24')],
+                            h2: [(None, '104.0.0.2/24')]})
         result = h11.cmd('ping -c1 104.0.0.2')
 
         # make sure it should be dl_vlan instead of vlan_vid
-        assert 'dl_vlan=104' in flows_s1
-
-        # clean up
-        h11.cmd('ip link del vlan104')
-        h2.cmd('ip addr del 104.0.0.2/24 dev %s' % (h2.intfNames()[0]))
-        self.net.restart_kytos_clean()
+        assert flows_s1.find(dl_vlan=104)
 
     def test_020_create_evc_same_vid_different_uni(self):
         # Create circuit 1
@@ -250,13 +209,11 @@ class TestE2EMefEline(unittest.TestCase):
                 "tag": {"tag_type": 1, "value": 110}
             }
         }
-        api_url = KYTOS_API + '/mef_eline/v2/evc/'
-        response = requests.post(api_url, data=json.dumps(payload), headers={'Content-type': 'application/json'})
+        response = KYTOS.create_evc(payload)
         assert response.status_code == 201
         data = response.json()
         assert 'circuit_id' in data
         evc1 = data['circuit_id']
-        time.sleep(20)
 
         # Create circuit 2: same vlan id but in different UNIs
         payload = {
@@ -272,66 +229,52 @@ class TestE2EMefEline(unittest.TestCase):
                 "tag": {"tag_type": 1, "value": 110}
             }
         }
-        api_url = KYTOS_API + '/mef_eline/v2/evc/'
-        response = requests.post(api_url, data=json.dumps(payload), headers={'Content-type': 'application/json'})
+        response = KYTOS.create_evc(payload)
         assert response.status_code == 201
         data = response.json()
         assert 'circuit_id' in data
         evc2 = data['circuit_id']
         assert evc1 != evc2
-        time.sleep(20)
 
         # The switch 1 should have 5 flows: 01 for LLDP + 02 for evc1 + 02 for evc2
         # The switches 2 and 3 should have 3 flows: 01 for LLDP + 02 for each evc
         s1, s2, s3 = self.net.net.get('s1', 's2', 's3')
-        flows_s1 = s1.dpctl('dump-flows')
-        flows_s2 = s2.dpctl('dump-flows')
-        flows_s3 = s3.dpctl('dump-flows')
-        assert len(flows_s1.split('\r\n ')) == 5
-        assert len(flows_s2.split('\r\n ')) == 3
-        assert len(flows_s3.split('\r\n ')) == 3
+        wait_until(flows_installed(s1, count=5, dl_vlan=110))
+        wait_until(flows_installed(s2, count=3, dl_vlan=110))
+        wait_until(flows_installed(s3, count=3, dl_vlan=110))
+        flows_s1, flows_s2, flows_s3 = self.net.dump_flows('s1', 's2', 's3')
+        assert len(flows_s1) == 5
+        assert len(flows_s2) == 3
+        assert len(flows_s3) == 3
 
         # make sure it should be dl_vlan instead of vlan_vid
-        assert 'dl_vlan=110' in flows_s1
-        assert 'dl_vlan=110' in flows_s2
-        assert 'dl_vlan=110' in flows_s3
+        assert flows_s1.find(dl_vlan=110)
+        assert flows_s2.find(dl_vlan=110)
+        assert flows_s3.find(dl_vlan=110)
 
         # Make the final and most important test: connectivity
         # 1. create the vlans and setup the ip addresses
         # 2. try to ping each other
         # for evc 1:
         h11, h2 = self.net.net.get('h11', 'h2')
-        h11.cmd('ip link add link %s name vlan110 type vlan id 110' % (h11.intfNames()[0]))
-        h11.cmd('ip link set up vlan110')
-        h11.cmd('ip addr add 110.0.0.11/24 dev vlan110')
-        h2.cmd('ip link add link %s name vlan110 type vlan id 110' % (h2.intfNames()[0]))
-        h2.cmd('ip link set up vlan110')
-        h2.cmd('ip addr add 110.0.0.2/24 dev vlan110')
-        result = h11.cmd('ping -c1 110.0.0.2')
-        assert ', 0% packet loss,' in result
+        self.net.add_vlans({h11: [(110, '110.0.0.11/24')],
+                            h2: [(110, '110.0.0.2/24')]})
 
         # for evc 2:
         h12, h3 = self.net.net.get('h12', 'h3')
-        h12.cmd('ip link add link %s name vlan110 type vlan id 110' % (h12.intfNames()[0]))
-        h12.cmd('ip link set up vlan110')
-        h12.cmd('ip addr add 110.0.0.12/24 dev vlan110')
-        h3.cmd('ip link add link %s name vlan110 type vlan id 110' % (h3.intfNames()[0]))
-        h3.cmd('ip link set up vlan110')
-        h3.cmd('ip addr add 110.0.0.3/24 dev vlan110')
-        result = h12.cmd('ping -c1 110.0.0.3')
-        assert ', 0% packet loss,' in result
+        self.net.add_vlans({h12: [(110, '110.0.0.12/24')],
+                            h3: [(110, '110.0.0.3/24')]})
 
-        # clean up
-        h11.cmd('ip link del vlan110')
-        h12.cmd('ip link del vlan110')
-        h2.cmd('ip link del vlan110')
-        h3.cmd('ip link del vlan110')
-        self.net.restart_kytos_clean()
+        # each pair reaches its peer and, despite the same vlan and subnet,
+        # not the hosts of the other circuit
+        matrix = ConnectivityMatrix()
+        matrix.add_evc(evc1, [(h11, '110.0.0.11'), (h2, '110.0.0.2')])
+        matrix.add_evc(evc2, [(h12, '110.0.0.12'), (h3, '110.0.0.3')])
+        self.assertEqual(matrix.check().failures(), [])
 
     def test_025_disable_circuit_should_remove_openflow_rules(self):
         # let's suppose that xyz is the circuit id previously created
         # curl -X PATCH -H "Content-Type: application/json" -d '{"enable": false}' http://172.18.0.2:8181/api/kytos/mef_eline/v2/evc/xyz
-        self.net.restart_kytos_clean()
         payload = {
             "name": "Vlan125_Test_evc1",
             "enabled": True,
@@ -345,44 +288,35 @@ class TestE2EMefEline(unittest.TestCase):
                 "tag": {"tag_type": 1, "value": 125}
             }
         }
-        api_url = KYTOS_API + '/mef_eline/v2/evc/'
-        response = requests.post(api_url, data=json.dumps(payload), headers={'Content-type': 'application/json'})
+        response = KYTOS.create_evc(payload)
         assert response.status_code == 201
         data = response.json()
         assert 'circuit_id' in data
         evc1 = data['circuit_id']
-        time.sleep(20)
+        s1, s2 = self.net.net.get('s1', 's2')
+        wait_until(flows_installed(s1, count=3, dl_vlan=125))
+        wait_until(flows_installed(s2, count=3, dl_vlan=125))
 
         # disable the circuit
         payload = {"enable": False}
-        api_url += evc1
-        response = requests.patch(api_url, data=json.dumps(payload), headers={'Content-type': 'application/json'})
+        response = KYTOS.update_evc(evc1, payload)
         assert response.status_code == 200
 
         # Each switch should have only one flow: LLDP
-        s1, s2 = self.net.net.get('s1', 's2')
-        flows_s1 = s1.dpctl('dump-flows')
-        flows_s2 = s2.dpctl('dump-flows')
-        assert len(flows_s1.split('\r\n ')) == 1
-        assert len(flows_s2.split('\r\n ')) == 1
+        wait_until(flows_installed(s1, count=1))
+        wait_until(flows_installed(s2, count=1))
+        flows_s1, flows_s2 = self.net.dump_flows('s1', 's2')
+        assert len(flows_s1) == 1
+        assert len(flows_s2) == 1
 
         # Nodes should not be able to ping each other
         h11, h2 = self.net.net.get('h11', 'h2')
-        h11.cmd('ip link add link %s name vlan125 type vlan id 125' % (h11.intfNames()[0]))
-        h11.cmd('ip link set up vlan125')
-        h11.cmd('ip addr add 125.0.0.11/24 dev vlan125')
-        h2.cmd('ip link add link %s name vlan125 type vlan id 125' % (h2.intfNames()[0]))
-        h2.cmd('ip link set up vlan125')
-        h2.cmd('ip addr add 125.0.0.2/24 dev vlan125')
+        self.net.add_vlans({h11: [(125, '125.0.0.11/24')],
+                            h2: [(125, '125.0.0.2/24')]})
         result = h11.cmd('ping -c1 125.0.0.2')
         assert ', 100% packet loss,' in result
 
-        # clean up
-        h11.cmd('ip link del vlan125')
-        h2.cmd('ip link del vlan125')
-
     def test_025_create_circuit_reusing_same_vlanid_from_previous_evc(self):
-        self.net.restart_kytos_clean()
         payload = {
             "name": "Vlan125_Test_evc1",
             "enabled": True,
@@ -396,20 +330,20 @@ class TestE2EMefEline(unittest.TestCase):
                 "tag": {"tag_type": 1, "value": 125}
             }
         }
-        api_url = KYTOS_API + '/mef_eline/v2/evc/'
-        response = requests.post(api_url, data=json.dumps(payload), headers={'Content-type': 'application/json'})
+        response = KYTOS.create_evc(payload)
         assert response.status_code == 201
         data = response.json()
         assert 'circuit_id' in data
         evc1 = data['circuit_id']
-        time.sleep(20)
+        s1, s2 = self.net.net.get('s1', 's2')
+        wait_until(flows_installed(s1, count=3, dl_vlan=125))
 
         # disable the circuit
         payload = {"enable": False}
-        api_url += evc1
-        response = requests.patch(api_url, data=json.dumps(payload), headers={'Content-type': 'application/json'})
+        response = KYTOS.update_evc(evc1, payload)
         assert response.status_code == 200
-        time.sleep(20)
+        wait_until(flows_installed(s1, count=1))
+        wait_until(flows_installed(s2, count=1))
 
         # try to reuse the vlan id
         payload = {
@@ -425,40 +359,29 @@ class TestE2EMefEline(unittest.TestCase):
                 "tag": {"tag_type": 1, "value": 125}
             }
         }
-        api_url = KYTOS_API + '/mef_eline/v2/evc/'
-        response = requests.post(api_url, data=json.dumps(payload), headers={'Content-type': 'application/json'})
+        response = KYTOS.create_evc(payload)
         assert response.status_code == 201
         data = response.json()
         assert 'circuit_id' in data
         evc2 = data['circuit_id']
         assert evc1 != evc2
-        time.sleep(20)
 
         # The switches should have 3 flows: 01 for LLDP + 02 for each evc
-        s1, s2 = self.net.net.get('s1', 's2')
-        flows_s1 = s1.dpctl('dump-flows')
-        flows_s2 = s2.dpctl('dump-flows')
+        wait_until(flows_installed(s1, count=3, dl_vlan=125))
+        wait_until(flows_installed(s2, count=3, dl_vlan=125))
+        flows_s1, flows_s2 = self.net.dump_flows('s1', 's2')
         print(flows_s1)
         print(flows_s2)
-        assert len(flows_s1.split('\r\n ')) == 3
-        assert len(flows_s2.split('\r\n ')) == 3
+        assert len(flows_s1) == 3
+        assert len(flows_s2) == 3
 
         # Nodes should be able to ping each other
         h11, h2 = self.net.net.get('h11', 'h2')
-        h11.cmd('ip link add link %s name vlan125 type vlan id 125' % (h11.intfNames()[0]))
-        h11.cmd('ip link set up vlan125')
-        h11.cmd('ip addr add 125.0.0.11/24 dev vlan125')
-        h2.cmd('ip link add link %s name vlan125 type vlan id 125' % (h2.intfNames()[0]))
-        h2.cmd('ip link set up vlan125')
-        h2.cmd('ip addr add 125.0.0.2/24 dev vlan125')
+        self.net.add_vlans({h11: [(125, '125.0.0.11/24')],
+                            h2: [(125, '125.0.0.2/24')]})
         result = h11.cmd('ping -c1 125.0.0.2')
         assert ', 0% packet loss,' in result
 
-        # clean up
-        h11.cmd('ip link del vlan125')
-        h2.cmd('ip link del vlan125')
-        self.net.restart_kytos_clean()
-
     def test_030_patch_evc_new_name(self):
         # TODO
         assert True
@@ -1,26 +1,32 @@
 import unittest
-import requests
-from tests.helpers import NetworkTest
+from tests.helpers import (NETWORKS, CONTROLLER, KYTOS, BENCHMARK,
+                           collect_flows, wait_until, flows_installed, env_list, percentiles,
+                           save_results, FailoverProbe, FAILOVER_SLA)
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import os
 import time
 import json
 
-CONTROLLER = '127.0.0.1'
-KYTOS_API = 'http://%s:8181/api/kytos' % (CONTROLLER)
+# size of the bulk provisioning benchmark
+EVC_COUNT = env_list('E2E_EVC_COUNT', '300')[0]
+EVC_CONCURRENCY = env_list('E2E_EVC_CONCURRENCY', '8')[0]
+EVC_VLAN_START = 1
 
 
 class TestE2EMefEline(unittest.TestCase):
     net = None
+    topo_name = 'DanielaTopo'
 
     @classmethod
     def setUpClass(cls):
-        cls.net = NetworkTest(CONTROLLER, topo_name='DanielaTopo')
-        cls.net.start()
+        cls.net = NETWORKS.get(CONTROLLER, cls.topo_name)
         cls.net.restart_kytos_clean()
 
-    @classmethod
-    def tearDownClass(cls):
-        cls.net.stop()
+    def setUp(self):
+        # the network is shared, so a failing test must not leave its EVCs,
+        # links down or host VLANs to the next one
+        self.addCleanup(self.net.reset)
 
     def test_on_primary_path_fail_should_migrate_to_backup(self):
         # TODO Check for false positives between uni_a switch 1 and uni_z switch 3 instead of switch 2
@@ -58,43 +64,53 @@ class TestE2EMefEline(unittest.TestCase):
             ]
         }
 
-        api_url = KYTOS_API + '/mef_eline/v2/evc/'
-        response = requests.post(api_url, json=json.dumps(payload))
+        response = KYTOS.post('/mef_eline/v2/evc/', json=json.dumps(payload))
         assert response.status_code == 200
 
-        time.sleep(10)
+        s1, s2, s3, s4 = self.net.net.get('s1', 's2', 's3', 's4')
+        wait_until(flows_installed(s1, count=3, dl_vlan=101))
+
+        h1, h3 = self.net.net.get('h1', 'h3')
+        self.net.add_vlans({h1: [(101, '101.0.0.1/24')],
+                            h3: [(101, '101.0.0.3/24')]})
+
+        # a steady stream between the UNIs tells how long the traffic is lost
+        probe = FailoverProbe(h1, h3, '101.0.0.3', name=self.id())
+        # a failure must not leave the probe holding its port on h1 and h3
+        self.addCleanup(probe.stop)
+        probe.start()
 
         """ Command to up/down links to test if back-up path is taken with the following command: """
+        probe.mark('failover')
         self.net.net.configLinkStatus('s1', 's2', 'down')
 
         """Check on the virtual switches directly for flows.
         Each switch that the flow traveled must have 3 flows:
         01 for LLDP + 02 for the EVC (ingress + egress)"""
-        s1, s2, s3, s4 = self.net.net.get('s1', 's2', 's3', 's4')
-        flows_s1 = s1.dpctl('dump-flows')
-        flows_s2 = s2.dpctl('dump-flows')
-        flows_s3 = s3.dpctl('dump-flows')
-        flows_s4 = s4.dpctl('dump-flows')
-        assert len(flows_s1.split('\r\n ')) == 3
-        assert len(flows_s2.split('\r\n ')) == 3
-        assert len(flows_s3.split('\r\n ')) == 3
-        assert len(flows_s4.split('\r\n ')) == 3
+        wait_until(flows_installed(s4, count=3))
+        wait_until(flows_installed(s3, count=3))
+        wait_until(probe.delivering(time.monotonic()))
+        flows_s1, flows_s2, flows_s3, flows_s4 = self.net.dump_flows('s1', 's2', 's3', 's4')
+        assert len(flows_s1) == 3
+        assert len(flows_s2) == 3
+        assert len(flows_s3) == 3
+        assert len(flows_s4) == 3
 
         # Nodes should be able to ping each other
-        h1, h3 = self.net.net.get('h1', 'h3')
-        h1.cmd('ip link add link %s name vlan101 type vlan id 101' % (h1.intfNames()[0]))
-        h1.cmd('ip link set up vlan101')
-        h1.cmd('ip addr add 101.0.0.1/24 dev vlan101')
-        h3.cmd('ip link add link %s name vlan101 type vlan id 101' % (h3.intfNames()[0]))
-        h3.cmd('ip link set up vlan101')
-        h3.cmd('ip addr add 101.0.0.3/24 dev vlan101')
         result = h1.cmd('ping -c1 101.0.0.3')
         assert ', 0% packet loss,' in result
 
-        # clean up
-        h1.cmd('ip link del vlan101')
-        h3.cmd('ip link del vlan101')
-        self.net.restart_kytos_clean()
+        # once the primary path is back the circuit returns to it
+        probe.mark('failback')
+        self.net.net.configLinkStatus('s1', 's2', 'up')
+        wait_until(flows_installed(s4, count=1))
+        wait_until(flows_installed(s1, count=3, dl_vlan=101))
+        wait_until(probe.delivering(time.monotonic()))
+
+        report = probe.stop()
+        if FAILOVER_SLA:
+            for event in report['events']:
+                self.assertLessEqual(event['outage'], FAILOVER_SLA, event['event'])
 
     def test_on_primary_path_fail_should_migrate_to_backup_with_dynamic_discovery_enabled(self):
         """ When the primary_path is down and backup_path exists and is UP
@@ -134,43 +150,32 @@ class TestE2EMefEline(unittest.TestCase):
             "enabled": "true"
         }
 
-        api_url = KYTOS_API + '/mef_eline/v2/evc/'
-        response = requests.post(api_url, json=payload)
+        response = KYTOS.create_evc(payload)
         assert response.status_code == 200
 
-        time.sleep(10)
+        s1, s2, s3, s4 = self.net.net.get('s1', 's2', 's3', 's4')
+        wait_until(flows_installed(s1, count=3, dl_vlan=101))
 
         # Command to disable links to test if back-up path is taken with the following command:
         self.net.net.configLinkStatus('s1', 's2', 'down')
 
         # Check on the virtual switches directly for flows. Each switch that the flow traveled must have 3 flows:
         # 01 for LLDP + 02 for the EVC (ingress + egress)
-        s1, s2, s3, s4 = self.net.net.get('s1', 's2', 's3', 's4')
-        flows_s1 = s1.dpctl('dump-flows')
-        flows_s2 = s2.dpctl('dump-flows')
-        flows_s3 = s3.dpctl('dump-flows')
-        flows_s4 = s4.dpctl('dump-flows')
-        assert len(flows_s1.split('\r\n ')) == 3
-        assert len(flows_s2.split('\r\n ')) == 3
-        assert len(flows_s3.split('\r\n ')) == 3
-        assert len(flows_s4.split('\r\n ')) == 3
+        wait_until(flows_installed(s4, count=3))
+        wait_until(flows_installed(s3, count=3))
+        flows_s1, flows_s2, flows_s3, flows_s4 = self.net.dump_flows('s1', 's2', 's3', 's4')
+        assert len(flows_s1) == 3
+        assert len(flows_s2) == 3
+        assert len(flows_s3) == 3
+        assert len(flows_s4) == 3
 
         # Nodes should be able to ping each other
         h1, h3 = self.net.net.get('h1', 'h3')
-        h1.cmd('ip link add link %s name vlan101 type vlan id 101' % (h1.intfNames()[0]))
-        h1.cmd('ip link set up vlan101')
-        h1.cmd('ip addr add 101.0.0.1/24 dev vlan101')
-        h3.cmd('ip link add link %s name vlan101 type vlan id 101' % (h3.intfNames()[0]))
-        h3.cmd('ip link set up vlan101')
-        h3.cmd('ip addr add 101.0.0.3/24 dev vlan101')
+        self.net.add_vlans({h1: [(101, '101.0.0.1/24')],
+                            h3: [(101, '101.0.0.3/24')]})
         result = h1.cmd('ping -c1 101.0.0.3')
         assert ', 0% packet loss,' in result
 
-        # clean up
-        h1.cmd('ip link del vlan101')
-        h3.cmd('ip link del vlan101')
-        self.net.restart_kytos_clean()
-
     def evc_inter_switch_without_VLAN_tag(self):
 
         # evc_req
@@ -199,115 +204,115 @@ class TestE2EMefEline(unittest.TestCase):
             ]
         }
 
-        api_url = KYTOS_API + '/mef_eline/v2/evc/'
-        response = requests.post(api_url, json=json.dumps(payload))
+        response = KYTOS.post('/mef_eline/v2/evc/', json=json.dumps(payload))
         self.assertEqual(response.status_code, 200)
 
         # Check on the virtual switches directly for flows. Each switch that the flow traveled must have 3 flows:
         # 01 for LLDP + 02 for the EVC (ingress + egress)
         s1, s2, s3, s4 = self.net.net.get('s1', 's2', 's3', 's4')
-        flows_s1 = s1.dpctl('dump-flows')
-        flows_s2 = s2.dpctl('dump-flows')
-        flows_s3 = s3.dpctl('dump-flows')
-        flows_s4 = s4.dpctl('dump-flows')
-        assert len(flows_s1.split('\r\n ')) == 3
-        assert len(flows_s2.split('\r\n ')) == 3
-        assert len(flows_s3.split('\r\n ')) == 3
-        assert len(flows_s4.split('\r\n ')) == 3
+        flows_s1, flows_s2, flows_s3, flows_s4 = self.net.dump_flows('s1', 's2', 's3', 's4')
+        assert len(flows_s1) == 3
+        assert len(flows_s2) == 3
+        assert len(flows_s3) == 3
+        assert len(flows_s4) == 3
 
         # Nodes should be able to ping each other
         h1, h3 = self.net.net.get('h1', 'h3')
-        h1.cmd('ip link add link %s name vlan101 type vlan id 101' % (h1.intfNames()[0]))
-        h1.cmd('ip link set up vlan101')
-        h1.cmd('ip addr add 101.0.0.1/24 dev vlan101')
-        h3.cmd('ip link add link %s name vlan101 type vlan id 101' % (h3.intfNames()[0]))
-        h3.cmd('ip link set up vlan101')
-        h3.cmd('ip addr add 101.0.0.3/24 dev vlan101')
+        self.net.add_vlans({h1: [(101, '101.0.0.1/24')],
+                            h3: [(101, '101.0.0.3/24')]})
         result = h1.cmd('ping -c1 101.0.0.3')
         assert ', 0% packet loss,' in result
 
-        # clean up
-        h1.cmd('ip link del vlan101')
-        h3.cmd('ip link del vlan101')
-        self.net.restart_kytos_clean()
-
-    def create_many_evc_at_once_and_verify_proper_installation(self):
-        # TODO Create many EVC at once and check if they are all working (e.g., 300 EVCs in the same file)
-
-        url = "http://localhost:8181/api/kytos/mef_eline/v2/evc/"
-        vlan_start = 1
-        vlan_end = 200
-
-        vlan = vlan_start
-        while vlan <= vlan_end:
-            evc = {
-                "Content-Type": "application/json",
-                "cache-control": "no-cache",
-                "name": "evc_%s" % vlan,
-                "uni_a": {
-                    "interface_id": "00:00:00:00:00:00:00:01:1",
-                    "tag": {
-                        "tag_type": 1,
-                        "value": vlan
-                    }
-                },
-                "uni_z": {
-                    "interface_id": "00:00:00:00:00:00:00:02:1",
-                    "tag": {
-                        "tag_type": 1,
-                        "value": vlan
-                    }
-                },
-                "current_path": [],
-                "primary_path": [
-                    {"endpoint_a": {"id": "00:00:00:00:00:00:00:01:3"},
-                     "endpoint_b": {"id": "00:00:00:00:00:00:00:02:3"}}
-                ],
-                "backup_path": [
-                    {"endpoint_a": {"id": "00:00:00:00:00:00:00:01:4"},
-                     "endpoint_b": {"id": "00:00:00:00:00:00:00:04:4"}},
-                    {"endpoint_a": {"id": "00:00:00:00:00:00:00:04:3"},
-                     "endpoint_b": {"id": "00:00:00:00:00:00:00:03:4"}},
-                    {"endpoint_a": {"id": "00:00:00:00:00:00:00:03:1"},
-                     "endpoint_b": {"id": "00:00:00:00:00:00:00:02:4"}}
-                ],
-                "dynamic_backup_path": "true",
-                "active": "true",
-                "enabled": "true"
-            }
-
-        api_url = KYTOS_API + '/mef_eline/v2/evc/'
-        response = requests.post(api_url, json=json.dumps(evc))
-        self.assertEqual(response.status_code, 200)
-
-        request = requests.post(url=url, json=evc)
-        circuit_id = json.loads(request.content.decode("utf-8"))
-
-        if isinstance(circuit_id, dict):
-            print("circuit_id %s created" % circuit_id['circuit_id'])
+    def evc_payload(self, vlan):
+        return {
+            "name": "evc_%s" % vlan,
+            "enabled": True,
+            "dynamic_backup_path": True,
+            "uni_a": {
+                "interface_id": "00:00:00:00:00:00:00:01:1",
+                "tag": {
+                    "tag_type": 1,
+                    "value": vlan
+                }
+            },
+            "uni_z": {
+                "interface_id": "00:00:00:00:00:00:00:02:1",
+                "tag": {
+                    "tag_type": 1,
+                    "value": vlan
+                }
+            },
+            "primary_path": [
+                {"endpoint_a": {"id": "00:00:00:00:00:00:00:01:3"},
+                 "endpoint_b": {"id": "00:00:00:00:00:00:00:02:3"}}
+            ],
+            "backup_path": [
+                {"endpoint_a": {"id": "00:00:00:00:00:00:00:01:4"},
+                 "endpoint_b": {"id": "00:00:00:00:00:00:00:04:4"}},
+                {"endpoint_a": {"id": "00:00:00:00:00:00:00:04:3"},
+                 "endpoint_b": {"id": "00:00:00:00:00:00:00:03:4"}},
+                {"endpoint_a": {"id": "00:00:00:00:00:00:00:03:1"},
+                 "endpoint_b": {"id": "00:00:00:00:00:00:00:02:4"}}
+            ]
+        }
 
-        # Check if vlan_id is inside the dump-flows. Each switch that the flow traveled must have 3 flows:
-        # 01 for LLDP + 02 for the EVC (ingress + egress)
-        s1, s2, s3, s4 = self.net.net.get('s1', 's2', 's3', 's4')
-        flows_s1 = s1.dpctl('dump-flows')
-        flows_s2 = s2.dpctl('dump-flows')
-        flows_s3 = s3.dpctl('dump-flows')
-        flows_s4 = s4.dpctl('dump-flows')
-        assert len(flows_s1.split('\r\n ')) == 3
-        assert len(flows_s2.split('\r\n ')) == 3
-        assert len(flows_s3.split('\r\n ')) == 3
-        assert len(flows_s4.split('\r\n ')) == 3
-
-        # Clean up: Delete all EVCs & re-start Kytos fresh
-        print("Removing all EVCs ...")
-        evcs = requests.get(url)
-        evcs = json.loads(evcs.content.decode("utf-8"))
-        for evc in evcs:
-            if evcs[evc]['enabled']:
-                requests.delete(url=url + evc)
-        print("... Done!")
-
-        self.net.restart_kytos_clean()
+    @unittest.skipUnless(BENCHMARK, 'set E2E_BENCHMARK=1 to run the benchmarks')
+    def test_create_many_evc_at_once_and_verify_proper_installation(self):
+        """ Create many EVCs concurrently, each on its own VLAN, and measure
+            how long the API and the switches take to provision them. """
+        vlans = range(EVC_VLAN_START, EVC_VLAN_START + EVC_COUNT)
+        wanted = set(vlans)
+        posted = {}
+        seen = {}
+
+        def create(vlan):
+            sent = time.monotonic()
+            response = KYTOS.create_evc(self.evc_payload(vlan))
+            posted[vlan] = (sent, time.monotonic() - sent, response.status_code)
+
+        def watch_flows(bridges, done):
+            # an EVC is provisioned once its UNI flow is on both switches;
+            # the flows between them match the S-VLANs, which mef_eline
+            # also allocates from 1 upward
+            while not done.is_set() and not wanted <= seen.keys():
+                now = time.monotonic()
+                found = wanted
+                for table in collect_flows(bridges):
+                    found = found & set(entry.match.get('dl_vlan')
+                                        for entry in table.find(in_port=1))
+                for vlan in found:
+                    seen.setdefault(vlan, now)
+                time.sleep(0.05)
+
+        s1, s2 = self.net.net.get('s1', 's2')
+        done = threading.Event()
+        watcher = threading.Thread(target=watch_flows, args=([s1.name, s2.name], done))
+        watcher.start()
+        start = time.monotonic()
+        try:
+            with ThreadPoolExecutor(max_workers=EVC_CONCURRENCY) as executor:
+                list(executor.map(create, vlans))
+            posted_all = time.monotonic() - start
+            rejected = {vlan: status for vlan, (sent, latency, status) in posted.items()
+                        if status != 201}
+            self.assertEqual(rejected, {})
+            wait_until(lambda: wanted <= seen.keys(), name='evcs provisioned',
+                       timeout=60 + EVC_COUNT / 5.0)
+        finally:
+            done.set()
+            watcher.join()
+        provisioned_all = max(seen.values()) - start
+
+        save_results('evc_provisioning_benchmark', {
+            'evcs': EVC_COUNT,
+            'concurrency': EVC_CONCURRENCY,
+            'post_latency': percentiles([latency for sent, latency, status in posted.values()]),
+            'provisioning_latency': percentiles([seen[vlan] - posted[vlan][0] for vlan in vlans]),
+            'posted_all': posted_all,
+            'provisioned_all': provisioned_all,
+            'posts_per_second': EVC_COUNT / posted_all,
+            'evcs_per_second': EVC_COUNT / provisioned_all,
+        })
 
     def evc_intra_switch_without_VLAN_tag(self):
 
@@ -332,23 +337,16 @@ class TestE2EMefEline(unittest.TestCase):
             ]
         }
 
-        api_url = KYTOS_API + '/mef_eline/v2/evc/'
-        response = requests.post(api_url, json=json.dumps(payload))
+        response = KYTOS.post('/mef_eline/v2/evc/', json=json.dumps(payload))
         self.assertEqual(response.status_code, 200)
 
         # Check on the virtual switches directly for flows. Each switch that the flow traveled must have 3 flows:
         # 01 for LLDP + 02 for the EVC (ingress + egress)
         s1, s2, s3, s4 = self.net.net.get('s1', 's2', 's3', 's4')
-        flows_s1 = s1.dpctl('dump-flows')
-        flows_s2 = s2.dpctl('dump-flows')
-        flows_s3 = s3.dpctl('dump-flows')
-        flows_s4 = s4.dpctl('dump-flows')
-        assert len(flows_s1.split('\r\n ')) == 3
-        assert len(flows_s2.split('\r\n ')) == 3
-        assert len(flows_s3.split('\r\n ')) == 3
-        assert len(flows_s4.split('\r\n ')) == 3
+        flows_s1, flows_s2, flows_s3, flows_s4 = self.net.dump_flows('s1', 's2', 's3', 's4')
+        assert len(flows_s1) == 3
+        assert len(flows_s2) == 3
+        assert len(flows_s3) == 3
+        assert len(flows_s4) == 3
 
         #TODO: assert that evc was installed by pinging, and look for verification of the circuit id been created
-
-        # clean up
-        self.net.restart_kytos_clean()
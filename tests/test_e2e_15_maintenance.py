@@ -1,27 +1,32 @@
 import unittest
-import requests
-from tests.helpers import NetworkTest
+from tests.helpers import (NETWORKS, CONTROLLER, KYTOS, BENCHMARK, MAINTENANCE_WINDOWS,
+                           FlowTable, FlowCountWatcher, wait_until, flows_installed,
+                           env_list, window_report)
+import math
 import os
 import time
-import json
-from datetime import datetime, timedelta
-
-CONTROLLER = '127.0.0.1'
-KYTOS_API = 'http://%s:8181/api/kytos' % (CONTROLLER)
+from datetime import datetime
 
 TIME_FMT = "%Y-%m-%dT%H:%M:%S+0000"
 
+# seconds from the creation of a window to its start, and its duration
+MW_LEAD = env_list('E2E_MW_LEAD', '5')[0]
+MW_DURATION = env_list('E2E_MW_DURATION', '15')[0]
+# EVCs moved at once by the overlapping windows of the benchmark
+MW_EVCS = env_list('E2E_MW_EVCS', '100')[0]
+
 class TestE2EMaintenance(unittest.TestCase):
     net = None
+    topo_name = 'RingTopo'
     @classmethod
     def setUpClass(cls):
-        cls.net = NetworkTest(CONTROLLER)
-        cls.net.start()
+        cls.net = NETWORKS.get(CONTROLLER, cls.topo_name)
         cls.net.restart_kytos_clean()
 
-    @classmethod
-    def tearDownClass(cls):
-        cls.net.stop()
+    def setUp(self):
+        # the network is shared, so a failing test must not leave its EVCs,
+        # links down or host VLANs to the next one
+        self.addCleanup(self.net.reset)
 
     def create_circuit(self, vlan_id):
         payload = {
@@ -49,8 +54,28 @@ class TestE2EMaintenance(unittest.TestCase):
                  "endpoint_b": {"interface_id": "00:00:00:00:00:00:00:03:2"}}
             ],
         }
-        api_url = KYTOS_API+'/mef_eline/v2/evc/'
-        response = requests.post(api_url, data=json.dumps(payload), headers={'Content-type': 'application/json'})
+        response = KYTOS.create_evc(payload)
+
+    def create_window(self, items, start_in=MW_LEAD, duration=MW_DURATION):
+        """Create a maintenance window on `items` and return its id and its
+        schedule in time.monotonic()."""
+        created = time.monotonic()
+        # the API takes whole seconds: start on a second boundary
+        start = math.ceil(time.time() + start_in)
+        end = start + duration
+        payload = {
+            "description": "my MW on %s" % (', '.join(items)),
+            "start": datetime.utcfromtimestamp(start).strftime(TIME_FMT),
+            "end": datetime.utcfromtimestamp(end).strftime(TIME_FMT),
+            "items": items
+        }
+        response = KYTOS.create_maintenance(payload)
+        assert response.status_code == 201
+        data = response.json()
+        assert 'mw_id' in data
+        offset = time.time() - time.monotonic()
+        return {'id': data['mw_id'], 'created': created,
+                'start': start - offset, 'end': end - offset}
 
     def test_001_list_mw_should_be_empty(self):
         """Test if list maintenances is empty at the begin ."""
@@ -58,63 +83,78 @@ class TestE2EMaintenance(unittest.TestCase):
 
     def test_010_create_mw_on_switch_should_move_evc(self):
         self.create_circuit(100)
+        s1, s2, s3 = self.net.net.get( 's1', 's2', 's3' )
+        # the UNI tag is on s1 and s3 only, s2 carries the link S-VLANs
+        wait_until(flows_installed(s1, count=3, dl_vlan=100))
+        wait_until(flows_installed(s3, count=3, dl_vlan=100))
+        wait_until(flows_installed(s2, count=3))
 
-        start = datetime.now() + timedelta(seconds=60)
-        end = start + timedelta(seconds=60)
-        payload = {
-            "description": "my MW on switch 2",
-            "start": start.strftime(TIME_FMT),
-            "end": end.strftime(TIME_FMT),
-            "items": [
-                "00:00:00:00:00:00:02"
-            ]
-        }
-        api_url = KYTOS_API+'/maintenance'
-        response = requests.post(api_url, data=json.dumps(payload), headers={'Content-type': 'application/json'})
-        assert response.status_code == 201
-        data = response.json()
-        assert 'mw_id' in data
+        watcher = FlowCountWatcher([s2]).start()
+        # a failure must not leave it dumping the flows of s2 for the session
+        self.addCleanup(watcher.stop)
+        window = self.create_window(["00:00:00:00:00:00:00:02"])
 
-        # wait the MW to begin
-        time.sleep(60)
+        # wait the MW to begin and the EVC to move away from switch 2
+        wait_until(flows_installed(s2, count=1), timeout=MW_LEAD + 30)
 
         # switch 1 and 3 should have 3 flows, switch 2 should have only 1 flow
-        s1, s2, s3 = self.net.net.get( 's1', 's2', 's3' )
-        flows_s1 = s1.dpctl('dump-flows')
-        flows_s2 = s2.dpctl('dump-flows')
-        flows_s3 = s3.dpctl('dump-flows')
-        assert len(flows_s1.split('\r\n ')) == 3
-        assert len(flows_s3.split('\r\n ')) == 3
-        assert len(flows_s2.split('\r\n ')) == 1
+        flows_s1, flows_s2, flows_s3 = self.net.dump_flows('s1', 's2', 's3')
+        assert len(flows_s1) == 3
+        assert len(flows_s3) == 3
+        assert len(flows_s2) == 1
 
         # make sure it should be dl_vlan instead of vlan_vid
-        assert 'dl_vlan=100' in flows_s1
-        assert 'dl_vlan=100' in flows_s3
-        assert 'dl_vlan=100' not in flows_s2
+        assert flows_s1.find(dl_vlan=100)
+        assert flows_s3.find(dl_vlan=100)
+        assert not flows_s2.find(dl_vlan=100)
 
         # Make the final and most important test: connectivity
         # 1. create the vlans and setup the ip addresses
         # 2. try to ping each other
         h11, h3 = self.net.net.get( 'h11', 'h3' )
-        h11.cmd('ip link add link %s name vlan100 type vlan id 100' % (h11.intfNames()[0]))
-        h11.cmd('ip link set up vlan100')
-        h11.cmd('ip addr add 100.0.0.11/24 dev vlan100')
-        h3.cmd('ip link add link %s name vlan100 type vlan id 100' % (h2.intfNames()[0]))
-        h3.cmd('ip link set up vlan100')
-        h3.cmd('ip addr add 100.0.0.2/24 dev vlan100')
+        self.net.add_vlans({h11: [(100, '100.0.0.11/24')],
+                            h3: [(100, '100.0.0.2/24')]})
         result = h11.cmd( 'ping -c1 100.0.0.2' )
         assert ', 0% packet loss,' in result
 
-        # wait more 65s to the MW to finish and check if the path returned to pass through sw2
-        time.sleep(65)
+        # wait the MW to finish and check if the path returned to pass through sw2
+        wait_until(flows_installed(s2, count=3), timeout=MW_DURATION + 30)
+        watcher.stop()
+        MAINTENANCE_WINDOWS.append(window_report(watcher, s2, window, 2))
 
-        flows_s2 = s2.dpctl('dump-flows')
-        assert len(flows_s2.split('\r\n ')) == 3
+        flows_s2 = FlowTable.from_switch(s2)
+        assert len(flows_s2) == 3
         result = h11.cmd( 'ping -c1 100.0.0.2' )
         assert ', 0% packet loss,' in result
 
-        # clean up
-        h11.cmd('ip link del vlan100')
-        h3.cmd('ip link del vlan100')
-        self.net.restart_kytos_clean()
-
+    @unittest.skipUnless(BENCHMARK, 'set E2E_BENCHMARK=1 to run the benchmarks')
+    def test_020_overlapping_mw_on_switch_should_move_many_evcs(self):
+        """ How long do overlapping windows take to move many EVCs away from
+        a switch and back? """
+        s2 = self.net.net.get('s2')
+        for vlan_id in range(200, 200 + MW_EVCS):
+            self.create_circuit(vlan_id)
+        # two flows of each EVC and the LLDP one
+        flows = 2 * MW_EVCS
+        wait_until(flows_installed(s2, count=flows + 1), timeout=60 + MW_EVCS)
+
+        # the second window starts halfway through the first and ends after it
+        watcher = FlowCountWatcher([s2]).start()
+        # a failure must not leave it dumping the flows of s2 for the session
+        self.addCleanup(watcher.stop)
+        first = self.create_window(["00:00:00:00:00:00:00:02"])
+        second = self.create_window(["00:00:00:00:00:00:00:02"],
+                                    start_in=first['start'] - time.monotonic() + MW_DURATION / 2.0)
+        second_end = second['end']
+        wait_until(lambda: time.monotonic() > second_end and watcher.count(s2) == flows,
+                   name='evcs back on s2', timeout=2 * MW_DURATION + MW_LEAD + 60 + MW_EVCS)
+        watcher.stop()
+
+        # the EVCs should only come back once no window is running
+        report = window_report(watcher, s2, {'created': first['created'],
+                                             'start': first['start'], 'end': second['end']},
+                               flows)
+        report['windows'] = [window_report(watcher, s2, window, flows) for window in (first, second)]
+        MAINTENANCE_WINDOWS.append(report)
+        assert report['start']['migrated'] is not None
+        assert report['end']['jitter'] >= 0
@@ -1,43 +1,48 @@
 import unittest
-import requests
-from tests.helpers import NetworkTest
+from tests.helpers import (NETWORKS, CONTROLLER, KYTOS, CounterSampler, host_counters,
+                           wait_until)
 import os
-import time
-import json
-
-CONTROLLER = '127.0.0.1'
-KYTOS_API = 'http://%s:8181/api/kytos' % (CONTROLLER)
 
 
 class TestE2EOfLLDP(unittest.TestCase):
     net = None
+    topo_name = 'RingTopo'
 
     @classmethod
     def setUpClass(cls):
-        cls.net = NetworkTest(CONTROLLER)
-        cls.net.start()
+        cls.net = NETWORKS.get(CONTROLLER, cls.topo_name)
         cls.net.restart_kytos_clean()
 
-    @classmethod
-    def tearDownClass(cls):
-        cls.net.stop()
-
     def get_iface_stats_rx_pkt(self, host):
-        rx_pkts = host.cmd("ip -s link show dev %s | grep RX: -A 1 | tail -n1 | awk '{print $2}'" % (host.intfNames()[0]))
-        return int(rx_pkts.strip())
+        return host_counters(host)[host.intfNames()[0]]['rx_packets']
+
+    def rx_pkt_increased(self, *hosts):
+        """Condition: every host received packets since it was created."""
+        before = {host: self.get_iface_stats_rx_pkt(host) for host in hosts}
+        def condition():
+            return all(self.get_iface_stats_rx_pkt(host) > rx_pkts
+                       for host, rx_pkts in before.items())
+        condition.__name__ = 'rx packets increased'
+        return condition
+
+    def lldp_interfaces_are(self, expected_interfaces):
+        """Condition: of_lldp lists exactly `expected_interfaces`."""
+        def condition():
+            response = KYTOS.lldp_interfaces()
+            return set(response.json()["interfaces"]) == set(expected_interfaces)
+        condition.__name__ = 'lldp interfaces'
+        return condition
 
     def disable_all_of_lldp(self):
-        api_url = KYTOS_API + '/of_lldp/v1/interfaces/'
-        response = requests.get(api_url)
+        response = KYTOS.lldp_interfaces()
         data = response.json()
         all_interfaces = data.get("interfaces", [])
-        response = requests.post(api_url+'disable/', json={"interfaces": all_interfaces})
+        response = KYTOS.disable_lldp(all_interfaces)
         assert response.status_code == 200
 
     def test_001_list_interfaces_with_lldp(self):
         """ List interfaces with OF LLDP. """
-        api_url = KYTOS_API + '/of_lldp/v1/interfaces/'
-        response = requests.get(api_url)
+        response = KYTOS.lldp_interfaces()
         assert response.status_code == 200
         data = response.json()
         assert "interfaces" in data
@@ -56,20 +61,7 @@ class TestE2EOfLLDP(unittest.TestCase):
 
         # make sure the interfaces are actually receiving LLDP
         h11, h12, h2, h3 = self.net.net.get('h11', 'h12', 'h2', 'h3')
-        rx_stats_h11 = self.get_iface_stats_rx_pkt(h11)
-        rx_stats_h12 = self.get_iface_stats_rx_pkt(h12)
-        rx_stats_h2  = self.get_iface_stats_rx_pkt(h2)
-        rx_stats_h3  = self.get_iface_stats_rx_pkt(h3)
-        time.sleep(10)
-        rx_stats_h11_2 = self.get_iface_stats_rx_pkt(h11)
-        rx_stats_h12_2 = self.get_iface_stats_rx_pkt(h12)
-        rx_stats_h2_2  = self.get_iface_stats_rx_pkt(h2)
-        rx_stats_h3_2  = self.get_iface_stats_rx_pkt(h3)
-
-        assert rx_stats_h11_2 > rx_stats_h11 \
-                and rx_stats_h12_2 > rx_stats_h12 \
-                and rx_stats_h2_2 > rx_stats_h2 \
-                and rx_stats_h3_2 > rx_stats_h3
+        wait_until(self.rx_pkt_increased(h11, h12, h2, h3), timeout=10)
 
     def test_010_disable_of_lldp(self):
         """ Test if the disabling OF LLDP in an interface worked properly. """
@@ -88,45 +80,35 @@ class TestE2EOfLLDP(unittest.TestCase):
                 "00:00:00:00:00:00:00:03:2", "00:00:00:00:00:00:00:03:3"
         ]
 
-        api_url = KYTOS_API + '/of_lldp/v1/interfaces/disable/'
-        response = requests.post(api_url, json=payload)
+        response = KYTOS.disable_lldp(payload["interfaces"])
         assert response.status_code == 200
 
-        api_url = KYTOS_API + '/of_lldp/v1/interfaces/'
-        response = requests.get(api_url)
+        response = KYTOS.lldp_interfaces()
         data = response.json()
         assert set(data["interfaces"]) == set(expected_interfaces)
 
-        h11, h12, h2, h3 = self.net.net.get('h11', 'h12', 'h2', 'h3')
-        rx_stats_h11 = self.get_iface_stats_rx_pkt(h11)
-        rx_stats_h12 = self.get_iface_stats_rx_pkt(h12)
-        rx_stats_h2  = self.get_iface_stats_rx_pkt(h2)
-        rx_stats_h3  = self.get_iface_stats_rx_pkt(h3)
-        time.sleep(10)
-        rx_stats_h11_2 = self.get_iface_stats_rx_pkt(h11)
-        rx_stats_h12_2 = self.get_iface_stats_rx_pkt(h12)
-        rx_stats_h2_2  = self.get_iface_stats_rx_pkt(h2)
-        rx_stats_h3_2  = self.get_iface_stats_rx_pkt(h3)
-
-        assert rx_stats_h11_2 == rx_stats_h11 \
-                and rx_stats_h12_2 == rx_stats_h12 \
-                and rx_stats_h2_2 == rx_stats_h2 \
-                and rx_stats_h3_2 == rx_stats_h3
+        # no packet during one and a half polling interval
+        polling_time = KYTOS.lldp_polling_time().json()["polling_time"]
+        hosts = self.net.net.get('h11', 'h12', 'h2', 'h3')
+        sampler = CounterSampler(hosts)
+        sampler.run(duration=1.5 * polling_time)
+        assert [sampler.rate(host)['count'] for host in hosts] == [0, 0, 0, 0]
 
         # restart kytos and check if lldp remains disabled
         self.net.start_controller(clean_config=False)
         self.net.wait_switches_connect()
-        time.sleep(5)
+        wait_until(self.lldp_interfaces_are(expected_interfaces), timeout=10)
 
-        api_url = KYTOS_API + '/of_lldp/v1/interfaces/'
-        response = requests.get(api_url)
+        response = KYTOS.lldp_interfaces()
         data = response.json()
         assert set(data["interfaces"]) == set(expected_interfaces)
 
     def test_020_enable_of_lldp(self):
         """ Test if enabling OF LLDP in an interface works properly. """
         self.net.restart_kytos_clean()
-        time.sleep(5)
+        # of_lldp must know all the 13 interfaces before disabling them
+        wait_until(lambda: len(KYTOS.lldp_interfaces().json()["interfaces"]) == 13,
+                   name='lldp interfaces discovered', timeout=10)
         self.disable_all_of_lldp()
 
         payload = {
@@ -138,29 +120,22 @@ class TestE2EOfLLDP(unittest.TestCase):
                 "00:00:00:00:00:00:00:01:1"
         ]
 
-        api_url = KYTOS_API + '/of_lldp/v1/interfaces/enable/'
-        response = requests.post(api_url, json=payload)
+        response = KYTOS.enable_lldp(payload["interfaces"])
         assert response.status_code == 200
 
-        api_url = KYTOS_API + '/of_lldp/v1/interfaces/'
-        response = requests.get(api_url)
+        response = KYTOS.lldp_interfaces()
         data = response.json()
         assert set(data["interfaces"]) == set(expected_interfaces)
 
         h11 = self.net.net.get('h11')
-        rx_stats_h11 = self.get_iface_stats_rx_pkt(h11)
-        time.sleep(10)
-        rx_stats_h11_2 = self.get_iface_stats_rx_pkt(h11)
-
-        assert rx_stats_h11_2 > rx_stats_h11
+        wait_until(self.rx_pkt_increased(h11), timeout=10)
 
         # restart kytos and check if lldp remains disabled
         self.net.start_controller(clean_config=False)
         self.net.wait_switches_connect()
-        time.sleep(5)
+        wait_until(self.lldp_interfaces_are(expected_interfaces), timeout=10)
 
-        api_url = KYTOS_API + '/of_lldp/v1/interfaces/'
-        response = requests.get(api_url)
+        response = KYTOS.lldp_interfaces()
         data = response.json()
         assert set(data["interfaces"]) == set(expected_interfaces)
 
@@ -168,43 +143,37 @@ class TestE2EOfLLDP(unittest.TestCase):
         """ Test if changing the polling interval works works properly. """
         self.net.restart_kytos_clean()
 
-        api_url = KYTOS_API + '/of_lldp/v1/polling_time'
-        response = requests.get(api_url)
+        response = KYTOS.lldp_polling_time()
         assert response.status_code == 200
         data = response.json()
         assert "polling_time" in data
         assert data["polling_time"] == 3
 
+        # the rate should be around 1/3 pps, because the interface is polled every 3s
         h11 = self.net.net.get('h11')
-        rx_stats_h11 = self.get_iface_stats_rx_pkt(h11)
-        time.sleep(31)
-        rx_stats_h11_2 = self.get_iface_stats_rx_pkt(h11)
-
-        # the delta pps should be around 10, because the interface is every 3s
-        delta_pps = rx_stats_h11_2 - rx_stats_h11
+        sampler = CounterSampler([h11])
+        rate = sampler.measure([h11], precision=0.2, timeout=15)[h11.intfNames()[0]]
 
-        api_url = KYTOS_API + '/of_lldp/v1/polling_time'
-        response = requests.post(api_url, json={"polling_time": 1})
+        response = KYTOS.set_lldp_polling_time(1)
         assert response.status_code == 200
 
-        response = requests.get(api_url)
+        response = KYTOS.lldp_polling_time()
         data = response.json()
         assert data["polling_time"] == 1
 
-        rx_stats_h11 = self.get_iface_stats_rx_pkt(h11)
-        time.sleep(31)
-        rx_stats_h11_2 = self.get_iface_stats_rx_pkt(h11)
-
-        delta_pps_2 = rx_stats_h11_2 - rx_stats_h11
+        # the packet ending the 3s interval already started, then the new one
+        wait_until(self.rx_pkt_increased(h11), timeout=5)
+        rate_2 = sampler.measure([h11], precision=0.2, timeout=15)[h11.intfNames()[0]]
 
-        # the delta pps now should be around 30, because the interval is every 1s
-        assert delta_pps_2 > delta_pps + 15
+        # the rate now should be around 1 pps, because the interval is every 1s
+        assert rate_2['low'] > 2 * rate['high'], (rate, rate_2)
 
         # restart kytos and check if the polling interval remains the same
         self.net.start_controller(clean_config=False)
         self.net.wait_switches_connect()
-        time.sleep(5)
+        wait_until(lambda: KYTOS.lldp_polling_time().status_code == 200,
+                   name='of_lldp api', timeout=10)
 
-        response = requests.get(api_url)
+        response = KYTOS.lldp_polling_time()
         data = response.json()
         assert data["polling_time"] == 1
@@ -0,0 +1,93 @@
+import unittest
+from tests.helpers import (NETWORKS, CONTROLLER, KYTOS, BENCHMARK,
+                           SWITCH_RECONNECTS, wait_until, env_list,
+                           percentiles, process_stats, save_results)
+import os
+import time
+
+# topology generated at each step and the sizes/flows to step through
+SCALE_TOPO = os.environ.get('E2E_SCALE_TOPO', 'ScaleRingTopo')
+SCALE_SWITCHES = env_list('E2E_SCALE_SWITCHES', '10,50,100,200')
+SCALE_FLOWS = env_list('E2E_SCALE_FLOWS', '0,100,1000')
+# 'emulated' runs the switches in tests/ofswitch.py, for thousands of them
+SCALE_BACKEND = os.environ.get('E2E_SCALE_BACKEND', 'mininet')
+REST_SAMPLES = 50
+
+
+@unittest.skipUnless(BENCHMARK, 'set E2E_BENCHMARK=1 to run the benchmarks')
+class TestE2EScaleBenchmark(unittest.TestCase):
+    """ How many switches and flows is kytosd able to handle? """
+    topo_name = SCALE_TOPO
+
+    def rest_latency(self, path):
+        latencies = []
+        for i in range(REST_SAMPLES):
+            start = time.monotonic()
+            response = KYTOS.get(path)
+            latencies.append(time.monotonic() - start)
+            self.assertEqual(response.status_code, 200)
+        return percentiles(latencies)
+
+    def switches_listed(self, dpids):
+        def condition():
+            response = KYTOS.switches()
+            return set(dpids) <= set(response.json()['switches'])
+        condition.__name__ = 'switches listed'
+        return condition
+
+    def install_flows(self, net, dpids, flows_per_switch):
+        """Push `flows_per_switch` flows to each switch through flow_manager."""
+        flows = [{"priority": 1000,
+                  "match": {"in_port": 1, "dl_vlan": 1 + i % 4094, "dl_src": "00:00:00:00:%02x:%02x" % (i // 256 % 256, i % 256)},
+                  "actions": [{"action_type": "output", "port": 2}]}
+                 for i in range(flows_per_switch)]
+        start = time.monotonic()
+        for dpid in dpids:
+            response = KYTOS.install_flows(dpid, flows)
+            self.assertIn(response.status_code, (200, 202))
+        posted = time.monotonic() - start
+        def installed():
+            # the flows of this step only, not the of_lldp one
+            return all(table.count(in_port=1) >= flows_per_switch for table in net.dump_flows())
+        installed.__name__ = 'flows installed'
+        wait_until(installed, timeout=60 + flows_per_switch / 10.0)
+        return {'post': posted, 'installed': time.monotonic() - start}
+
+    def test_010_switches_and_flows_curve(self):
+        curve = []
+        for switches in SCALE_SWITCHES:
+            net = NETWORKS.get(CONTROLLER, SCALE_TOPO, backend=SCALE_BACKEND,
+                               switches=switches, hosts_per_switch=0)
+            dpids = net.topo.dpids()
+            net.start_controller(clean_config=True, enable_all=True)
+            net.wait_switches_connect()
+            point = {
+                'topology': SCALE_TOPO,
+                'backend': SCALE_BACKEND,
+                'switches': len(dpids),
+                'links': len(net.topo.switch_links),
+                'connect_all': SWITCH_RECONNECTS[-1]['last'],
+            }
+            wait_until(self.switches_listed(dpids), timeout=60 + len(dpids))
+            point['listed_all'] = time.monotonic() - net.launched_at
+            point['idle'] = process_stats(net.controller_pid)
+
+            point['flows'] = []
+            for flows_per_switch in SCALE_FLOWS:
+                before = process_stats(net.controller_pid)
+                start = time.monotonic()
+                step = {'flows_per_switch': flows_per_switch,
+                        'total_flows': flows_per_switch * len(dpids)}
+                if flows_per_switch:
+                    step.update(self.install_flows(net, dpids, flows_per_switch))
+                step['rest'] = {path: self.rest_latency(path) for path in
+                                ('/core/status/', '/topology/v3/switches',
+                                 '/topology/v3/links')}
+                after = process_stats(net.controller_pid)
+                step['rss'] = after['rss']
+                step['cpu_percent'] = 100 * (after['cpu'] - before['cpu']) / (time.monotonic() - start)
+                point['flows'].append(step)
+
+            curve.append(point)
+            # keep what was measured so far if a bigger step breaks
+            save_results('scale_benchmark', curve)
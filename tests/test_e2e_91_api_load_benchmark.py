@@ -0,0 +1,67 @@
+import unittest
+from tests.helpers import (NETWORKS, CONTROLLER, KYTOS_API, BENCHMARK, env_list,
+                           process_stats, save_results)
+from tests.loadgen import LoadGenerator
+
+# clients of the closed loop runs and requests per second of the open loop ones
+LOAD_CONCURRENCY = env_list('E2E_LOAD_CONCURRENCY', '1,4,16,64,256')
+LOAD_RATES = env_list('E2E_LOAD_RATES', '25,50,100,200,400,800,1600')
+LOAD_DURATION = env_list('E2E_LOAD_DURATION', '20')[0]
+# the API is degraded once the p99 latency goes beyond this many milliseconds
+LOAD_P99_MS = env_list('E2E_LOAD_P99_MS', '100')[0]
+
+
+def summarize(result, pid):
+    return {
+        'mode': result.mode,
+        'level': result.level,
+        'elapsed': result.elapsed,
+        'completed': result.completed,
+        'throughput': result.throughput,
+        'errors': result.errors,
+        'statuses': {str(status): count for status, count in result.statuses.items()},
+        'max_lag': result.max_lag,
+        'latency': result.latency().to_dict(),
+        'endpoints': {endpoint: histogram.summary()
+                      for endpoint, histogram in result.latencies.items()},
+        'kytosd': process_stats(pid),
+    }
+
+
+@unittest.skipUnless(BENCHMARK, 'set E2E_BENCHMARK=1 to run the benchmarks')
+class TestE2EApiLoadBenchmark(unittest.TestCase):
+    """ At which request rate does the latency of the REST API degrade? """
+    net = None
+    topo_name = 'RingTopo'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.net = NETWORKS.get(CONTROLLER, cls.topo_name)
+        cls.net.start_controller(clean_config=True, enable_all=True)
+        cls.net.wait_switches_connect()
+        cls.generator = LoadGenerator(KYTOS_API)
+        cls.results = {'closed': [], 'open': [], 'p99_limit': LOAD_P99_MS / 1000.0}
+
+    @classmethod
+    def tearDownClass(cls):
+        save_results('api_load_benchmark', cls.results)
+
+    def test_010_closed_loop_concurrency(self):
+        for concurrency in LOAD_CONCURRENCY:
+            result = self.generator.closed_loop(concurrency, LOAD_DURATION)
+            self.results['closed'].append(summarize(result, self.net.controller_pid))
+            save_results('api_load_benchmark', self.results)
+
+    def test_020_open_loop_rates(self):
+        # latencies are taken from when each request was due, so they keep
+        # growing once the offered rate is beyond what kytosd sustains
+        self.results['saturation_rate'] = None
+        for rate in LOAD_RATES:
+            result = self.generator.open_loop(rate, LOAD_DURATION)
+            point = summarize(result, self.net.controller_pid)
+            self.results['open'].append(point)
+            save_results('api_load_benchmark', self.results)
+            if (point['latency']['summary'].get('p99', float('inf')) > self.results['p99_limit'] or
+                    point['throughput'] < 0.9 * rate):
+                self.results['saturation_rate'] = rate
+                break
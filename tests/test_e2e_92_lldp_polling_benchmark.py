@@ -0,0 +1,116 @@
+import unittest
+from tests.helpers import (NETWORKS, CONTROLLER, KYTOS, BENCHMARK, dpid_str,
+                           links_count, wait_until, env_list, percentiles,
+                           process_stats, save_results)
+import os
+import time
+
+# topology generated at each step, its sizes and the polling times swept
+LLDP_TOPO = os.environ.get('E2E_LLDP_TOPO', 'ScaleRingTopo')
+LLDP_SWITCHES = env_list('E2E_LLDP_SWITCHES', '10,50,100')
+LLDP_POLLING = env_list('E2E_LLDP_POLLING', '1,3,5,10')
+# polling intervals the packet rates are measured over
+LLDP_WINDOW = env_list('E2E_LLDP_WINDOW', '3')[0]
+# link failures and recoveries timed at each polling time
+LLDP_REPEAT = env_list('E2E_LLDP_REPEAT', '3')[0]
+
+
+def packet_in_counts(snapshot):
+    """Packets sent to the controller by the flows of `snapshot`: LLDP
+    and all of them."""
+    lldp = total = 0
+    for table in snapshot:
+        for entry in table:
+            if any(action.upper().startswith('CONTROLLER') for action in entry.actions):
+                packets = int(entry.stats.get('n_packets', 0))
+                total += packets
+                if entry.match.get('dl_type') == 0x88cc:
+                    lldp += packets
+    return {'lldp': lldp, 'total': total}
+
+
+@unittest.skipUnless(BENCHMARK, 'set E2E_BENCHMARK=1 to run the benchmarks')
+class TestE2ELLDPPollingBenchmark(unittest.TestCase):
+    """ What does a shorter LLDP polling_time cost, and what does it buy? """
+    topo_name = LLDP_TOPO
+
+    def enable_topology(self, net):
+        for dpid in net.topo.dpids():
+            self.assertEqual(KYTOS.enable_switch(dpid).status_code, 201)
+            self.assertEqual(KYTOS.enable_switch_interfaces(dpid).status_code, 200)
+        wait_until(links_count(KYTOS, len(net.topo.switch_links)),
+                   timeout=60 + len(net.topo.switch_links))
+
+    def link_id(self, net, switch_a, switch_b):
+        dpids = set(dpid_str(net.net.get(name).dpid) for name in (switch_a, switch_b))
+        for link_id, link in KYTOS.links().json()['links'].items():
+            ends = set(link[end]['id'].rsplit(':', 1)[0] for end in ('endpoint_a', 'endpoint_b'))
+            if ends == dpids:
+                return link_id
+        self.fail('no link between %s and %s' % (switch_a, switch_b))
+
+    def link_active(self, link_id, active):
+        def condition():
+            link = KYTOS.links().json()['links'].get(link_id, {})
+            return bool(link.get('active')) == active
+        condition.__name__ = 'link active' if active else 'link inactive'
+        return condition
+
+    def detection_delays(self, net, switch_a, switch_b, polling_time):
+        """Seconds until the link goes inactive once put down, and active
+        once back up."""
+        link_id = self.link_id(net, switch_a, switch_b)
+        timeout = 30 + 3 * polling_time
+        delays = {'failed': [], 'new': []}
+        for _ in range(LLDP_REPEAT):
+            for status, active, kind in (('down', False, 'failed'), ('up', True, 'new')):
+                start = time.monotonic()
+                net.net.configLinkStatus(switch_a, switch_b, status)
+                # poll fast: the delays are about the polling time itself
+                wait_until(self.link_active(link_id, active), timeout=timeout,
+                           interval=0.05, max_interval=0.1)
+                delays[kind].append(time.monotonic() - start)
+        return {kind: percentiles(values) for kind, values in delays.items()}
+
+    def measure_rates(self, net, polling_time):
+        before, stats_before = net.dump_flows(), process_stats(net.controller_pid)
+        time.sleep(LLDP_WINDOW * polling_time)
+        after, stats_after = net.dump_flows(), process_stats(net.controller_pid)
+        elapsed = (after.started + after.finished - before.started - before.finished) / 2
+        counts_before, counts_after = packet_in_counts(before), packet_in_counts(after)
+        return {
+            'window': elapsed,
+            'lldp_pps': (counts_after['lldp'] - counts_before['lldp']) / elapsed,
+            'packet_in_pps': (counts_after['total'] - counts_before['total']) / elapsed,
+            'cpu_percent': 100 * (stats_after['cpu'] - stats_before['cpu']) / elapsed,
+            'rss': stats_after['rss'],
+        }
+
+    def test_010_polling_time_sweep(self):
+        curve = []
+        for switches in LLDP_SWITCHES:
+            net = NETWORKS.get(CONTROLLER, LLDP_TOPO, switches=switches,
+                               hosts_per_switch=0)
+            net.start_controller(clean_config=True, enable_all=True)
+            net.wait_switches_connect()
+            self.enable_topology(net)
+            switch_a, switch_b = net.topo.switch_links[0]
+            point = {
+                'topology': LLDP_TOPO,
+                'switches': len(net.topo.switch_names),
+                'links': len(net.topo.switch_links),
+                'polling': [],
+            }
+            previous = KYTOS.lldp_polling_time().json()['polling_time']
+            for polling_time in LLDP_POLLING:
+                self.assertEqual(KYTOS.set_lldp_polling_time(polling_time).status_code, 200)
+                # of_lldp only picks the new value once its current wait is over
+                time.sleep(previous)
+                previous = polling_time
+                step = {'polling_time': polling_time}
+                step.update(self.measure_rates(net, polling_time))
+                step['detection'] = self.detection_delays(net, switch_a, switch_b,
+                                                          polling_time)
+                point['polling'].append(step)
+                save_results('lldp_polling_benchmark', curve + [point])
+            curve.append(point)
@@ -0,0 +1,107 @@
+import unittest
+from tests.helpers import (NETWORKS, CONTROLLER, KYTOS, BENCHMARK, SWITCH_RECONNECTS,
+                           env_list, percentiles, save_results)
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+
+# topologies generated, with each of the sizes; their diameters differ
+DISCOVERY_TOPOS = [name.strip() for name in os.environ.get(
+    'E2E_DISCOVERY_TOPOS', 'ScaleLinearTopo,ScaleRingTopo,ScaleRandomTopo').split(',')
+                   if name.strip()]
+DISCOVERY_SWITCHES = env_list('E2E_DISCOVERY_SWITCHES', '10,50,100')
+# seconds between two reads of /topology/v3/links, i.e. the resolution
+DISCOVERY_POLL = 0.1
+
+
+@unittest.skipUnless(BENCHMARK, 'set E2E_BENCHMARK=1 to run the benchmarks')
+class TestE2EDiscoveryBenchmark(unittest.TestCase):
+    """ How long does topology take to discover every link? """
+    topo_name = DISCOVERY_TOPOS[0]
+
+    def watch_links(self, expected, since, timeout, busy=lambda: False):
+        """Read the links until the `expected` ones (interface pairs) are
+        listed active and `busy` is over; returns when each of them was
+        first listed active, from `since`."""
+        first_seen = {}
+        deadline = time.monotonic() + timeout
+        while len(first_seen) < len(expected) or busy():
+            try:
+                links = KYTOS.links().json()['links']
+            except ValueError:
+                links = {}
+            now = time.monotonic()
+            for link in links.values():
+                # links restored from storage are listed before LLDP sees them
+                if not link.get('active'):
+                    continue
+                ends = frozenset(link[end]['id'] for end in ('endpoint_a', 'endpoint_b'))
+                if ends in expected:
+                    first_seen.setdefault(ends, now - since)
+            if now >= deadline:
+                break
+            time.sleep(DISCOVERY_POLL)
+        return first_seen
+
+    def summarize(self, first_seen, expected):
+        times = sorted(first_seen.values())
+        return {
+            'discovered': len(times),
+            'first': times[0] if times else None,
+            'all': times[-1] if len(times) == len(expected) else None,
+            'links': percentiles(times),
+            # links listed by the time since the start, for the curves
+            'timeline': times,
+        }
+
+    def enable_all(self, dpids):
+        def enable(dpid):
+            self.assertEqual(KYTOS.enable_switch(dpid).status_code, 201)
+            self.assertEqual(KYTOS.enable_switch_interfaces(dpid).status_code, 200)
+            return time.monotonic()
+        executor = ThreadPoolExecutor(max_workers=8)
+        return executor, [executor.submit(enable, dpid) for dpid in dpids]
+
+    def test_010_discovery_convergence(self):
+        curve = []
+        for topo_name in DISCOVERY_TOPOS:
+            for switches in DISCOVERY_SWITCHES:
+                net = NETWORKS.get(CONTROLLER, topo_name, switches=switches,
+                                   hosts_per_switch=0)
+                # without -E: the timed enabling below starts the discovery
+                net.start_controller(clean_config=True)
+                net.wait_switches_connect()
+                dpids = net.topo.dpids()
+                expected = net.topo.interface_pairs()
+                timeout = 60 + len(expected)
+                point = {
+                    'topology': topo_name,
+                    'switches': len(dpids),
+                    'links': len(expected),
+                    'diameter': net.topo.diameter(),
+                }
+
+                # from a fresh controller: enable every switch and interface
+                start = time.monotonic()
+                executor, futures = self.enable_all(dpids)
+                first_seen = self.watch_links(
+                    expected, start, timeout,
+                    busy=lambda: not all(future.done() for future in futures))
+                executor.shutdown()
+                point['enable'] = max(future.result() for future in futures) - start
+                point['enabled'] = self.summarize(first_seen, expected)
+
+                # from a restart: the switches are still enabled, from the
+                # storehouse, and the links discovered again; the API only
+                # answers once kytosd is ready, so links listed by then are
+                # counted at that time
+                net.start_controller(clean_config=False)
+                first_seen = self.watch_links(expected, net.launched_at, timeout)
+                point['restarted'] = self.summarize(first_seen, expected)
+                net.wait_switches_connect()
+                point['restarted']['switches_connected'] = SWITCH_RECONNECTS[-1]['last']
+
+                curve.append(point)
+                save_results('discovery_benchmark', curve)
+                self.assertEqual(point['enabled']['discovered'], len(expected))
+                self.assertEqual(point['restarted']['discovered'], len(expected))
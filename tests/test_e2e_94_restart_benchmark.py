@@ -0,0 +1,131 @@
+import unittest
+from tests.helpers import (NETWORKS, CONTROLLER, KYTOS, BENCHMARK, CONTROLLER_RESTARTS,
+                           links_count, wait_until, env_list, save_results)
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import time
+
+TIME_FMT = "%Y-%m-%dT%H:%M:%S+0000"
+
+# switches of the linear topology (M) and EVCs (N) of each step
+RESTART_SWITCHES = env_list('E2E_RESTART_SWITCHES', '10,50')
+RESTART_EVCS = env_list('E2E_RESTART_EVCS', '0,100,500')
+# maintenance windows scheduled, far enough in the future not to start
+RESTART_WINDOWS = env_list('E2E_RESTART_WINDOWS', '10')[0]
+RESTART_CONCURRENCY = 8
+
+
+@unittest.skipUnless(BENCHMARK, 'set E2E_BENCHMARK=1 to run the benchmarks')
+class TestE2ERestartBenchmark(unittest.TestCase):
+    """ How long does kytosd take to restore its persisted state? """
+    topo_name = 'ScaleLinearTopo'
+
+    def load_state(self, net, evcs, windows):
+        """Enable every switch, interface and link, then create `evcs` EVCs
+        between the first and the last switch and `windows` maintenance
+        windows; returns what kytosd should list after a restart."""
+        dpids = net.topo.dpids()
+        for dpid in dpids:
+            self.assertEqual(KYTOS.enable_switch(dpid).status_code, 201)
+            self.assertEqual(KYTOS.enable_switch_interfaces(dpid).status_code, 200)
+        wait_until(links_count(KYTOS, len(net.topo.switch_links)),
+                   timeout=60 + len(net.topo.switch_links))
+        links = list(KYTOS.links().json()['links'])
+        for link_id in links:
+            self.assertEqual(KYTOS.enable_link(link_id).status_code, 201)
+
+        def create(vlan):
+            response = KYTOS.create_evc({
+                "name": "evc%d" % (vlan),
+                "enabled": True,
+                "dynamic_backup_path": True,
+                "uni_a": {"interface_id": "%s:1" % (dpids[0]),
+                          "tag": {"tag_type": 1, "value": vlan}},
+                "uni_z": {"interface_id": "%s:1" % (dpids[-1]),
+                          "tag": {"tag_type": 1, "value": vlan}},
+            })
+            self.assertEqual(response.status_code, 201)
+            return response.json()['circuit_id']
+        with ThreadPoolExecutor(max_workers=RESTART_CONCURRENCY) as executor:
+            circuits = list(executor.map(create, range(1, evcs + 1)))
+
+        start = int(time.time()) + 86400
+        for i in range(windows):
+            response = KYTOS.create_maintenance({
+                "description": "restart benchmark %d" % (i),
+                "start": datetime.utcfromtimestamp(start + 3600 * i).strftime(TIME_FMT),
+                "end": datetime.utcfromtimestamp(start + 3600 * i + 60).strftime(TIME_FMT),
+                "items": [dpids[i % len(dpids)]]
+            })
+            self.assertEqual(response.status_code, 201)
+        return {'switches': set(dpids), 'links': set(links), 'evcs': set(circuits),
+                'windows': len(KYTOS.maintenances().json())}
+
+    def restored(self, expected):
+        """Conditions telling, by name, whether each part of the state is
+        listed again."""
+        def switches():
+            listed = KYTOS.switches().json()['switches']
+            return all(listed.get(dpid, {}).get('enabled') for dpid in expected['switches'])
+
+        def links():
+            listed = KYTOS.links().json()['links']
+            return all(listed.get(link_id, {}).get('enabled') for link_id in expected['links'])
+
+        def evcs():
+            return expected['evcs'] <= set(KYTOS.evcs().json())
+
+        def evcs_active():
+            listed = KYTOS.evcs().json()
+            return all(listed.get(circuit, {}).get('active') for circuit in expected['evcs'])
+
+        def windows():
+            return len(KYTOS.maintenances().json()) >= expected['windows']
+        return {condition.__name__: condition
+                for condition in (switches, links, evcs, evcs_active, windows)}
+
+    def watch_restore(self, conditions, since, timeout, interval=0.1):
+        """Seconds from `since` until each of the `conditions` was met."""
+        met = {}
+        deadline = time.monotonic() + timeout
+        while len(met) < len(conditions) and time.monotonic() < deadline:
+            for name, condition in conditions.items():
+                if name not in met:
+                    try:
+                        if condition():
+                            met[name] = time.monotonic() - since
+                    except ValueError:
+                        pass
+            time.sleep(interval)
+        return met
+
+    def test_010_restart_to_ready(self):
+        curve = []
+        for switches in RESTART_SWITCHES:
+            for evcs in RESTART_EVCS:
+                net = NETWORKS.get(CONTROLLER, self.topo_name, switches=switches)
+                # without -E, everything enabled comes from load_state()
+                net.start_controller(clean_config=True)
+                net.wait_switches_connect()
+                expected = self.load_state(net, evcs, RESTART_WINDOWS)
+
+                # and after the restart from the storehouse only
+                net.start_controller(clean_config=False)
+                restart = CONTROLLER_RESTARTS[-1]
+                conditions = self.restored(expected)
+                met = self.watch_restore(conditions, net.launched_at, timeout=120 + evcs)
+                net.wait_switches_connect()
+                point = {
+                    'switches': switches,
+                    'links': len(expected['links']),
+                    'evcs': evcs,
+                    'windows': expected['windows'],
+                    'stop': restart['stop'],
+                    # /core/status/ running with every napp loaded
+                    'status': restart['spawn'] + restart['ready'],
+                    'restored': met,
+                    'full': max(met.values()) if len(met) == len(conditions) else None,
+                }
+                curve.append(point)
+                save_results('restart_benchmark', curve)
+                self.assertEqual(set(met), set(conditions))
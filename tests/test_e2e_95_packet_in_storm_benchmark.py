@@ -0,0 +1,117 @@
+import unittest
+from tests.helpers import (NETWORKS, CONTROLLER, KYTOS, KYTOS_API, BENCHMARK,
+                           WaitTimeout, links_count, wait_until, env_list, percentiles,
+                           process_stats, save_results)
+from tests.loadgen import LoadGenerator
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+
+# emulated topology, its sizes and the packet-in rates stepped through
+STORM_TOPO = os.environ.get('E2E_STORM_TOPO', 'ScaleRingTopo')
+STORM_SWITCHES = env_list('E2E_STORM_SWITCHES', '10,100')
+STORM_RATES = env_list('E2E_STORM_RATES', '100,200,500,1000,2000,5000,10000,20000')
+STORM_DURATION = env_list('E2E_STORM_DURATION', '10')[0]
+# REST requests per second sent during each storm
+STORM_API_RATE = env_list('E2E_STORM_API_RATE', '10')[0]
+# kytosd fell behind once the echo p99 goes beyond this many milliseconds
+STORM_P99_MS = env_list('E2E_STORM_P99_MS', '100')[0]
+
+
+@unittest.skipUnless(BENCHMARK, 'set E2E_BENCHMARK=1 to run the benchmarks')
+class TestE2EPacketInStormBenchmark(unittest.TestCase):
+    """ At which packet-in rate does kytosd fall behind? """
+    topo_name = STORM_TOPO
+
+    def link_id(self, net, switch_a, switch_b):
+        dpids = set(net.topo.dpids()[net.topo.switch_names.index(name)]
+                    for name in (switch_a, switch_b))
+        for link_id, link in KYTOS.links().json()['links'].items():
+            ends = set(link[end]['id'].rsplit(':', 1)[0] for end in ('endpoint_a', 'endpoint_b'))
+            if ends == dpids:
+                return link_id
+        self.fail('no link between %s and %s' % (switch_a, switch_b))
+
+    def discovery_delay(self, net, switch_a, switch_b, link_id, timeout):
+        """Seconds from a link coming back up to topology listing it
+        active again, or None if it did not within `timeout`."""
+        def active():
+            return KYTOS.links().json()['links'].get(link_id, {}).get('active')
+        start = time.monotonic()
+        net.set_link(switch_a, switch_b, True)
+        try:
+            wait_until(active, timeout=timeout, name='link active',
+                       interval=0.05, max_interval=0.1)
+        except WaitTimeout:
+            return None
+        return time.monotonic() - start
+
+    def storm(self, net, rate, link):
+        """Run one storm with REST requests and a link recovery during it."""
+        switch_a, switch_b, link_id = link
+        net.set_link(switch_a, switch_b, False)
+        wait_until(lambda: not KYTOS.links().json()['links'][link_id].get('active'),
+                   timeout=60, name='link inactive')
+        stats_before = process_stats(net.controller_pid)
+        storm = net.fleet.storm(rate, STORM_DURATION, drain_timeout=60 + STORM_DURATION)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            discovery = executor.submit(self.discovery_delay, net, switch_a, switch_b,
+                                        link_id, STORM_DURATION)
+            api = self.generator.open_loop(STORM_API_RATE, STORM_DURATION, connections=4)
+            delay = discovery.result()
+        storm = storm.result(120 + STORM_DURATION)
+        stats_after = process_stats(net.controller_pid)
+        # the discovery may still be pending at the end of the storm
+        net.restore_links()
+        return {
+            'rate': rate,
+            'sent': storm.sent,
+            'offered_rate': storm.sent / (storm.finished - storm.started),
+            'generator_lag': storm.max_lag,
+            'handled_rate': storm.handled_rate,
+            'drain': storm.drained - storm.finished if storm.drained else None,
+            'echo': percentiles(storm.echo_rtts),
+            # bytes kytosd had not read yet from a switch
+            'max_backlog': storm.max_backlog,
+            'lldp_discovery': delay,
+            'api': api.latency().to_dict(),
+            'api_errors': api.errors,
+            'cpu_percent': 100 * (stats_after['cpu'] - stats_before['cpu']) /
+                           ((storm.drained or time.monotonic()) - storm.started),
+            'rss': stats_after['rss'],
+        }
+
+    def fell_behind(self, step):
+        return (step['handled_rate'] is None or step['handled_rate'] < 0.9 * step['rate'] or
+                step['echo'].get('p99', float('inf')) > STORM_P99_MS / 1000.0)
+
+    def test_010_packet_in_rates(self):
+        self.generator = LoadGenerator(KYTOS_API)
+        curve = []
+        for switches in STORM_SWITCHES:
+            net = NETWORKS.get(CONTROLLER, STORM_TOPO, backend='emulated',
+                               switches=switches, hosts_per_switch=1)
+            net.start_controller(clean_config=True, enable_all=True)
+            net.wait_switches_connect()
+            wait_until(links_count(KYTOS, len(net.topo.switch_links)),
+                       timeout=60 + len(net.topo.switch_links))
+            switch_a, switch_b = net.topo.switch_links[0]
+            link = (switch_a, switch_b, self.link_id(net, switch_a, switch_b))
+            point = {
+                'topology': STORM_TOPO,
+                'switches': switches,
+                'links': len(net.topo.switch_links),
+                'p99_limit': STORM_P99_MS / 1000.0,
+                'behind_rate': None,
+                'steps': [],
+            }
+            for rate in STORM_RATES:
+                step = self.storm(net, rate, link)
+                point['steps'].append(step)
+                save_results('packet_in_storm_benchmark', curve + [point])
+                # beyond it, the backlog only grows
+                if self.fell_behind(step):
+                    point['behind_rate'] = rate
+                    break
+            curve.append(point)
+            save_results('packet_in_storm_benchmark', curve)